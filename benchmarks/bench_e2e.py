@@ -0,0 +1,338 @@
+"""
+End-to-end labeling throughput benchmark against a mock LM Studio server.
+
+Generates a synthetic image corpus, starts ``benchmarks.mock_server`` with
+the requested latency distribution, parallel slots and error rate, and
+drives each entry point over the corpus:
+
+- ``engine``: ``engine.label_images`` in-process
+- ``api``: concurrent uploads to the FastAPI app's ``/label-image/``
+- ``cli``: ``src/main.py`` (labeling, then splitting and copying)
+
+Every driver runs in its own subprocess, so the reported peak RSS belongs
+to that driver alone. Results include images/sec, p50/p99 request latency
+measured at the server (and at the client for the API) and peak memory.
+
+Usage:
+    python -m benchmarks.bench_e2e --images 200 --slots 4 \\
+        --latency lognormal:0.3:0.4 --output bench_results.jsonl
+"""
+
+import argparse
+import asyncio
+import importlib
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from PIL import Image
+
+from benchmarks.bench_encode import _peak_rss
+from benchmarks.mock_server import MockServer
+
+DRIVERS = ("engine", "api", "cli")
+# Imported before the clock starts, so import time is not measured
+DRIVER_MODULES = {"engine": "src.engine", "api": "src.api", "cli": "src.main"}
+
+
+def make_corpus(
+    directory: str, count: int, width: int, height: int, seed: int = 0
+) -> List[str]:
+    """
+    Write ``count`` distinct photo-like JPEGs of the given size.
+
+    Args:
+        directory (str): Target directory.
+        count (int): Number of images.
+        width (int): Image width.
+        height (int): Image height.
+        seed (int): Seed of the image content.
+
+    Returns:
+        List[str]: Paths of the written images.
+    """
+    rng = np.random.default_rng(seed)
+    paths = []
+    for i in range(count):
+        # Upscaled noise compresses like a real photo, see bench_encode
+        small = rng.integers(
+            0, 256, size=(max(height // 16, 1), max(width // 16, 1), 3)
+        ).astype(np.uint8)
+        image = Image.fromarray(small).resize(
+            (width, height), Image.Resampling.BICUBIC
+        )
+        path = os.path.join(directory, f"img_{i:06d}.jpg")
+        image.save(path, format="JPEG", quality=90)
+        paths.append(path)
+    return paths
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """
+    Exact percentile (nearest rank) of a list of values.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = math.ceil(q / 100 * len(ordered))
+    return ordered[min(max(rank, 1), len(ordered)) - 1]
+
+
+def _count_errors(results: List[Dict[str, Any]]) -> int:
+    return sum(result.get("label") == "error" for result in results)
+
+
+def drive_engine(corpus: str, concurrency: int) -> Dict[str, Any]:
+    """
+    Label the corpus with ``engine.label_images``.
+    """
+    from src.data_loader import get_image_files
+    from src.engine import label_images
+
+    files = get_image_files(corpus)
+    results = [
+        result
+        for _, _, result in label_images(files, max_in_flight=concurrency)
+    ]
+    return {"images": len(files), "errors": _count_errors(results)}
+
+
+def drive_api(corpus: str, concurrency: int) -> Dict[str, Any]:
+    """
+    Upload the corpus to ``/label-image/`` with bounded concurrency.
+    """
+    import httpx
+
+    from src.api import app
+    from src.data_loader import get_image_files
+
+    files = get_image_files(corpus)
+    latencies = []
+
+    async def run():
+        semaphore = asyncio.Semaphore(concurrency)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench", timeout=None
+        ) as client:
+
+            async def upload(path):
+                async with semaphore:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                    start = time.perf_counter()
+                    response = await client.post(
+                        "/label-image/",
+                        files={"file": (os.path.basename(path), data)},
+                    )
+                    latencies.append(time.perf_counter() - start)
+                    response.raise_for_status()
+                    return response.json()
+
+            return await asyncio.gather(*(upload(path) for path in files))
+
+    results = asyncio.run(run())
+    return {
+        "images": len(files),
+        "errors": _count_errors(results),
+        "client_latency_p50_ms": 1000 * percentile(latencies, 50),
+        "client_latency_p99_ms": 1000 * percentile(latencies, 99),
+    }
+
+
+def drive_cli(corpus: str, concurrency: int) -> Dict[str, Any]:
+    """
+    Run ``src/main.py`` on the corpus, including the dataset split.
+    """
+    from src import main as cli
+
+    with tempfile.TemporaryDirectory() as output:
+        sys.argv = [
+            "main.py",
+            "--path",
+            corpus,
+            "--output",
+            output,
+            "--concurrency",
+            str(concurrency),
+        ]
+        # Keep the driver's stdout for the JSON result
+        stdout = sys.stdout
+        sys.stdout = sys.stderr
+        try:
+            cli.main()
+        finally:
+            sys.stdout = stdout
+        with open(os.path.join(output, "labels.json")) as f:
+            results = json.load(f)
+    return {"images": len(results), "errors": _count_errors(results)}
+
+
+def run_driver(driver: str, corpus: str, concurrency: int):
+    """
+    Run one driver in this process and print its result as JSON.
+    """
+    importlib.import_module(DRIVER_MODULES[driver])
+    baseline = _peak_rss()
+    start = time.perf_counter()
+    result = {"cli": drive_cli, "api": drive_api, "engine": drive_engine}[
+        driver
+    ](corpus, concurrency)
+    result["seconds"] = time.perf_counter() - start
+    result["peak_rss_mb"] = _peak_rss() / (1024 * 1024)
+    result["baseline_rss_mb"] = baseline / (1024 * 1024)
+    print(json.dumps(result))
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--images", type=int, default=100)
+    parser.add_argument(
+        "--resolution", default="1920x1080", help="WIDTHxHEIGHT"
+    )
+    parser.add_argument(
+        "--latency",
+        default="lognormal:0.2:0.3",
+        help="fixed:S, uniform:LOW:HIGH, exp:MEAN or lognormal:MEDIAN:SIGMA",
+    )
+    parser.add_argument("--slots", type=int, default=4)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=None,
+        help="Requests in flight (default: --slots)",
+    )
+    parser.add_argument(
+        "--drivers", default=",".join(DRIVERS), help="Comma separated"
+    )
+    parser.add_argument("--json", action="store_true", help="Print JSON")
+    parser.add_argument(
+        "--output", help="Append the results as one JSON line to this file"
+    )
+    parser.add_argument("--driver", choices=DRIVERS, help=argparse.SUPPRESS)
+    parser.add_argument("--corpus", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    concurrency = args.concurrency or args.slots
+
+    if args.driver:
+        run_driver(args.driver, args.corpus, concurrency)
+        return
+
+    drivers = [d for d in args.drivers.split(",") if d]
+    for driver in drivers:
+        if driver not in DRIVERS:
+            parser.error(f"Unknown driver: {driver}")
+    width, height = (int(v) for v in args.resolution.lower().split("x"))
+
+    server = MockServer(
+        latency=args.latency, slots=args.slots, error_rate=args.error_rate
+    )
+    env = dict(os.environ)
+    env.pop("LM_STUDIO_URLS", None)
+    env.update(
+        LM_STUDIO_URL=server.url,
+        LM_STUDIO_MODEL="mock",
+        LM_STUDIO_MAX_IN_FLIGHT=str(concurrency),
+        # Measure the full work for every image
+        LABEL_CACHE_ENABLED="0",
+        THUMBNAIL_CACHE_ENABLED="0",
+    )
+
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as corpus:
+            make_corpus(corpus, args.images, width, height)
+            for driver in drivers:
+                server.reset()
+                output = subprocess.run(
+                    [
+                        sys.executable,
+                        "-m",
+                        "benchmarks.bench_e2e",
+                        "--driver",
+                        driver,
+                        "--corpus",
+                        corpus,
+                        "--concurrency",
+                        str(concurrency),
+                    ],
+                    check=True,
+                    capture_output=True,
+                    text=True,
+                    env=env,
+                ).stdout
+                result = json.loads(output.strip().splitlines()[-1])
+                result["driver"] = driver
+                result["images_per_sec"] = result["images"] / result["seconds"]
+                result["requests"] = server.requests
+                result["server_errors"] = server.errors
+                result["latency_p50_ms"] = 1000 * (
+                    percentile(server.latencies, 50) or 0
+                )
+                result["latency_p99_ms"] = 1000 * (
+                    percentile(server.latencies, 99) or 0
+                )
+                results.append(result)
+    finally:
+        server.close()
+
+    report = {
+        "benchmark": "e2e",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "images": args.images,
+            "resolution": args.resolution,
+            "latency": args.latency,
+            "slots": args.slots,
+            "error_rate": args.error_rate,
+            "concurrency": concurrency,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "a") as f:
+            f.write(json.dumps(report) + "\n")
+    if args.json:
+        print(json.dumps(report, indent=4))
+        return
+
+    print(
+        f"{args.images} images at {args.resolution}, latency "
+        f"{args.latency}, {args.slots} slots, concurrency {concurrency}"
+    )
+    for result in results:
+        print(
+            f"  {result['driver']:>6}: {result['images_per_sec']:7.2f} img/s, "
+            f"p50 {result['latency_p50_ms']:.0f} ms, "
+            f"p99 {result['latency_p99_ms']:.0f} ms, "
+            f"{result['errors']} errors "
+            f"({result['server_errors']} at the server), "
+            f"peak RSS {result['peak_rss_mb']:.0f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Benchmark of the image encoding path used before every labeling request.
+
+Compares the legacy full-decode implementation of ``encode_image`` with the
+current reduced-scale decode on synthetic camera-sized JPEGs. Each variant
+runs in its own subprocess so that the reported peak RSS belongs to that
+variant alone.
+
+Usage:
+    python -m benchmarks.bench_encode --megapixels 24 --repeat 5
+"""
+
+import argparse
+import base64
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+VARIANTS = ("legacy", "current")
+
+
+def legacy_encode(image_path: str, max_size: int) -> str:
+    """
+    The original encode_image implementation: full decode, then resize.
+    """
+    with Image.open(image_path) as img:
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        if max(img.size) > max_size:
+            img.thumbnail((max_size, max_size))
+        buffer = io.BytesIO()
+        img.save(buffer, format="JPEG", quality=85)
+        return base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+
+def make_test_image(path: str, megapixels: float):
+    """
+    Write a noisy 3:2 JPEG of roughly the given size to path.
+    """
+    height = int((megapixels * 1_000_000 / 1.5) ** 0.5)
+    width = int(height * 1.5)
+    # Upscaled noise gives smooth, photo-like content that compresses like
+    # a real camera JPEG instead of incompressible per-pixel noise
+    channels = [
+        Image.effect_noise((width // 16, height // 16), sigma).resize(
+            (width, height), Image.Resampling.BICUBIC
+        )
+        for sigma in (40, 60, 80)
+    ]
+    Image.merge("RGB", channels).save(path, format="JPEG", quality=90)
+
+
+def _peak_rss() -> int:
+    """
+    Peak resident set size of this process in bytes.
+    """
+    # ru_maxrss is reported in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_variant(variant: str, image_path: str, max_size: int, repeat: int):
+    """
+    Time one variant in the current process and print the result as JSON.
+    """
+    if variant == "legacy":
+        encode = legacy_encode
+    else:
+        os.environ.setdefault("LM_STUDIO_MODEL", "benchmark")
+        from src.labeler import encode_image
+
+        def encode(path, size):
+            return encode_image(path, max_size=size, use_cache=False)
+
+    # Imports dominate the baseline; report the growth caused by encoding
+    baseline = _peak_rss()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        encode(image_path, max_size)
+        timings.append(time.perf_counter() - start)
+
+    peak = _peak_rss()
+    print(
+        json.dumps(
+            {
+                "variant": variant,
+                "mean_ms": 1000 * sum(timings) / len(timings),
+                "min_ms": 1000 * min(timings),
+                "peak_rss_mb": peak / (1024 * 1024),
+                "encode_rss_mb": (peak - baseline) / (1024 * 1024),
+            }
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--megapixels", type=float, default=24)
+    parser.add_argument("--max-size", type=int, default=1024)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="Print JSON")
+    parser.add_argument("--variant", choices=VARIANTS, help=argparse.SUPPRESS)
+    parser.add_argument("--image", help=argparse.SUPPRESS)
+    parser.add_argument("--make-image", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.make_image:
+        make_test_image(args.make_image, args.megapixels)
+        return
+    if args.variant:
+        run_variant(args.variant, args.image, args.max_size, args.repeat)
+        return
+
+    def _run(*extra_args):
+        # The peak RSS of a process is inherited by its children, so all
+        # memory hungry work happens in subprocesses of this small process
+        return subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_encode", *extra_args],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        image_path = os.path.join(tmp_dir, "camera.jpg")
+        _run("--make-image", image_path, "--megapixels", str(args.megapixels))
+
+        results = []
+        for variant in VARIANTS:
+            output = _run(
+                "--variant",
+                variant,
+                "--image",
+                image_path,
+                "--max-size",
+                str(args.max_size),
+                "--repeat",
+                str(args.repeat),
+            )
+            results.append(json.loads(output.strip().splitlines()[-1]))
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+        return
+
+    print(f"{args.megapixels} MP JPEG -> max_size {args.max_size}")
+    for result in results:
+        print(
+            f"  {result['variant']:>8}: {result['mean_ms']:8.1f} ms/image "
+            f"(min {result['min_ms']:.1f}), "
+            f"peak RSS {result['peak_rss_mb']:.0f} MB "
+            f"(+{result['encode_rss_mb']:.0f} MB while encoding)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+"""
+Micro-benchmarks of the data loading, splitting and encoding hot paths.
+
+Each case runs on generated datasets of increasing size and records the
+best and mean wall time and the peak Python allocation (``tracemalloc``,
+measured in a separate untimed run). Cases that touch the filesystem are
+capped at ``--max-files`` entries. A case stops growing once the next size
+is expected to exceed ``--budget`` seconds (extrapolated from the growth
+seen so far), so paths that scale badly are reported without stalling the
+run.
+
+Usage:
+    python -m benchmarks.bench_micro --sizes 1000,10000,100000,1000000 \\
+        --output bench_results.jsonl
+"""
+
+import argparse
+import gc
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+os.environ.setdefault("LM_STUDIO_MODEL", "benchmark")
+
+from benchmarks.bench_e2e import _git_commit  # noqa: E402
+from benchmarks.bench_encode import make_test_image  # noqa: E402
+from src.data_loader import (  # noqa: E402
+    get_image_files,
+    load_labels,
+    save_labels,
+)
+from src.labeler import encode_image  # noqa: E402
+from src.splitter import (  # noqa: E402
+    labels_for_files,
+    organize_dataset,
+    split_dataset,
+)
+
+
+def make_labels(paths: List[str], with_paths: bool = True) -> List[Dict]:
+    """
+    Build label entries shaped like the output of ``main.py``.
+    """
+    labels = []
+    for i, path in enumerate(paths):
+        item = {
+            "label": f"class_{i % 20}",
+            "description": "A generated description of the image content.",
+            "tags": ["generated", f"tag_{i % 7}"],
+            "filename": os.path.basename(path),
+        }
+        if with_paths:
+            item["original_path"] = path
+        labels.append(item)
+    return labels
+
+
+def make_files(directory: str, count: int) -> List[str]:
+    """
+    Create ``count`` small image files (content is irrelevant here).
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"img_{i:07d}.jpg")
+        with open(path, "wb") as f:
+            f.write(b"\xff\xd8\xff\xd9")
+        paths.append(path)
+    return paths
+
+
+class Case:
+    """
+    A benchmarked function with a per-size setup.
+
+    ``setup(size, tmp_dir)`` returns the state passed to ``run(state)``;
+    it is called again before every repetition because some cases consume
+    their inputs (e.g. copying into a fresh output directory).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        setup: Callable[[int, str], Any],
+        run: Callable[[Any], Any],
+        uses_files: bool = False,
+    ):
+        self.name = name
+        self.setup = setup
+        self.run = run
+        self.uses_files = uses_files
+
+
+def _fresh(tmp_dir: str, name: str) -> str:
+    path = os.path.join(tmp_dir, name)
+    shutil.rmtree(path, ignore_errors=True)
+    return path
+
+
+def _paths(size: int) -> List[str]:
+    return [f"/data/raw/img_{i:07d}.jpg" for i in range(size)]
+
+
+def _scan_dir(size: int, tmp_dir: str) -> str:
+    directory = _fresh(tmp_dir, "scan")
+    make_files(directory, size)
+    return directory
+
+
+def _labels_file(size: int, tmp_dir: str) -> str:
+    path = os.path.join(tmp_dir, "labels.json")
+    save_labels(make_labels(_paths(size)), path)
+    return path
+
+
+def _organize_state(size: int, tmp_dir: str, labels: Optional[str]):
+    source = os.path.join(tmp_dir, "source")
+    files = sorted(get_image_files(source)) if os.path.isdir(source) else []
+    if len(files) != size:
+        shutil.rmtree(source, ignore_errors=True)
+        files = make_files(source, size)
+    train, test = split_dataset(files, 0.8)
+    labeled_data = None
+    if labels is not None:
+        labeled_data = make_labels(files, with_paths=labels == "paths")
+    return train, test, _fresh(tmp_dir, "output"), labeled_data
+
+
+CASES = [
+    Case("get_image_files", _scan_dir, get_image_files, uses_files=True),
+    Case(
+        "save_labels",
+        lambda size, tmp: (
+            make_labels(_paths(size)),
+            os.path.join(tmp, "labels.json"),
+        ),
+        lambda state: save_labels(*state),
+    ),
+    Case("load_labels", _labels_file, load_labels),
+    Case(
+        "split_dataset",
+        lambda size, tmp: _paths(size),
+        lambda files: split_dataset(files, 0.8),
+    ),
+    Case(
+        "split_dataset_stratified",
+        lambda size, tmp: (
+            _paths(size),
+            [item["label"] for item in make_labels(_paths(size))],
+        ),
+        lambda state: split_dataset(state[0], 0.8, labels=state[1], seed=0),
+    ),
+    Case(
+        "labels_for_files",
+        lambda size, tmp: (_paths(size), make_labels(_paths(size))),
+        lambda state: labels_for_files(*state),
+    ),
+    Case(
+        "organize_dataset",
+        lambda size, tmp: _organize_state(size, tmp, None),
+        lambda state: organize_dataset(*state),
+        uses_files=True,
+    ),
+    Case(
+        "organize_dataset_labels",
+        lambda size, tmp: _organize_state(size, tmp, "paths"),
+        lambda state: organize_dataset(*state),
+        uses_files=True,
+    ),
+    Case(
+        # Labels without original_path fall back to matching by filename
+        "organize_dataset_filename_labels",
+        lambda size, tmp: _organize_state(size, tmp, "filenames"),
+        lambda state: organize_dataset(*state),
+        uses_files=True,
+    ),
+]
+
+
+def measure(
+    case: Case, size: int, tmp_dir: str, repeat: int
+) -> Dict[str, Any]:
+    """
+    Time one case at one size and measure its peak allocation.
+    """
+    timings = []
+    for _ in range(repeat):
+        state = case.setup(size, tmp_dir)
+        gc.collect()
+        start = time.perf_counter()
+        case.run(state)
+        timings.append(time.perf_counter() - start)
+        del state
+
+    state = case.setup(size, tmp_dir)
+    gc.collect()
+    tracemalloc.start()
+    case.run(state)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "case": case.name,
+        "size": size,
+        "best_s": min(timings),
+        "mean_s": sum(timings) / len(timings),
+        "peak_alloc_mb": peak / (1024 * 1024),
+    }
+
+
+def measure_encode(
+    tmp_dir: str, megapixels: List[float], repeat: int
+) -> List[Dict[str, Any]]:
+    """
+    Time ``encode_image`` (without the thumbnail cache) per image size.
+    """
+    results = []
+    for mp in megapixels:
+        path = os.path.join(tmp_dir, f"encode_{mp}.jpg")
+        make_test_image(path, mp)
+        case = Case(
+            "encode_image",
+            lambda size, tmp: path,
+            lambda p: encode_image(p, max_size=1024, use_cache=False),
+        )
+        result = measure(case, 1, tmp_dir, repeat)
+        del result["size"]
+        result["megapixels"] = mp
+        results.append(result)
+    return results
+
+
+def _extrapolate(measured: List[Dict[str, Any]], size: int) -> float:
+    """
+    Estimate the time of a case at a larger size.
+
+    Uses the growth exponent between the last two sizes (at least linear),
+    or assumes quadratic growth when only one size was measured.
+    """
+    last = measured[-1]
+    exponent = 2.0
+    if len(measured) > 1:
+        first = measured[-2]
+        if first["best_s"] > 0 and last["best_s"] > 0:
+            exponent = max(
+                math.log(last["best_s"] / first["best_s"])
+                / math.log(last["size"] / first["size"]),
+                1.0,
+            )
+    return last["best_s"] * (size / last["size"]) ** exponent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--sizes",
+        default="1000,10000,100000,1000000",
+        help="Comma separated dataset sizes",
+    )
+    parser.add_argument(
+        "--max-files",
+        type=int,
+        default=100_000,
+        help="Largest size for cases that create files (default: 100000)",
+    )
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=60.0,
+        help="Skip sizes expected to take longer than this (seconds)",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--cases", default=None, help="Comma separated case names"
+    )
+    parser.add_argument(
+        "--encode-megapixels",
+        default="1,12,24",
+        help="Image sizes for encode_image, empty to skip",
+    )
+    parser.add_argument("--json", action="store_true", help="Print JSON")
+    parser.add_argument(
+        "--output", help="Append the results as one JSON line to this file"
+    )
+    args = parser.parse_args()
+
+    sizes = sorted(int(size) for size in args.sizes.split(","))
+    selected = set(args.cases.split(",")) if args.cases else None
+    random.seed(0)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for case in CASES:
+            if selected is not None and case.name not in selected:
+                continue
+            measured = []
+            for size in sizes:
+                if case.uses_files and size > args.max_files:
+                    break
+                if measured:
+                    expected = _extrapolate(measured, size)
+                    if expected > args.budget:
+                        results.append(
+                            {"case": case.name, "size": size, "skipped": True}
+                        )
+                        break
+                previous = measure(case, size, tmp_dir, args.repeat)
+                measured.append(previous)
+                results.append(previous)
+                if not args.json:
+                    print(
+                        f"{case.name:>34} n={size:<8} "
+                        f"{previous['best_s'] * 1000:10.1f} ms  "
+                        f"peak alloc {previous['peak_alloc_mb']:8.1f} MB",
+                        flush=True,
+                    )
+
+        megapixels = [
+            float(mp) for mp in args.encode_megapixels.split(",") if mp
+        ]
+        if megapixels and (selected is None or "encode_image" in selected):
+            for result in measure_encode(tmp_dir, megapixels, args.repeat):
+                results.append(result)
+                if not args.json:
+                    print(
+                        f"{'encode_image':>34} {result['megapixels']:>5} MP "
+                        f"{result['best_s'] * 1000:12.1f} ms  "
+                        f"peak alloc {result['peak_alloc_mb']:8.1f} MB"
+                    )
+
+    report = {
+        "benchmark": "micro",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "a") as f:
+            f.write(json.dumps(report) + "\n")
+    if args.json:
+        print(json.dumps(report, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+"""
+OpenAI-compatible stand-in for LM Studio used by the benchmarks.
+
+Answers ``/v1/chat/completions`` (plain and streamed) with labels that match
+the schema named in the request, after a latency drawn from a configurable
+distribution. Like LM Studio, it works on at most ``slots`` requests at a
+time; further requests wait for a free slot. A fraction of the requests can
+fail with HTTP 500.
+
+Usage:
+    python -m benchmarks.mock_server --port 1234 --slots 4 \\
+        --latency lognormal:0.4:0.5 --error-rate 0.01
+"""
+
+import argparse
+import json
+import math
+import random
+import re
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """
+    Parse a latency distribution.
+
+    Supported specs (seconds): ``fixed:S``, ``uniform:LOW:HIGH``,
+    ``exp:MEAN`` and ``lognormal:MEDIAN:SIGMA``.
+
+    Args:
+        spec (str): The distribution spec.
+
+    Returns:
+        Callable[[random.Random], float]: Draws one latency.
+    """
+    kind, *params = spec.split(":")
+    try:
+        values = [float(p) for p in params]
+        if kind == "fixed" and len(values) == 1:
+            return lambda rng: values[0]
+        if kind == "uniform" and len(values) == 2:
+            return lambda rng: rng.uniform(values[0], values[1])
+        if kind == "exp" and len(values) == 1:
+            return lambda rng: rng.expovariate(1 / values[0])
+        if kind == "lognormal" and len(values) == 2:
+            # Parametrized by the median, which is easier to reason about
+            mu = math.log(values[0])
+            return lambda rng: rng.lognormvariate(mu, values[1])
+    except (ValueError, ZeroDivisionError):
+        pass
+    raise ValueError(f"Invalid latency distribution: {spec!r}")
+
+
+def _label(rng: random.Random) -> Dict[str, Any]:
+    label = rng.choice(["cat", "dog", "car", "tree", "house", "person"])
+    return {
+        "label": label,
+        "description": f"A photo showing a {label} in daylight.",
+        "tags": [label, "outdoor"],
+    }
+
+
+def _answer(request: Dict[str, Any], rng: random.Random) -> str:
+    """
+    Build answer content matching the structured output schema requested.
+    """
+    schema = (request.get("response_format") or {}).get("json_schema") or {}
+    name = schema.get("name", "")
+    if name == "image_batch_label_response":
+        images = sum(
+            part.get("type") == "image_url"
+            for message in request.get("messages", [])
+            if isinstance(message.get("content"), list)
+            for part in message["content"]
+        )
+        results = [{"index": i, **_label(rng)} for i in range(images)]
+        return json.dumps({"results": results})
+    answer = _label(rng)
+    if name == "image_label_confidence_response":
+        answer["confidence"] = round(rng.uniform(0.3, 1.0), 2)
+    return json.dumps(answer)
+
+
+class MockServer:
+    """
+    Threaded mock LM Studio server listening on localhost.
+    """
+
+    def __init__(
+        self,
+        latency: str = "fixed:0.1",
+        slots: int = 1,
+        error_rate: float = 0.0,
+        port: int = 0,
+        seed: int = 0,
+    ):
+        """
+        Start serving in a background thread.
+
+        Args:
+            latency (str): Distribution of the processing time per request,
+                see ``parse_latency``.
+            slots (int): Number of requests processed in parallel.
+            error_rate (float): Fraction of requests answered with HTTP 500.
+            port (int): Port to listen on; 0 picks a free port.
+            seed (int): Seed of the latency, error and label draws.
+        """
+        self.draw_latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(slots)
+        self._stats_lock = threading.Lock()
+        # Seconds from receiving a request to sending the answer
+        self.latencies: List[float] = []
+        self.requests = 0
+        self.errors = 0
+        # Most requests being processed at the same time
+        self.peak_in_flight = 0
+        self._in_flight = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                # Headers and body are separate writes; without this, Nagle's
+                # algorithm and delayed ACKs add ~40ms to every answer
+                self.connection.setsockopt(
+                    socket.IPPROTO_TCP, socket.TCP_NODELAY, 1
+                )
+
+            def _reply(self, status: int, body: Dict[str, Any]):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path.rstrip("/").endswith("/models"):
+                    model = {"id": "mock", "object": "model"}
+                    self._reply(200, {"object": "list", "data": [model]})
+                else:
+                    self._reply(404, {"error": "not found"})
+
+            def do_POST(self):
+                start = time.perf_counter()
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if not self.path.endswith("/chat/completions"):
+                    self._reply(404, {"error": "not found"})
+                    return
+
+                with server._stats_lock:
+                    server._in_flight += 1
+                    server.peak_in_flight = max(
+                        server.peak_in_flight, server._in_flight
+                    )
+                with server._slots:
+                    with server._rng_lock:
+                        failed = server._rng.random() < server.error_rate
+                        delay = server.draw_latency(server._rng)
+                        content = _answer(request, server._rng)
+                    time.sleep(max(delay, 0.0))
+                    if failed:
+                        self._reply(500, {"error": "mock failure"})
+                    elif request.get("stream"):
+                        self._stream(content)
+                    else:
+                        self._reply(200, self._completion(content))
+
+                with server._stats_lock:
+                    server._in_flight -= 1
+                    server.requests += 1
+                    server.errors += failed
+                    server.latencies.append(time.perf_counter() - start)
+
+            def _completion(self, content: str) -> Dict[str, Any]:
+                tokens = max(len(content) // 4, 1)
+                return {
+                    "id": "mock",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": "mock",
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {
+                                "role": "assistant",
+                                "content": content,
+                            },
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {
+                        "prompt_tokens": 300,
+                        "completion_tokens": tokens,
+                        "total_tokens": 300 + tokens,
+                    },
+                }
+
+            def _stream(self, content: str):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                pieces = re.findall(".{1,4}", content, re.DOTALL)
+                chunks = [
+                    {"choices": [{"index": 0, "delta": {"content": piece}}]}
+                    for piece in pieces
+                ]
+                chunks.append(
+                    {
+                        "choices": [
+                            {"index": 0, "delta": {}, "finish_reason": "stop"}
+                        ]
+                    }
+                )
+                for chunk in chunks:
+                    chunk.update(
+                        id="mock",
+                        object="chat.completion.chunk",
+                        created=0,
+                        model="mock",
+                    )
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.write(b"data: [DONE]\n\n")
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+        self._thread = threading.Thread(
+            target=self.server.serve_forever, daemon=True
+        )
+        self._thread.start()
+
+    def reset(self):
+        """
+        Clear the recorded statistics.
+        """
+        with self._stats_lock:
+            self.latencies = []
+            self.requests = 0
+            self.errors = 0
+            self.peak_in_flight = 0
+
+    def close(self):
+        """
+        Stop the server.
+        """
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--port", type=int, default=1234)
+    parser.add_argument("--slots", type=int, default=1)
+    parser.add_argument("--latency", default="fixed:0.1")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = MockServer(
+        latency=args.latency,
+        slots=args.slots,
+        error_rate=args.error_rate,
+        port=args.port,
+    )
+    print(f"Mock LM Studio listening on {server.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
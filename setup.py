@@ -9,6 +9,7 @@ setup(
         "openai",
         "python-dotenv",
         "Pillow",
+        "numpy",
         "pytest",
         "fastapi",
         "uvicorn",
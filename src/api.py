@@ -1,14 +1,50 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from pydantic import BaseModel
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field
+import asyncio
 import shutil
 import os
 import tempfile
-from .labeler import label_image
-from .splitter import split_dataset, organize_dataset
-from .data_loader import get_image_files
+import threading
+from collections import Counter
+from typing import List, Literal, Optional
+from .label_db import LabelDatabase
+from .labeler import backend_pool, label_image_async
+from .metrics import metrics
+from .splitter import (
+    SPLIT_MANIFEST,
+    labels_for_files,
+    organize_dataset,
+    split_dataset,
+    train_val_test_split,
+)
+from .data_loader import get_image_files, iter_labels
 
 app = FastAPI(title="Image Labeler API")
 
+# Label database served by GET /labels, e.g. filled with
+# `python src/main.py --label-db`; see get_label_db()
+LABEL_DB_PATH = os.getenv("LABEL_DB_PATH")
+_label_db = None
+_label_db_lock = threading.Lock()
+
+
+def get_label_db() -> Optional[LabelDatabase]:
+    """
+    Get the label database configured with LABEL_DB_PATH.
+
+    Returns:
+        Optional[LabelDatabase]: The shared database, or None if
+        LABEL_DB_PATH is not set.
+    """
+    global _label_db
+    if not LABEL_DB_PATH:
+        return None
+    with _label_db_lock:
+        if _label_db is None:
+            _label_db = LabelDatabase(LABEL_DB_PATH)
+    return _label_db
+
 
 class SplitRequest(BaseModel):
     """
@@ -18,6 +54,32 @@ class SplitRequest(BaseModel):
     input_path: str
     output_path: str
     split_ratio: float = 0.8
+    recursive: bool = False
+    link_mode: Literal[
+        "copy", "hardlink", "reflink", "symlink", "manifest"
+    ] = "copy"
+    workers: int = Field(default=8, ge=1)
+    val_ratio: float = Field(default=0.0, ge=0, le=1)
+    seed: Optional[int] = None
+    # Label file (labels.json or labels.jsonl) split along with the images
+    labels_path: Optional[str] = None
+    stratify: bool = False
+
+
+def _save_upload(file: UploadFile, suffix: str) -> str:
+    """
+    Copy an uploaded file to a named temporary file.
+
+    Args:
+        file (UploadFile): The uploaded file.
+        suffix (str): Suffix (extension) of the temporary file.
+
+    Returns:
+        str: Path to the temporary file.
+    """
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        shutil.copyfileobj(file.file, tmp)
+        return tmp.name
 
 
 @app.post("/label-image/")
@@ -32,16 +94,15 @@ async def api_label_image(file: UploadFile = File(...)):
         dict: A dictionary containing the label, description, and tags.
     """
     # Save uploaded file temporarily to disk because the labeler
-    # expects a file path
-    with tempfile.NamedTemporaryFile(
-        delete=False, suffix=os.path.splitext(file.filename)[1]
-    ) as tmp:
-        shutil.copyfileobj(file.file, tmp)
-        tmp_path = tmp.name
+    # expects a file path. Disk I/O runs in a worker thread so the event
+    # loop keeps serving other requests.
+    tmp_path = await asyncio.to_thread(
+        _save_upload, file, os.path.splitext(file.filename)[1]
+    )
 
     try:
         # Process the image using the local LM Studio model
-        result = label_image(tmp_path)
+        result = await label_image_async(tmp_path)
         return result
     finally:
         # Ensure the temporary file is removed after processing
@@ -62,31 +123,176 @@ async def api_split_dataset(request: SplitRequest):
     """
     if not os.path.exists(request.input_path):
         raise HTTPException(status_code=404, detail="Input path not found")
+    if request.labels_path and not os.path.exists(request.labels_path):
+        raise HTTPException(status_code=404, detail="Labels path not found")
+    if request.stratify and not request.labels_path:
+        raise HTTPException(
+            status_code=400, detail="Stratifying needs a labels_path"
+        )
 
     try:
         # Retrieve all valid image files from the input directory
-        image_files = get_image_files(request.input_path)
+        image_files = get_image_files(
+            request.input_path, recursive=request.recursive
+        )
         if not image_files:
             raise HTTPException(
                 status_code=404, detail="No images found in input path"
             )
 
-        # Perform the random split based on the requested ratio
-        train_files, test_files = split_dataset(
-            image_files, request.split_ratio
-        )
+        labels = None
+        if request.stratify:
+            labels = labels_for_files(
+                image_files,
+                iter_labels(
+                    request.labels_path,
+                    fields=("label", "filename", "original_path"),
+                ),
+            )
 
-        # Copy files to their respective train/test directories
-        train_dir, test_dir = organize_dataset(
-            train_files, test_files, request.output_path
+        # Perform the random split based on the requested ratios
+        val_files = None
+        if request.val_ratio:
+            train_files, val_files, test_files = train_val_test_split(
+                image_files,
+                request.split_ratio,
+                request.val_ratio,
+                labels,
+                request.seed,
+            )
+        else:
+            train_files, test_files = split_dataset(
+                image_files, request.split_ratio, labels, request.seed
+            )
+
+        # Copy or link files to their respective train/test directories
+        methods = Counter()
+        train_dir, test_dir = await asyncio.to_thread(
+            organize_dataset,
+            train_files,
+            test_files,
+            request.output_path,
+            labeled_data=request.labels_path,
+            link_mode=request.link_mode,
+            file_callback=lambda entry: methods.update([entry["method"]]),
+            workers=request.workers,
+            val_files=val_files,
         )
 
         return {
             "message": "Dataset split successfully",
             "train_count": len(train_files),
             "test_count": len(test_files),
+            "val_count": len(val_files or []),
             "train_dir": train_dir,
             "test_dir": test_dir,
+            "methods": dict(methods),
+            "manifest": os.path.join(request.output_path, SPLIT_MANIFEST),
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/backends/")
+async def api_backends():
+    """
+    Report the state of the inference backends.
+
+    Returns:
+        dict: Per-backend statistics (health, load, latency and current
+        concurrency limit) and the history of the adaptive limits.
+    """
+    return {
+        "backends": backend_pool.stats(),
+        "limit_history": backend_pool.limit_history(),
+    }
+
+
+@app.get("/metrics")
+async def api_metrics(format: str = "prometheus"):
+    """
+    Report labeling metrics of this server process.
+
+    Args:
+        format (str): "prometheus" for the Prometheus text format, or
+        "json" for a summary with estimated percentiles.
+
+    Returns:
+        Per-stage duration histograms (encode, wait, request, parse),
+        per-image input and output token counts and error counts by type.
+    """
+    if format == "json":
+        return metrics.snapshot()
+    if format != "prometheus":
+        raise HTTPException(status_code=400, detail="Unknown format")
+    return PlainTextResponse(
+        metrics.render_prometheus(),
+        media_type="text/plain; version=0.0.4",
+    )
+
+
+@app.get("/labels")
+async def api_labels(
+    label: Optional[str] = None,
+    tag: List[str] = Query(default=[]),
+    filename: Optional[str] = None,
+    path_prefix: Optional[str] = None,
+    q: Optional[str] = None,
+    limit: int = Query(default=100, ge=1, le=1000),
+    offset: int = Query(default=0, ge=0),
+):
+    """
+    Query the label database.
+
+    Args:
+        label (Optional[str]): Only this label (case-insensitive).
+        tag (List[str]): Tags that must all be present; repeat the
+        parameter for several tags.
+        filename (Optional[str]): Only this image file name.
+        path_prefix (Optional[str]): Only images below this path.
+        q (Optional[str]): Words that must all occur in the description.
+        limit (int): Page size (at most 1000).
+        offset (int): Number of matching labels to skip.
+
+    Returns:
+        dict: The total number of matches and one page of labels, ordered
+        by original path.
+    """
+    db = get_label_db()
+    if db is None:
+        raise HTTPException(
+            status_code=503, detail="No label database (set LABEL_DB_PATH)"
+        )
+    filters = {
+        "label": label,
+        "tags": tag,
+        "filename": filename,
+        "path_prefix": path_prefix,
+        "text": q,
+    }
+
+    def _run():
+        items = db.query(limit=limit, offset=offset, **filters)
+        return items, db.count(**filters)
+
+    items, total = await asyncio.to_thread(_run)
+    return {"total": total, "limit": limit, "offset": offset, "items": items}
+
+
+@app.get("/labels/counts")
+async def api_label_counts():
+    """
+    Count the images per label and per tag in the label database.
+
+    Returns:
+        dict: Image counts per label and per tag, most frequent first.
+    """
+    db = get_label_db()
+    if db is None:
+        raise HTTPException(
+            status_code=503, detail="No label database (set LABEL_DB_PATH)"
+        )
+    labels, tags = await asyncio.to_thread(
+        lambda: (db.label_counts(), db.tag_counts())
+    )
+    return {"labels": labels, "tags": tags}
@@ -1,9 +1,18 @@
 import streamlit as st
 import os
-import json
-from src.data_loader import get_image_files, save_labels
-from src.labeler import label_image
-from src.splitter import split_dataset, organize_dataset
+from collections import Counter
+from src.data_loader import (
+    LabelStore,
+    ScanManifest,
+    get_image_files,
+    iter_latest_labels,
+    prefilter_images,
+    recover_labels,
+    save_labels,
+)
+from src.engine import label_images
+from src.labeler import DEFAULT_CASCADE, backend_pool, warm_thumbnail_cache
+from src.splitter import LINK_MODES, split_dataset, organize_dataset
 
 st.set_page_config(page_title="Image Labeler", layout="wide")
 
@@ -15,6 +24,37 @@ input_dir = st.sidebar.text_input("Input Directory", value="./data/raw")
 output_dir = st.sidebar.text_input(
     "Output Directory", value="./data/processed"
 )
+include_subdirectories = st.sidebar.checkbox(
+    "Include Subdirectories",
+    value=False,
+    help="Also load images from folders inside the input directory.",
+)
+incremental = st.sidebar.checkbox(
+    "Only New or Changed Images",
+    value=False,
+    help=(
+        "Remember the scanned images in the output directory and only load "
+        "those added or changed since they were labeled."
+    ),
+)
+manifest_path = os.path.join(output_dir, "manifest.db")
+skip_broken = st.sidebar.checkbox(
+    "Skip Broken Images",
+    value=False,
+    help=(
+        "Read the image headers before labeling and leave out files that "
+        "cannot be opened instead of labeling them as errors."
+    ),
+)
+min_image_size = st.sidebar.number_input(
+    "Minimum Image Size",
+    min_value=0,
+    value=0,
+    help=(
+        "Leave out images narrower or lower than this many pixels "
+        "(0: no limit)."
+    ),
+)
 max_resolution = st.sidebar.slider(
     "Max Image Resolution",
     min_value=256,
@@ -25,7 +65,73 @@ max_resolution = st.sidebar.slider(
         "may reduce label quality."
     ),
 )
+adaptive_resolution = st.sidebar.checkbox(
+    "Adaptive Resolution",
+    value=False,
+    help=(
+        "Label at 256px first and retry at higher resolutions, up to the "
+        "max resolution, only when the answer is vague or uncertain."
+    ),
+)
+cascade = None
+if adaptive_resolution:
+    cascade = [size for size in DEFAULT_CASCADE if size < max_resolution]
+    cascade.append(max_resolution)
+stream_responses = st.sidebar.checkbox(
+    "Stream Responses",
+    value=False,
+    help="Show the time to first token and tokens/sec of each request.",
+)
+token_budget = st.sidebar.number_input(
+    "Token Budget",
+    min_value=0,
+    value=0,
+    help=(
+        "Abort answers longer than this many tokens to save GPU time "
+        "(0: no limit)."
+    ),
+)
+concurrency = st.sidebar.number_input(
+    "Concurrent Requests",
+    min_value=1,
+    max_value=32,
+    value=min(backend_pool.max_capacity, 32),
+    help=(
+        "Number of images sent to LM Studio at the same time, spread over "
+        "the servers. Match this to their number of parallel slots."
+    ),
+)
+use_cache = st.sidebar.checkbox(
+    "Use Label Cache",
+    value=True,
+    help="Reuse labels of images that were already labeled with the same "
+    "prompt, resolution and model.",
+)
 split_ratio = st.sidebar.slider("Train/Test Split Ratio", 0.0, 1.0, 0.8)
+stratify = st.sidebar.checkbox(
+    "Stratify by Label",
+    value=False,
+    help=(
+        "Split every label in the same ratio, so rare labels are not left "
+        "out of the train or test set."
+    ),
+)
+split_seed = st.sidebar.number_input(
+    "Split Seed",
+    min_value=0,
+    value=0,
+    help="The same seed gives the same split (0: random).",
+)
+link_mode = st.sidebar.selectbox(
+    "Split File Mode",
+    LINK_MODES,
+    help=(
+        "How images are placed in train/ and test/. Hardlinks and reflinks "
+        "use no extra disk space, symlinks point to the originals and "
+        "'manifest' only lists the files in split_manifest.jsonl. Falls "
+        "back to copying when a link is not possible."
+    ),
+)
 
 # Main Content
 tab1, tab2 = st.tabs(["Labeling", "Splitting"])
@@ -34,10 +140,47 @@ with tab1:
     st.header("Image Labeling")
 
     if st.button("Load Images"):
-        if os.path.exists(input_dir):
-            files = get_image_files(input_dir)
+        if os.path.exists(input_dir) and incremental:
+            manifest = ScanManifest(manifest_path)
+            changes = manifest.scan(
+                input_dir, recursive=include_subdirectories
+            )
+            # Also images whose labeling failed or was stopped before
+            files = manifest.paths(input_dir, pending_only=True)
+            rejected = {}
+            if skip_broken or min_image_size:
+                files, rejected = prefilter_images(
+                    files, min_size=min_image_size or None, manifest=manifest
+                )
+            manifest.close()
+            st.session_state["files"] = files
+            warm_thumbnail_cache(
+                files, max_size=cascade[0] if cascade else max_resolution
+            )
+            st.success(
+                f"Found {len(files)} images to label "
+                f"({len(changes['new'])} new, "
+                f"{len(changes['modified'])} modified, "
+                f"{len(changes['deleted'])} deleted, "
+                f"{changes['unchanged']} unchanged, "
+                f"{len(rejected)} skipped)."
+            )
+        elif os.path.exists(input_dir):
+            files = get_image_files(
+                input_dir, recursive=include_subdirectories
+            )
+            rejected = {}
+            if skip_broken or min_image_size:
+                files, rejected = prefilter_images(
+                    files, min_size=min_image_size or None
+                )
             st.session_state["files"] = files
-            st.success(f"Found {len(files)} images.")
+            # Pre-compute the resized images while the user looks around
+            warm_thumbnail_cache(
+                files, max_size=cascade[0] if cascade else max_resolution
+            )
+            skipped = f" ({len(rejected)} skipped)" if rejected else ""
+            st.success(f"Found {len(files)} images{skipped}.")
         else:
             st.error("Input directory does not exist.")
 
@@ -46,7 +189,7 @@ with tab1:
             # Progress Bars
             st.write("Overall Progress")
             overall_bar = st.progress(0)
-            st.write("Current Image Progress")
+            st.write("Current Batch Progress")
             current_bar = st.progress(0)
 
             status_text = st.empty()
@@ -70,37 +213,48 @@ with tab1:
 
             files = st.session_state["files"]
             total_files = len(files)
-
-            for i, file_path in enumerate(files):
-                # Check for stop
-                # The stop button allows the user to interrupt the process
-                # safely
-                if stop_placeholder.button("Stop Labeling", key=f"stop_{i}"):
-                    st.warning("Labeling stopped by user.")
-                    break
-
-                status_text.text(
-                    f"Processing {os.path.basename(file_path)}..."
-                )
-
-                # Define callback
-                def update_progress(percent, message):
-                    """
-                    Callback function to update the progress bar and status
-                    text.
-                    """
-                    current_bar.progress(percent)
-                    status_text.text(
-                        f"Processing {os.path.basename(file_path)}: {message}"
+            # Labels of earlier runs live in the manifest; otherwise each
+            # result is appended to labels.jsonl and compacted at the end
+            manifest = None
+            store = None
+            if incremental:
+                manifest = ScanManifest(manifest_path)
+            else:
+                journal_path = os.path.join(output_dir, "labels.jsonl")
+                # Keep the labels of a run that crashed before truncating
+                recovered = recover_labels(journal_path, save_path)
+                if recovered:
+                    st.info(
+                        f"Recovered {recovered} labels of an interrupted "
+                        f"run into {save_path}"
                     )
-
-                # Label image
+                store = LabelStore(journal_path, truncate=True)
+
+            # Worker threads cannot update Streamlit elements; they leave
+            # the latest streaming statistics here for the loop below
+            stream_status = {}
+
+            def on_stream_progress(file_path, percent, message):
+                stream_status["message"] = message
+
+            # The backends' slots limit the requests actually in flight
+            backend_pool.set_max_in_flight(concurrency)
+            results = label_images(
+                files,
+                max_in_flight=concurrency,
+                progress_callback=(
+                    on_stream_progress if stream_responses else None
+                ),
+                max_size=max_resolution,
+                use_cache=use_cache,
+                cascade=cascade,
+                stream=stream_responses,
+                token_budget=token_budget or None,
+            )
+            # Results arrive in completion order; the batch progress bar
+            # shows how much of the in-flight window has finished.
+            for i, (index, file_path, result) in enumerate(results):
                 try:
-                    result = label_image(
-                        file_path,
-                        progress_callback=update_progress,
-                        max_size=max_resolution,
-                    )
                     result["filename"] = os.path.basename(file_path)
                     result["original_path"] = file_path
                     labeled_data.append(result)
@@ -109,15 +263,32 @@ with tab1:
                     st.session_state["labeled_data"] = labeled_data
 
                     # Save incrementally
-                    save_labels(labeled_data, save_path)
+                    if manifest is not None:
+                        manifest.mark([result])
+                    else:
+                        store.append(result)
 
                 except Exception as e:
                     st.error(f"Error processing {file_path}: {e}")
 
-                # Reset current bar and update overall
-                current_bar.progress(1.0)
+                status = (
+                    f"Labeled {os.path.basename(file_path)} "
+                    f"(image {index + 1} of {total_files})"
+                )
+                if "message" in stream_status:
+                    status += f" | {stream_status['message']}"
+                status_text.text(status)
+                current_bar.progress(((i % concurrency) + 1) / concurrency)
                 overall_bar.progress((i + 1) / total_files)
 
+                # Check for stop
+                # The stop button allows the user to interrupt the process
+                # safely; requests that were not sent yet are dropped
+                if stop_placeholder.button("Stop Labeling", key=f"stop_{i}"):
+                    st.warning("Labeling stopped by user.")
+                    results.close()
+                    break
+
             status_text.text(
                 "Labeling Complete!"
                 if len(labeled_data) == total_files
@@ -125,6 +296,13 @@ with tab1:
             )
             stop_placeholder.empty()  # Remove stop button
 
+            if manifest is not None:
+                save_labels(manifest.labels(input_dir), save_path)
+                manifest.close()
+            else:
+                store.compact(save_path)
+                store.close()
+
             if len(labeled_data) == total_files:
                 st.success(f"All labels saved to {save_path}")
             else:
@@ -141,27 +319,37 @@ with tab2:
     if st.button("Split Dataset"):
         if os.path.exists(output_dir):
             labels_path = os.path.join(output_dir, "labels.json")
+            if not os.path.exists(labels_path):
+                # A labeling run that was cut short only left the JSONL store
+                labels_path = os.path.join(output_dir, "labels.jsonl")
             files = []
+            # Label of each file, for a stratified split
+            file_labels = []
 
             # Try to load from labels.json first
             if os.path.exists(labels_path):
                 try:
-                    with open(labels_path, "r", encoding="utf-8") as f:
-                        data = json.load(f)
-                        # Extract original paths
-                        for item in data:
-                            if "original_path" in item and os.path.exists(
-                                item["original_path"]
-                            ):
-                                files.append(item["original_path"])
-                            elif "filename" in item:
-                                # Fallback: try to construct path from input_dir
-                                # if original_path is missing or invalid
-                                potential_path = os.path.join(
-                                    input_dir, item["filename"]
-                                )
-                                if os.path.exists(potential_path):
-                                    files.append(potential_path)
+                    # Only the paths are needed; descriptions are skipped
+                    data = iter_latest_labels(
+                        labels_path,
+                        fields=("filename", "original_path", "label"),
+                    )
+                    # Extract original paths
+                    for item in data:
+                        if "original_path" in item and os.path.exists(
+                            item["original_path"]
+                        ):
+                            files.append(item["original_path"])
+                            file_labels.append(item.get("label"))
+                        elif "filename" in item:
+                            # Fallback: try to construct path from input_dir
+                            # if original_path is missing or invalid
+                            potential_path = os.path.join(
+                                input_dir, item["filename"]
+                            )
+                            if os.path.exists(potential_path):
+                                files.append(potential_path)
+                                file_labels.append(item.get("label"))
 
                     if files:
                         st.success(
@@ -183,7 +371,9 @@ with tab2:
                         "No labeled data found. Using all images from input "
                         "directory."
                     )
-                    files = get_image_files(input_dir)
+                    files = get_image_files(
+                        input_dir, recursive=include_subdirectories
+                    )
                 else:
                     st.error("Input directory does not exist.")
 
@@ -191,22 +381,39 @@ with tab2:
                 st.error("No files found to split.")
             else:
                 try:
-                    train_files, test_files = split_dataset(files, split_ratio)
+                    train_files, test_files = split_dataset(
+                        files,
+                        split_ratio,
+                        labels=(
+                            file_labels
+                            if stratify and len(file_labels) == len(files)
+                            else None
+                        ),
+                        seed=split_seed or None,
+                    )
 
-                    # Load labels if available to pass to organize_dataset
-                    labeled_data = []
-                    if os.path.exists(labels_path):
-                        try:
-                            with open(labels_path, "r", encoding="utf-8") as f:
-                                labeled_data = json.load(f)
-                        except Exception:
-                            pass  # Ignore errors here, just won't split labels
+                    # Labels, if available, are streamed from the file by
+                    # organize_dataset
+                    methods = Counter()
+
+                    def count_file(entry):
+                        # Files already in place from an earlier split
+                        if entry["skipped"]:
+                            methods["skipped"] += 1
+                        else:
+                            methods[entry["method"]] += 1
 
                     train_dir, test_dir = organize_dataset(
                         train_files,
                         test_files,
                         output_dir,
-                        labeled_data=labeled_data,
+                        labeled_data=(
+                            labels_path
+                            if os.path.exists(labels_path)
+                            else None
+                        ),
+                        link_mode=link_mode,
+                        file_callback=count_file,
                     )
 
                     st.success("Dataset split successfully!")
@@ -216,6 +423,12 @@ with tab2:
 
                     st.info(f"Train data: {train_dir}")
                     st.info(f"Test data: {test_dir}")
+                    st.info(
+                        "Files: "
+                        + ", ".join(
+                            f"{n} {method}" for method, n in methods.items()
+                        )
+                    )
 
                 except Exception as e:
                     st.error(f"Error splitting dataset: {e}")
@@ -0,0 +1,575 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from openai import APIConnectionError, AsyncOpenAI, OpenAI
+
+
+class AIMDLimiter:
+    """
+    Additive-increase/multiplicative-decrease limit on concurrent requests.
+
+    Every successful request raises the limit by ``increase / limit``, i.e.
+    by roughly ``increase`` per round of ``limit`` requests, so the server
+    is pushed towards its throughput peak. The limit is multiplied by
+    ``decrease`` when a request fails or times out, or when its latency
+    exceeds ``latency_tolerance`` times the lowest latency seen among the
+    last ``latency_window`` requests, which is a sign of queueing on the
+    server. After a decrease, further decreases wait for one request
+    latency so that a single overload event only halves the limit once.
+
+    Not thread-safe on its own; ``BackendPool`` calls it under its lock.
+    """
+
+    def __init__(
+        self,
+        initial: int = 1,
+        min_limit: int = 1,
+        max_limit: int = 16,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        latency_tolerance: float = 2.0,
+        latency_window: int = 100,
+        history_size: int = 1000,
+    ):
+        """
+        Args:
+            initial (int): Starting limit.
+            min_limit (int): Lowest allowed limit.
+            max_limit (int): Highest allowed limit.
+            increase (float): Additive increase per round of requests.
+            decrease (float): Multiplicative decrease factor.
+            latency_tolerance (float): Latency ratio over the recent minimum
+                that counts as congestion.
+            latency_window (int): Number of recent latencies considered.
+            history_size (int): Number of limit changes kept in history.
+        """
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self._limit = float(min(max(initial, min_limit), max_limit))
+        self._latencies = deque(maxlen=latency_window)
+        self._last_decrease = float("-inf")
+        # (time, new limit, reason) for every change of the integer limit
+        self.history = deque(maxlen=history_size)
+        self.history.append((time.time(), self.limit, "initial"))
+
+    @property
+    def limit(self) -> int:
+        """
+        The current number of requests allowed in flight.
+        """
+        return int(self._limit)
+
+    def _set(self, value: float, reason: str):
+        old = self.limit
+        self._limit = min(max(value, self.min_limit), self.max_limit)
+        if self.limit != old:
+            self.history.append((time.time(), self.limit, reason))
+
+    def _back_off(self, reason: str):
+        now = time.monotonic()
+        cooldown = self._latencies[-1] if self._latencies else 0.0
+        if now - self._last_decrease >= cooldown:
+            self._last_decrease = now
+            self._set(self._limit * self.decrease, reason)
+
+    def reset(self, limit: int):
+        """
+        Restart adapting from a configured limit, raising the maximum to
+        it if needed.
+
+        Args:
+            limit (int): The new current limit.
+        """
+        self.max_limit = max(self.max_limit, limit)
+        self._last_decrease = float("-inf")
+        self._set(limit, "configured")
+
+    def on_success(self, latency: float):
+        """
+        Record a successful request.
+
+        Args:
+            latency (float): Duration of the request in seconds.
+        """
+        self._latencies.append(latency)
+        if latency > self.latency_tolerance * min(self._latencies):
+            self._back_off("latency")
+        else:
+            self._set(self._limit + self.increase / self._limit, "increase")
+
+    def on_failure(self, timeout: bool = False):
+        """
+        Record a failed request.
+
+        Args:
+            timeout (bool): Whether the request failed by timing out.
+        """
+        self._back_off("timeout" if timeout else "error")
+
+
+class Backend:
+    """
+    One OpenAI-compatible inference server (e.g. an LM Studio instance).
+
+    Each backend owns a sync and an async client that are reused for all
+    requests, so HTTP keep-alive connections are pooled per server.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        model: str,
+        max_in_flight: int = 1,
+        client: Optional[Any] = None,
+        async_client: Optional[Any] = None,
+        max_retries: int = 2,
+        limiter: Optional[AIMDLimiter] = None,
+    ):
+        """
+        Args:
+            url (str): Base URL of the OpenAI-compatible API.
+            model (str): Model name to request from this server.
+            max_in_flight (int): Number of requests the server handles at
+                once (its parallel slots).
+            client (Optional[Any]): Client to use instead of creating an
+                ``OpenAI`` client for ``url``.
+            async_client (Optional[Any]): Async client to use instead of
+                creating an ``AsyncOpenAI`` client for ``url``.
+            max_retries (int): Retries of the created clients before a
+                request counts as failed.
+            limiter (Optional[AIMDLimiter]): Adapts the number of requests in
+                flight to the observed latency and errors. ``max_in_flight``
+                is a fixed limit when no limiter is given.
+        """
+        self.url = url
+        self.model = model
+        self.max_in_flight = max_in_flight
+        self.limiter = limiter
+        self.client = client or OpenAI(
+            base_url=url, api_key="lm-studio", max_retries=max_retries
+        )
+        self.async_client = async_client or AsyncOpenAI(
+            base_url=url, api_key="lm-studio", max_retries=max_retries
+        )
+
+        self.outstanding = 0
+        self.healthy = True
+        self.consecutive_failures = 0
+        # Exponentially weighted moving average of the request latency
+        self.latency = None
+        self.requests = 0
+        self.failures = 0
+
+    @property
+    def limit(self) -> int:
+        """
+        Number of requests currently allowed in flight on this backend.
+        """
+        if self.limiter is not None:
+            return self.limiter.limit
+        return self.max_in_flight
+
+    @property
+    def max_limit(self) -> int:
+        """
+        Highest number of requests this backend may ever have in flight.
+        """
+        if self.limiter is not None:
+            return self.limiter.max_limit
+        return self.max_in_flight
+
+    def probe(self, timeout: float = 5.0) -> bool:
+        """
+        Check whether the server answers by listing its models.
+
+        Args:
+            timeout (float): Timeout of the probe request in seconds.
+
+        Returns:
+            bool: True if the server responded.
+        """
+        try:
+            self.client.with_options(timeout=timeout).models.list()
+            return True
+        except Exception:
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the request statistics of this backend.
+
+        Returns:
+            Dict[str, Any]: URL, model, health, load and latency figures.
+        """
+        return {
+            "url": self.url,
+            "model": self.model,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "limit": self.limit,
+            "max_limit": self.max_limit,
+            "requests": self.requests,
+            "failures": self.failures,
+            "latency": self.latency,
+        }
+
+
+class BackendPool:
+    """
+    Route labeling requests across several inference servers.
+
+    Requests go to the healthy backend with a free slot and the lowest load
+    (``"least_outstanding"``) or the lowest expected wait
+    (``"latency"``, outstanding requests times average latency). A backend
+    that fails ``max_failures`` requests in a row (connection errors,
+    timeouts and 5xx responses; a rejected request is not the server's
+    fault) is ejected and probed in the background every ``probe_interval``
+    seconds until it answers again. The last healthy backend is never
+    ejected, so a pool that is down fails with the server's own errors.
+    """
+
+    def __init__(
+        self,
+        backends: List[Backend],
+        strategy: str = "least_outstanding",
+        max_failures: int = 3,
+        probe_interval: float = 10.0,
+        latency_smoothing: float = 0.2,
+    ):
+        """
+        Args:
+            backends (List[Backend]): The backends to route requests to.
+            strategy (str): "least_outstanding" or "latency".
+            max_failures (int): Consecutive failures before ejection.
+            probe_interval (float): Seconds between probes of ejected
+                backends.
+            latency_smoothing (float): Weight of the newest sample in the
+                latency moving average.
+        """
+        if not backends:
+            raise ValueError("BackendPool needs at least one backend")
+        if strategy not in ("least_outstanding", "latency"):
+            raise ValueError(f"Unknown routing strategy: {strategy}")
+
+        self.backends = backends
+        self.strategy = strategy
+        self.max_failures = max_failures
+        self.probe_interval = probe_interval
+        self.latency_smoothing = latency_smoothing
+        self._condition = threading.Condition()
+        self._prober = None
+
+    @property
+    def model_id(self) -> str:
+        """
+        Identity of the model(s) served by the pool, used in cache keys.
+        """
+        return ",".join(sorted({backend.model for backend in self.backends}))
+
+    @property
+    def capacity(self) -> int:
+        """
+        Total number of requests the healthy backends currently accept.
+        """
+        with self._condition:
+            return sum(b.limit for b in self.backends if b.healthy)
+
+    @property
+    def max_capacity(self) -> int:
+        """
+        Upper bound of ``capacity``; callers that size worker pools should
+        use this so that adaptive limits can grow.
+        """
+        return sum(b.max_limit for b in self.backends)
+
+    def set_max_in_flight(self, total: int):
+        """
+        Spread a number of requests in flight over the backends, e.g. the
+        parallel slots set on the command line.
+
+        Every backend gets an equal share of at least one request; an
+        adaptive backend starts adapting from its share.
+
+        Args:
+            total (int): Requests in flight across all backends.
+        """
+        if total < 1:
+            raise ValueError("Need at least one request in flight")
+        with self._condition:
+            count = len(self.backends)
+            for i, backend in enumerate(self.backends):
+                backend.max_in_flight = max(
+                    total // count + (i < total % count), 1
+                )
+                if backend.limiter is not None:
+                    backend.limiter.reset(backend.max_in_flight)
+            self._condition.notify_all()
+
+    def _score(self, backend: Backend) -> float:
+        if self.strategy == "latency" and backend.latency is not None:
+            return (backend.outstanding + 1) * backend.latency
+        return backend.outstanding / backend.limit
+
+    def _select(self) -> Optional[Backend]:
+        # Must be called with the condition held. Without a healthy backend
+        # the caller waits for the prober to re-admit one.
+        healthy = [b for b in self.backends if b.healthy]
+        if not healthy:
+            self._start_prober()
+            return None
+        candidates = [b for b in healthy if b.outstanding < b.limit]
+        if not candidates:
+            return None
+        backend = min(candidates, key=self._score)
+        backend.outstanding += 1
+        return backend
+
+    def _release(
+        self,
+        backend: Backend,
+        latency: Optional[float],
+        error: Optional[BaseException] = None,
+    ):
+        # A latency of None marks a cancelled request, which only frees
+        # its slot
+        with self._condition:
+            backend.outstanding -= 1
+            self._condition.notify_all()
+            if latency is None:
+                return
+            backend.requests += 1
+            if error is not None and not is_backend_failure(error):
+                # The server answered, e.g. rejected a bad request
+                backend.consecutive_failures = 0
+                return
+            if backend.limiter is not None:
+                if error is None:
+                    backend.limiter.on_success(latency)
+                else:
+                    backend.limiter.on_failure(timeout=_is_timeout(error))
+            if error is None:
+                backend.consecutive_failures = 0
+                if backend.latency is None:
+                    backend.latency = latency
+                else:
+                    backend.latency += self.latency_smoothing * (
+                        latency - backend.latency
+                    )
+            else:
+                backend.failures += 1
+                backend.consecutive_failures += 1
+                if backend.consecutive_failures >= self.max_failures:
+                    self._eject(backend)
+
+    def _eject(self, backend: Backend):
+        # Must be called with the condition held
+        if not any(b.healthy for b in self.backends if b is not backend):
+            return
+        backend.healthy = False
+        self._start_prober()
+
+    def _start_prober(self):
+        # Must be called with the condition held
+        if self._prober is None:
+            self._prober = threading.Thread(
+                target=self._probe_ejected, name="backend-probe", daemon=True
+            )
+            self._prober.start()
+
+    def _probe_ejected(self):
+        # Re-admit ejected backends once they answer a probe
+        while True:
+            time.sleep(self.probe_interval)
+            with self._condition:
+                ejected = [b for b in self.backends if not b.healthy]
+                if not ejected:
+                    # Decided under the lock so _eject starts a new prober
+                    self._prober = None
+                    return
+            for backend in ejected:
+                if backend.probe():
+                    with self._condition:
+                        backend.healthy = True
+                        backend.consecutive_failures = 0
+                        self._condition.notify_all()
+
+    @contextmanager
+    def acquire(self, timeout: Optional[float] = None) -> Iterator[Backend]:
+        """
+        Reserve a slot on the best available backend for one request.
+
+        Blocks until a healthy backend has a free slot. The request latency
+        and outcome are recorded when the block exits; connection errors,
+        timeouts and 5xx responses raised in the block count as failures of
+        the backend.
+
+        Args:
+            timeout (Optional[float]): Maximum seconds to wait for a slot.
+
+        Yields:
+            Backend: The backend to send the request to.
+        """
+        with self._condition:
+            backend = self._select()
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while backend is None:
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError("No inference backend available")
+                self._condition.wait(remaining)
+                backend = self._select()
+
+        start = time.perf_counter()
+        try:
+            yield backend
+        except Exception as e:
+            self._release(backend, time.perf_counter() - start, e)
+            raise
+        except BaseException:
+            # Interrupted by the caller (e.g. Ctrl-C), not the server's fault
+            self._release(backend, None)
+            raise
+        self._release(backend, time.perf_counter() - start)
+
+    @asynccontextmanager
+    async def acquire_async(self):
+        """
+        Asynchronous counterpart of ``acquire``.
+
+        Waits for a free slot without blocking the event loop or holding a
+        thread.
+
+        Yields:
+            Backend: The backend to send the request to.
+        """
+        delay = 0.005
+        while True:
+            with self._condition:
+                backend = self._select()
+            if backend is not None:
+                break
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.1)
+
+        start = time.perf_counter()
+        try:
+            yield backend
+        except Exception as e:
+            self._release(backend, time.perf_counter() - start, e)
+            raise
+        except BaseException:
+            # Interrupted by the caller (e.g. Ctrl-C), not the server's fault
+            self._release(backend, None)
+            raise
+        self._release(backend, time.perf_counter() - start)
+
+    def limit_history(self) -> Dict[str, List[Any]]:
+        """
+        Get the history of the adaptive limits.
+
+        Returns:
+            Dict[str, List[Any]]: ``(time, limit, reason)`` entries per
+            backend URL, for backends with an adaptive limit.
+        """
+        with self._condition:
+            return {
+                b.url: list(b.limiter.history)
+                for b in self.backends
+                if b.limiter is not None
+            }
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """
+        Get the statistics of all backends.
+
+        Returns:
+            List[Dict[str, Any]]: One entry per backend, see
+            ``Backend.stats``.
+        """
+        with self._condition:
+            return [backend.stats() for backend in self.backends]
+
+
+def _is_timeout(error: BaseException) -> bool:
+    """
+    Check whether a request error was caused by a timeout.
+    """
+    return isinstance(error, TimeoutError) or "Timeout" in type(error).__name__
+
+
+def is_backend_failure(error: BaseException) -> bool:
+    """
+    Check whether a request error is the server's fault: it could not be
+    reached, timed out or answered with a 5xx status.
+    """
+    status = getattr(error, "status_code", None)
+    if isinstance(status, int):
+        return status >= 500
+    return isinstance(
+        error, (APIConnectionError, ConnectionError)
+    ) or _is_timeout(error)
+
+
+def pool_from_env(
+    default_url: str, default_model: str, max_in_flight: int
+) -> BackendPool:
+    """
+    Build the backend pool from the environment.
+
+    ``LM_STUDIO_URLS`` lists the servers, separated by commas. The optional
+    ``LM_STUDIO_MODELS`` lists the model of each server; a single entry
+    applies to all of them. Without ``LM_STUDIO_URLS`` the pool consists of
+    the single default server. ``LM_STUDIO_ROUTING`` selects the routing
+    strategy. With ``LM_STUDIO_ADAPTIVE=1`` each backend starts at
+    ``max_in_flight`` and adapts its limit up to
+    ``LM_STUDIO_MAX_IN_FLIGHT_LIMIT``.
+
+    Args:
+        default_url (str): URL used when ``LM_STUDIO_URLS`` is not set.
+        default_model (str): Model used when ``LM_STUDIO_MODELS`` is not set.
+        max_in_flight (int): Parallel slots of every backend, or their
+            initial number if adaptive.
+
+    Returns:
+        BackendPool: The configured pool.
+    """
+    urls = [u.strip() for u in os.getenv("LM_STUDIO_URLS", "").split(",")]
+    urls = [u for u in urls if u] or [default_url]
+    models = [m.strip() for m in os.getenv("LM_STUDIO_MODELS", "").split(",")]
+    models = [m for m in models if m] or [default_model]
+    if len(models) == 1:
+        models = models * len(urls)
+    if len(models) != len(urls):
+        raise ValueError("LM_STUDIO_MODELS must list one model per URL")
+
+    adaptive = os.getenv("LM_STUDIO_ADAPTIVE", "0") == "1"
+    max_limit = int(os.getenv("LM_STUDIO_MAX_IN_FLIGHT_LIMIT", "16"))
+    backends = [
+        Backend(
+            url,
+            model,
+            max_in_flight=max_in_flight,
+            limiter=(
+                AIMDLimiter(
+                    initial=max_in_flight,
+                    max_limit=max(max_limit, max_in_flight),
+                )
+                if adaptive
+                else None
+            ),
+        )
+        for url, model in zip(urls, models)
+    ]
+    return BackendPool(
+        backends, strategy=os.getenv("LM_STUDIO_ROUTING", "least_outstanding")
+    )
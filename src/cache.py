@@ -0,0 +1,315 @@
+import os
+import json
+import hashlib
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+class LabelCache:
+    """
+    Persistent cache of labeling results stored in a SQLite database.
+
+    Entries are addressed by an opaque key (see ``labeler.label_cache_key``)
+    and evicted in least-recently-used order once the cache grows beyond
+    ``max_entries`` entries or ``max_bytes`` bytes of stored results.
+    The cache can be shared between threads.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        max_entries: int = 100_000,
+        max_bytes: int = 256 * 1024 * 1024,
+    ):
+        """
+        Open (or create) the cache database.
+
+        Args:
+            db_path (str): Path to the SQLite database file.
+            max_entries (int): Maximum number of cached results.
+            max_bytes (int): Maximum total size of the cached results.
+        """
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS labels ("
+            "key TEXT PRIMARY KEY, "
+            "result TEXT NOT NULL, "
+            "size INTEGER NOT NULL, "
+            "last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS labels_last_used "
+            "ON labels (last_used)"
+        )
+        self._conn.commit()
+        self._entries, self._bytes = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM labels"
+        ).fetchone()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached result and mark it as recently used.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            Optional[Dict[str, Any]]: The cached result, or None on a miss.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result FROM labels WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._conn.execute(
+                "UPDATE labels SET last_used = ? WHERE key = ?",
+                (time.time(), key),
+            )
+            self._conn.commit()
+            return json.loads(row[0])
+
+    def put(self, key: str, result: Dict[str, Any]):
+        """
+        Store a result, evicting least recently used entries if needed.
+
+        Args:
+            key (str): The cache key.
+            result (Dict[str, Any]): The labeling result to store.
+        """
+        data = json.dumps(result)
+        size = len(data.encode("utf-8"))
+        with self._lock:
+            old = self._conn.execute(
+                "SELECT size FROM labels WHERE key = ?", (key,)
+            ).fetchone()
+            if old is not None:
+                self._entries -= 1
+                self._bytes -= old[0]
+
+            self._conn.execute(
+                "INSERT OR REPLACE INTO labels (key, result, size, last_used) "
+                "VALUES (?, ?, ?, ?)",
+                (key, data, size, time.time()),
+            )
+            self._entries += 1
+            self._bytes += size
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """
+        Drop least recently used entries until the cache is within limits.
+        Must be called with the lock held.
+        """
+        while self._entries > self.max_entries or (
+            self._bytes > self.max_bytes and self._entries > 0
+        ):
+            # Evict in small batches to avoid one query per entry
+            excess = max(self._entries - self.max_entries, 1)
+            rows = self._conn.execute(
+                "SELECT key, size FROM labels ORDER BY last_used LIMIT ?",
+                (excess,),
+            ).fetchall()
+            self._conn.executemany(
+                "DELETE FROM labels WHERE key = ?", [(k,) for k, _ in rows]
+            )
+            self._entries -= len(rows)
+            self._bytes -= sum(size for _, size in rows)
+
+    def clear(self):
+        """
+        Remove all entries and reset the hit/miss counters.
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM labels")
+            self._conn.commit()
+            self._entries = 0
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get usage statistics of the cache.
+
+        Returns:
+            Dict[str, int]: The number of hits, misses, entries and bytes.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": self._entries,
+                "bytes": self._bytes,
+            }
+
+    def close(self):
+        """
+        Close the underlying database connection.
+        """
+        with self._lock:
+            self._conn.close()
+
+
+class ThumbnailCache:
+    """
+    Disk cache of resized, JPEG encoded images.
+
+    Each entry is a JPEG file in ``cache_dir`` named after a key derived from
+    the source file identity (absolute path, size and modification time) and
+    the target ``max_size``, so editing or replacing the source invalidates
+    its thumbnails. Files are evicted in least-recently-used order once the
+    cache exceeds ``max_bytes``.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 1024 * 1024 * 1024):
+        """
+        Open (or create) the cache directory.
+
+        Args:
+            cache_dir (str): Directory holding the cached thumbnails.
+            max_bytes (int): Maximum total size of the cached thumbnails.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # Rebuild the LRU order from the modification times on disk
+        entries = []
+        with os.scandir(cache_dir) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith(".jpg"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, entry.name, stat.st_size))
+        entries.sort()
+        self._entries = OrderedDict(
+            (name[: -len(".jpg")], size) for _, name, size in entries
+        )
+        self._bytes = sum(self._entries.values())
+
+    @staticmethod
+    def key(image_path: str, max_size: int) -> str:
+        """
+        Compute the cache key of a source image at a given resolution.
+
+        Args:
+            image_path (str): Path to the source image.
+            max_size (int): Maximum dimension of the thumbnail.
+
+        Returns:
+            str: The hexadecimal cache key.
+        """
+        stat = os.stat(image_path)
+        identity = (
+            f"{os.path.abspath(image_path)}|{stat.st_size}|"
+            f"{stat.st_mtime_ns}|{max_size}"
+        )
+        return hashlib.sha256(identity.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.jpg")
+
+    def get(self, image_path: str, max_size: int) -> Optional[bytes]:
+        """
+        Read the cached thumbnail of an image.
+
+        Args:
+            image_path (str): Path to the source image.
+            max_size (int): Maximum dimension of the thumbnail.
+
+        Returns:
+            Optional[bytes]: The JPEG bytes, or None on a miss.
+        """
+        key = self.key(image_path, max_size)
+        try:
+            with open(self._path(key), "rb") as f:
+                data = f.read()
+            # Record the access for LRU eviction across runs
+            os.utime(self._path(key))
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        return data
+
+    def put(self, image_path: str, max_size: int, data: bytes):
+        """
+        Store the thumbnail of an image, evicting old entries if needed.
+
+        Args:
+            image_path (str): Path to the source image.
+            max_size (int): Maximum dimension of the thumbnail.
+            data (bytes): The JPEG bytes (any bytes-like object).
+        """
+        key = self.key(image_path, max_size)
+        # Write to a temporary file first so readers never see partial data
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(key))
+
+        with self._lock:
+            self._bytes -= self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                old_key, old_size = self._entries.popitem(last=False)
+                self._bytes -= old_size
+                try:
+                    os.remove(self._path(old_key))
+                except FileNotFoundError:
+                    pass
+
+    def contains(self, image_path: str, max_size: int) -> bool:
+        """
+        Check whether a thumbnail is cached without counting a hit or miss.
+
+        Args:
+            image_path (str): Path to the source image.
+            max_size (int): Maximum dimension of the thumbnail.
+
+        Returns:
+            bool: True if the thumbnail is cached.
+        """
+        return os.path.exists(self._path(self.key(image_path, max_size)))
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get usage statistics of the cache.
+
+        Returns:
+            Dict[str, int]: The number of hits, misses, entries and bytes.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
@@ -0,0 +1,294 @@
+import os
+import json
+import random
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .engine import label_images
+
+
+class LocalClassifier:
+    """
+    The small ResNet18 trained by ``training_example/train.py``.
+
+    Loads ``model.pth`` and ``class_map.json`` and predicts a label with its
+    softmax probability. PyTorch and torchvision are optional dependencies
+    (see ``training_example/requirements.txt``) and are only imported here.
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        class_map_path: str,
+        device: Optional[str] = None,
+    ):
+        """
+        Args:
+            model_path (str): Path to the saved state dict (``model.pth``).
+            class_map_path (str): Path to ``class_map.json``, mapping labels
+                to class indices.
+            device (Optional[str]): Torch device; defaults to CUDA when
+                available.
+
+        Raises:
+            ImportError: If PyTorch or torchvision is not installed.
+        """
+        try:
+            import torch
+            import torch.nn as nn
+            from torchvision import models, transforms
+        except ImportError as e:
+            raise ImportError(
+                "The classifier cascade needs torch and torchvision, see "
+                "training_example/requirements.txt"
+            ) from e
+
+        with open(class_map_path, "r") as f:
+            class_to_idx = json.load(f)
+        self.classes = [None] * len(class_to_idx)
+        for label, idx in class_to_idx.items():
+            self.classes[idx] = label
+
+        self._torch = torch
+        self.device = torch.device(
+            device or ("cuda" if torch.cuda.is_available() else "cpu")
+        )
+        model = models.resnet18(weights=None)
+        model.fc = nn.Linear(model.fc.in_features, len(self.classes))
+        model.load_state_dict(torch.load(model_path, map_location=self.device))
+        self.model = model.to(self.device).eval()
+        # Same preprocessing as the "test" transform of train.py
+        self.transform = transforms.Compose(
+            [
+                transforms.Resize(256),
+                transforms.CenterCrop(224),
+                transforms.ToTensor(),
+                transforms.Normalize(
+                    [0.485, 0.456, 0.406], [0.229, 0.224, 0.225]
+                ),
+            ]
+        )
+
+    @classmethod
+    def from_dir(cls, model_dir: str, **kwargs: Any) -> "LocalClassifier":
+        """
+        Load the model that ``train.py`` saved into a dataset directory.
+
+        Args:
+            model_dir (str): Directory holding ``model.pth`` and
+                ``class_map.json``.
+            **kwargs: Passed on to the constructor.
+
+        Returns:
+            LocalClassifier: The loaded classifier.
+        """
+        return cls(
+            os.path.join(model_dir, "model.pth"),
+            os.path.join(model_dir, "class_map.json"),
+            **kwargs,
+        )
+
+    def predict(
+        self, image_paths: List[str], batch_size: int = 32
+    ) -> List[Optional[Tuple[str, float]]]:
+        """
+        Predict the label of each image.
+
+        Args:
+            image_paths (List[str]): Paths to the image files.
+            batch_size (int): Number of images per forward pass.
+
+        Returns:
+            List[Optional[Tuple[str, float]]]: ``(label, confidence)`` per
+            image, or None for images that cannot be read.
+        """
+        from PIL import Image
+
+        torch = self._torch
+        predictions: List[Optional[Tuple[str, float]]] = []
+        for start in range(0, len(image_paths), batch_size):
+            tensors = []
+            positions = []
+            end = start + batch_size
+            batch = image_paths[start:end]
+            predictions.extend([None] * len(batch))
+            for offset, image_path in enumerate(batch):
+                try:
+                    with Image.open(image_path) as img:
+                        tensors.append(self.transform(img.convert("RGB")))
+                    positions.append(start + offset)
+                except Exception:
+                    continue
+            if not tensors:
+                continue
+
+            with torch.no_grad():
+                logits = self.model(torch.stack(tensors).to(self.device))
+                probabilities = torch.softmax(logits, dim=1)
+                confidences, indices = probabilities.max(dim=1)
+            for position, confidence, idx in zip(
+                positions, confidences.tolist(), indices.tolist()
+            ):
+                predictions[position] = (self.classes[idx], confidence)
+        return predictions
+
+
+def _same_label(a: str, b: str) -> bool:
+    return a.strip().lower() == b.strip().lower()
+
+
+class ClassifierCascade:
+    """
+    Label images with a cheap classifier first and the VLM only when needed.
+
+    Every image is classified by the local model. Predictions with a
+    confidence of at least ``threshold`` are accepted as labels; the other
+    images are labeled by the VLM with ``label_image``. A random
+    ``audit_fraction`` of the accepted images is also sent to the VLM, so
+    the agreement of both tiers can be measured on the images the cascade
+    trusts the classifier with, not only on those it does not.
+
+    ``stats()`` reports the number of images per tier and the agreement
+    between the classifier and the VLM, which helps choosing the threshold
+    for the next labeling round.
+    """
+
+    def __init__(
+        self,
+        classifier: Any,
+        threshold: float = 0.9,
+        audit_fraction: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        """
+        Args:
+            classifier (Any): An object with a ``predict(image_paths)``
+                method returning ``(label, confidence)`` or None per image,
+                e.g. a ``LocalClassifier``.
+            threshold (float): Minimum confidence to accept a prediction.
+            audit_fraction (float): Fraction of accepted predictions that
+                are checked against the VLM.
+            seed (Optional[int]): Seed of the audit sample.
+        """
+        self.classifier = classifier
+        self.threshold = threshold
+        self.audit_fraction = audit_fraction
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._counts = {
+            "classifier": 0,
+            "vlm": 0,
+            "audited": 0,
+            "vlm_errors": 0,
+        }
+        # tier -> [agreeing, compared]
+        self._agreement = {"vlm": [0, 0], "audit": [0, 0]}
+
+    def label_images(
+        self,
+        image_paths: Iterable[str],
+        max_in_flight: Optional[int] = None,
+        progress_callback: Optional[callable] = None,
+        **label_kwargs: Any,
+    ) -> Iterator[Tuple[int, str, Dict[str, Any]]]:
+        """
+        Label images through the cascade.
+
+        Accepted classifier labels are yielded first, then the VLM labels
+        as they complete (see ``engine.label_images``).
+
+        Args:
+            image_paths (Iterable[str]): Paths of the images to label.
+            max_in_flight (Optional[int]): Maximum number of concurrent VLM
+                requests.
+            progress_callback (Optional[callable]): Passed on to
+                ``engine.label_images``.
+            **label_kwargs: Extra keyword arguments for the VLM labeling.
+
+        Yields:
+            Tuple[int, str, Dict[str, Any]]: ``(index, image_path, result)``.
+            Every result has a 'source' ("classifier" or "vlm"); VLM results
+            also carry the classifier's guess when there was one.
+        """
+        image_paths = list(image_paths)
+        predictions = self.classifier.predict(image_paths)
+
+        to_vlm = []
+        for index, (image_path, prediction) in enumerate(
+            zip(image_paths, predictions)
+        ):
+            if prediction is None or prediction[1] < self.threshold:
+                to_vlm.append(index)
+                continue
+            if self._random.random() < self.audit_fraction:
+                # The VLM label is kept for audited images
+                to_vlm.append(index)
+                continue
+            with self._lock:
+                self._counts["classifier"] += 1
+            label, confidence = prediction
+            yield index, image_path, {
+                "label": label,
+                "description": "",
+                "tags": [],
+                "source": "classifier",
+                "confidence": confidence,
+            }
+
+        results = label_images(
+            [image_paths[i] for i in to_vlm],
+            max_in_flight=max_in_flight,
+            progress_callback=progress_callback,
+            **label_kwargs,
+        )
+        for position, _, result in results:
+            index = to_vlm[position]
+            prediction = predictions[index]
+            audited = (
+                prediction is not None and prediction[1] >= self.threshold
+            )
+            result["source"] = "vlm"
+            if prediction is not None:
+                result["classifier_label"] = prediction[0]
+                result["classifier_confidence"] = prediction[1]
+            self._record(result, prediction, audited)
+            yield index, image_paths[index], result
+
+    def _record(
+        self,
+        result: Dict[str, Any],
+        prediction: Optional[Tuple[str, float]],
+        audited: bool,
+    ):
+        with self._lock:
+            self._counts["audited" if audited else "vlm"] += 1
+            if result.get("label") == "error":
+                self._counts["vlm_errors"] += 1
+                return
+            if prediction is None:
+                return
+            agreement = self._agreement["audit" if audited else "vlm"]
+            agreement[0] += _same_label(result["label"], prediction[0])
+            agreement[1] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the tier counts and agreement statistics.
+
+        Returns:
+            Dict[str, Any]: Images labeled by the classifier, sent to the
+            VLM for low confidence, audited (accepted but labeled by the
+            VLM to compare) and failed at the VLM, and per tier (``vlm``
+            for low confidence, ``audit`` for accepted predictions) the
+            number of compared images and the fraction where both models
+            gave the same label.
+        """
+        with self._lock:
+            agreement = {
+                tier: {
+                    "compared": compared,
+                    "rate": agreeing / compared if compared else None,
+                }
+                for tier, (agreeing, compared) in self._agreement.items()
+            }
+            return {**self._counts, "agreement": agreement}
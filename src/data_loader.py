@@ -1,54 +1,452 @@
 import os
 import json
+import fnmatch
+import re
+import hashlib
+import sqlite3
+import stat
+import tempfile
+import textwrap
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
 
-from pathlib import Path
-from typing import List, Dict, Any
+from PIL import Image
 
+# File extensions recognized as images
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".gif", ".webp"}
 
-def get_image_files(directory: str) -> List[str]:
+
+def _matches(rel_path: str, name: str, patterns: Sequence[str]) -> bool:
+    """
+    Check a path against glob patterns, matched against the path relative
+    to the scanned root (with "/" separators) and against the bare name.
+    """
+    return any(
+        fnmatch.fnmatchcase(rel_path, pattern)
+        or fnmatch.fnmatchcase(name, pattern)
+        for pattern in patterns
+    )
+
+
+def _scan_directory(
+    directory: str,
+    rel_dir: str,
+    include: Optional[Sequence[str]],
+    exclude: Sequence[str],
+    follow_symlinks: bool,
+    strict: bool,
+) -> Tuple[List[str], List[Tuple[str, str, Optional[Tuple[int, int]]]]]:
+    """
+    List the images and subdirectories of one directory.
+
+    Returns:
+        Tuple: The image paths, and ``(path, relative path, identity)`` of
+        each subdirectory to descend into. The identity (device, inode) is
+        only computed when following symlinks.
+    """
+    files = []
+    subdirs = []
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                rel_path = rel_dir + entry.name
+                try:
+                    if entry.is_dir(follow_symlinks=follow_symlinks):
+                        if exclude and _matches(rel_path, entry.name, exclude):
+                            continue
+                        identity = None
+                        if follow_symlinks:
+                            stat = entry.stat()
+                            identity = (stat.st_dev, stat.st_ino)
+                        subdirs.append((entry.path, rel_path + "/", identity))
+                        continue
+                    if os.path.splitext(entry.name)[1].lower() not in (
+                        IMAGE_EXTENSIONS
+                    ):
+                        continue
+                    if not entry.is_file():
+                        continue
+                except OSError:
+                    # Broken symlink or entry removed while scanning
+                    continue
+                if include and not _matches(rel_path, entry.name, include):
+                    continue
+                if exclude and _matches(rel_path, entry.name, exclude):
+                    continue
+                files.append(os.path.abspath(entry.path))
+    except OSError:
+        if strict:
+            raise
+        # Unreadable subdirectories are skipped
+    return files, subdirs
+
+
+def iter_image_files(
+    directory: str,
+    recursive: bool = True,
+    include: Optional[Sequence[str]] = None,
+    exclude: Optional[Sequence[str]] = None,
+    follow_symlinks: bool = False,
+    workers: int = 8,
+) -> Iterator[str]:
+    """
+    Find image files, yielding them while the scan is still running.
+
+    Directories are listed with ``os.scandir`` in a thread pool, so the
+    latency of network storage is overlapped across directories. Paths are
+    yielded as soon as their directory has been listed and only the
+    directories still to be scanned are held in memory. The order of the
+    paths is not defined.
+
+    Args:
+        directory (str): The root directory to search.
+        recursive (bool): Descend into subdirectories.
+        include (Optional[Sequence[str]]): Glob patterns; if given, only
+            files matching one of them are returned.
+        exclude (Optional[Sequence[str]]): Glob patterns of files and
+            directories to skip; an excluded directory is not descended.
+        follow_symlinks (bool): Descend into symlinked directories. Each
+            directory is visited once, which protects against symlink loops.
+        workers (int): Number of directories listed concurrently.
+
+    Patterns are matched against the path relative to ``directory`` (with
+    "/" separators, e.g. ``2023/*/raw``) and against the bare name (e.g.
+    ``*.png`` or ``.thumbnails``). As in ``fnmatch``, ``*`` also matches
+    "/".
+
+    Yields:
+        str: Absolute paths to image files.
+
+    Raises:
+        FileNotFoundError: If ``directory`` does not exist.
+    """
+    root = os.path.abspath(directory)
+    if not os.path.isdir(root):
+        raise FileNotFoundError(f"Directory not found: {directory}")
+    exclude = list(exclude or [])
+    include = list(include) if include else None
+
+    visited = set()
+    if follow_symlinks:
+        stat = os.stat(root)
+        visited.add((stat.st_dev, stat.st_ino))
+
+    executor = ThreadPoolExecutor(
+        max_workers=workers, thread_name_prefix="scanner"
+    )
+    pending = {
+        executor.submit(
+            _scan_directory, root, "", include, exclude, follow_symlinks, True
+        )
+    }
+    try:
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, subdirs = future.result()
+                if recursive:
+                    for path, rel_dir, identity in subdirs:
+                        if identity is not None:
+                            if identity in visited:
+                                continue
+                            visited.add(identity)
+                        pending.add(
+                            executor.submit(
+                                _scan_directory,
+                                path,
+                                rel_dir,
+                                include,
+                                exclude,
+                                follow_symlinks,
+                                False,
+                            )
+                        )
+                yield from files
+    finally:
+        # Also runs when the consumer stops early
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def get_image_files(
+    directory: str,
+    recursive: bool = False,
+    include: Optional[Sequence[str]] = None,
+    exclude: Optional[Sequence[str]] = None,
+) -> List[str]:
     """
     Get a list of image files in the specified directory.
     Supports common image extensions (.jpg, .jpeg, .png, .bmp, .gif, .webp).
 
     Args:
         directory (str): The path to the directory to search for images.
+        recursive (bool): Also search subdirectories.
+        include (Optional[Sequence[str]]): Glob patterns of files to keep,
+            see ``iter_image_files``.
+        exclude (Optional[Sequence[str]]): Glob patterns of files and
+            directories to skip.
 
     Returns:
         List[str]: A list of absolute paths to the found image files.
     """
-    image_extensions = {".jpg", ".jpeg", ".png", ".bmp", ".gif", ".webp"}
-    image_files = []
+    return list(
+        iter_image_files(
+            directory, recursive=recursive, include=include, exclude=exclude
+        )
+    )
 
-    path = Path(directory)
-    if not path.exists():
-        raise FileNotFoundError(f"Directory not found: {directory}")
 
-    # Iterate through files in the directory and filter by extension
-    for file in path.iterdir():
-        if file.suffix.lower() in image_extensions:
-            image_files.append(str(file.absolute()))
+def _umask() -> int:
+    """
+    Read the process umask without changing it; ``os.umask()`` can only
+    read it by setting it, which races with other threads.
+    """
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("Umask:"):
+                    return int(line.split()[1], 8)
+    except (OSError, ValueError):
+        pass
+    return 0o022
 
-    return image_files
 
+def _new_file_mode(output_file: str) -> int:
+    """
+    Permissions for a replacement of output_file: those of the existing
+    file, or what ``open()`` would give a new one.
+    """
+    try:
+        return stat.S_IMODE(os.stat(output_file).st_mode)
+    except OSError:
+        return 0o666 & ~_umask()
+
+
+@contextmanager
+def label_writer(
+    output_file: str,
+) -> Iterator[Callable[[Dict[str, Any]], None]]:
+    """
+    Write a label file one item at a time.
+
+    Yields a function that adds one labeled data dictionary. The file has
+    the layout of ``json.dump(items, f, indent=4)`` and is written through
+    a temporary file that replaces ``output_file`` when the block ends, so
+    a crash leaves either the old or the complete new file.
+
+    Args:
+        output_file (str): The path to the output JSON file.
+
+    Yields:
+        Callable[[Dict[str, Any]], None]: Adds one item to the file.
+    """
+    directory = os.path.dirname(os.path.abspath(output_file))
+    fd, tmp_path = tempfile.mkstemp(
+        dir=directory, prefix=".tmp-", suffix=".json"
+    )
+    try:
+        # mkstemp creates the file private; give it the usual permissions
+        os.chmod(tmp_path, _new_file_mode(output_file))
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            first = True
+
+            def write(item: Dict[str, Any]):
+                nonlocal first
+                f.write("[\n" if first else ",\n")
+                first = False
+                f.write(textwrap.indent(json.dumps(item, indent=4), "    "))
+
+            yield write
+            f.write("[]" if first else "\n]")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, output_file)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
 
-def save_labels(data: List[Dict[str, Any]], output_file: str):
+
+def save_labels(data: Iterable[Dict[str, Any]], output_file: str):
     """
     Save labeled data to a JSON file.
 
+    The file is replaced atomically; a crash while saving keeps the
+    previous version.
+
     Args:
-        data (List[Dict[str, Any]]): The list of labeled data dictionaries.
+        data (Iterable[Dict[str, Any]]): The labeled data dictionaries.
         output_file (str): The path to the output JSON file.
     """
-    with open(output_file, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=4)
+    with label_writer(output_file) as write:
+        for item in data:
+            write(item)
+
+
+def _project(
+    item: Dict[str, Any], fields: Optional[Sequence[str]]
+) -> Dict[str, Any]:
+    if fields is None:
+        return item
+    return {field: item[field] for field in fields if field in item}
+
+
+# Whitespace and commas between the items of a JSON array
+_SEPARATOR = re.compile(r"[\s,]*")
+
+
+def _iter_json_array(f: IO[str], chunk_size: int) -> Iterator[Dict[str, Any]]:
+    """
+    Decode the items of a JSON array one at a time from a text stream.
+    """
+    decoder = json.JSONDecoder()
+    buffer = f.read(chunk_size).lstrip()
+    # Leading whitespace may be longer than a chunk
+    while not buffer:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        buffer = chunk.lstrip()
+    if not buffer.startswith("["):
+        raise ValueError("Label file is not a JSON array")
+    position = 1
+    eof = False
+    while True:
+        # Skip whitespace and the separator before the next item
+        position = _SEPARATOR.match(buffer, position).end()
+        if position >= len(buffer):
+            if eof:
+                raise ValueError("Unexpected end of the label file")
+            buffer = f.read(chunk_size)
+            position = 0
+            eof = not buffer
+            continue
+        if buffer[position] == "]":
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # The item continues in the next chunk
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item
+        position = end
+        # A complete item followed by more data: drop the consumed part
+        if position > chunk_size:
+            buffer = buffer[position:]
+            position = 0
+
+
+def iter_labels(
+    input_file: str,
+    fields: Optional[Sequence[str]] = None,
+    chunk_size: int = 1024 * 1024,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Read a label file one record at a time.
+
+    Works with the ``labels.json`` array and with JSONL files (one record
+    per line, see ``LabelStore``); the format is detected from the first
+    character. Memory use does not depend on the file size, only on the
+    largest record. In JSONL files a truncated last line, left behind by a
+    crash while appending, is skipped.
+
+    Args:
+        input_file (str): The path to the label file.
+        fields (Optional[Sequence[str]]): Only keep these keys of each
+            record, e.g. ``("filename", "original_path", "label")``, so the
+            long descriptions are dropped as soon as a record is decoded.
+        chunk_size (int): Number of characters read at a time.
+
+    Yields:
+        Dict[str, Any]: The labeled data dictionaries in file order.
+    """
+    with open(input_file, "r", encoding="utf-8") as f:
+        start = f.read(1)
+        while start.isspace():
+            start = f.read(1)
+        f.seek(0)
+        if start == "[":
+            for item in _iter_json_array(f, chunk_size):
+                yield _project(item, fields)
+            return
+
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError:
+                if line.endswith("\n"):
+                    raise
+                # Torn write at the end of the file
+                continue
+            yield _project(item, fields)
+
+
+def _label_key(item: Dict[str, Any]) -> Optional[str]:
+    """
+    The image a label record belongs to.
+    """
+    return item.get("original_path") or item.get("filename")
+
+
+def iter_latest_labels(
+    input_file: str, fields: Optional[Sequence[str]] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Read a label file keeping only the last record of each image.
+
+    In a ``LabelStore`` journal a later record for the same image, keyed by
+    'original_path' (or 'filename'), supersedes earlier ones. The file is
+    read twice, so memory is needed for the keys only.
+
+    Args:
+        input_file (str): The path to the label file.
+        fields (Optional[Sequence[str]]): Only keep these keys of each
+            record, see ``iter_labels``.
+
+    Yields:
+        Dict[str, Any]: The current records, at the position of the last
+        record of their image.
+    """
+    last = {}
+    key_fields = ("original_path", "filename")
+    for position, item in enumerate(iter_labels(input_file, key_fields)):
+        last[_label_key(item)] = position
+    keep = set(last.values())
+    del last
+    for position, item in enumerate(iter_labels(input_file, fields)):
+        if position in keep:
+            yield item
 
 
 def load_labels(input_file: str) -> List[Dict[str, Any]]:
     """
-    Load labeled data from a JSON file.
+    Load labeled data from a JSON or JSONL (``.jsonl``) file.
 
     Args:
-        input_file (str): The path to the input JSON file.
+        input_file (str): The path to the input file.
 
     Returns:
         List[Dict[str, Any]]: The list of labeled data dictionaries, or
@@ -57,10 +455,218 @@ def load_labels(input_file: str) -> List[Dict[str, Any]]:
     if not os.path.exists(input_file):
         return []
 
+    if input_file.endswith(".jsonl"):
+        return list(iter_labels(input_file))
     with open(input_file, "r", encoding="utf-8") as f:
         return json.load(f)
 
 
+def _drop_torn_tail(path: str, chunk_size: int = 64 * 1024):
+    """
+    Cut a file after its last newline, removing a partially written line.
+    """
+    with open(path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(position - chunk_size, 0)
+            f.seek(start)
+            chunk = f.read(position - start)
+            newline = chunk.rfind(b"\n")
+            if newline != -1:
+                position = start + newline + 1
+                break
+            position = start
+        if position != end:
+            f.truncate(position)
+
+
+class LabelStore:
+    """
+    Append-only JSONL file of labeling results.
+
+    Each result is one line, written and flushed as soon as it is added,
+    so saving progress costs O(1) per image instead of rewriting the whole
+    label file. ``fsync`` is batched: it runs every ``sync_every`` records
+    or ``sync_interval`` seconds, whichever comes first, and on close; a
+    process crash loses nothing that was added, a power loss at most the
+    last batch.
+
+    A later record for the same image supersedes earlier ones; iterating
+    yields the current records only, and ``compact`` writes them in the
+    legacy ``labels.json`` format. The store can be shared between threads.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        truncate: bool = False,
+        sync_every: int = 64,
+        sync_interval: float = 1.0,
+    ):
+        """
+        Open (or create) the store for appending.
+
+        Args:
+            path (str): Path to the JSONL file.
+            truncate (bool): Drop the records already in the file; see
+                ``recover_labels`` to keep those of an interrupted run.
+            sync_every (int): Records between two fsyncs.
+            sync_interval (float): Maximum seconds between two fsyncs.
+        """
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+        ensure_directory(os.path.dirname(os.path.abspath(path)))
+        if not truncate and os.path.exists(path):
+            _drop_torn_tail(path)
+        self._file = open(path, "w" if truncate else "a", encoding="utf-8")
+
+    def append(self, item: Dict[str, Any]):
+        """
+        Add one labeling result.
+
+        Args:
+            item (Dict[str, Any]): The labeled data dictionary.
+        """
+        self.extend([item])
+
+    def extend(self, items: Iterable[Dict[str, Any]]):
+        """
+        Add several labeling results with a single write.
+
+        Args:
+            items (Iterable[Dict[str, Any]]): The labeled data dictionaries.
+        """
+        lines = [json.dumps(item) + "\n" for item in items]
+        with self._lock:
+            self._file.write("".join(lines))
+            self._file.flush()
+            self._unsynced += len(lines)
+            if (
+                self._unsynced >= self.sync_every
+                or time.monotonic() - self._last_sync >= self.sync_interval
+            ):
+                self._sync()
+
+    def _sync(self):
+        # Must be called with the lock held
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def flush(self):
+        """
+        Make all added results durable.
+        """
+        with self._lock:
+            self._file.flush()
+            self._sync()
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        """
+        Iterate over the current record of each image, see
+        ``iter_latest_labels``; ``iter_labels(store.path)`` also yields
+        the superseded ones.
+        """
+        with self._lock:
+            self._file.flush()
+        return iter_latest_labels(self.path)
+
+    def compact(self, output_file: str) -> int:
+        """
+        Write the current labels to a legacy ``labels.json`` file.
+
+        The output is replaced atomically, so a crash during compaction
+        leaves the previous file intact.
+
+        Args:
+            output_file (str): The path to the JSON file.
+
+        Returns:
+            int: The number of labels written.
+        """
+        count = 0
+
+        def _counted():
+            nonlocal count
+            for item in self:
+                count += 1
+                yield item
+
+        save_labels(_counted(), output_file)
+        return count
+
+    def close(self):
+        """
+        Sync and close the file.
+        """
+        with self._lock:
+            if not self._file.closed:
+                self._file.flush()
+                self._sync()
+                self._file.close()
+
+    def __enter__(self) -> "LabelStore":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def recover_labels(journal_file: str, labels_file: str) -> int:
+    """
+    Merge the records an interrupted run left in a ``LabelStore`` journal
+    into a label file.
+
+    A run writes the label file from its journal when it ends, so a
+    journal newer than the label file holds results of a run that crashed
+    before that. Call this before truncating the journal for a new run.
+    Journal records replace those of the same image in the label file,
+    which is replaced atomically.
+
+    Args:
+        journal_file (str): The path to the JSONL journal.
+        labels_file (str): The path to the ``labels.json`` file.
+
+    Returns:
+        int: The number of records recovered from the journal.
+    """
+    if not os.path.exists(journal_file):
+        return 0
+    if (
+        os.path.exists(labels_file)
+        and os.stat(labels_file).st_mtime_ns
+        >= os.stat(journal_file).st_mtime_ns
+    ):
+        return 0
+    keys = {
+        _label_key(item)
+        for item in iter_labels(journal_file, ("original_path", "filename"))
+    }
+    if not keys:
+        return 0
+
+    count = 0
+
+    def _merged():
+        nonlocal count
+        if os.path.exists(labels_file):
+            for item in iter_labels(labels_file):
+                if _label_key(item) not in keys:
+                    yield item
+        for item in iter_latest_labels(journal_file):
+            count += 1
+            yield item
+
+    save_labels(_merged(), labels_file)
+    return count
+
+
 def ensure_directory(directory: str):
     """
     Ensure a directory exists. Creates it if it doesn't.
@@ -69,3 +675,626 @@ def ensure_directory(directory: str):
         directory (str): The path to the directory.
     """
     os.makedirs(directory, exist_ok=True)
+
+
+def hash_file(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """
+    Compute the SHA-256 hash of a file's content.
+
+    Args:
+        file_path (str): The path to the file.
+        chunk_size (int): Number of bytes read at a time.
+
+    Returns:
+        str: The hexadecimal SHA-256 digest.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+_EXIF_ORIENTATION = 0x0112
+
+
+def probe_image(image_path: str) -> Dict[str, Any]:
+    """
+    Read the metadata of an image from its header, without decoding it.
+
+    Pillow only parses the header when opening a file, so this costs a
+    few small reads. Frames are not counted, as that seeks through the
+    whole file; for animations Pillow reads up to the second frame to
+    report 'animated'. A file with a valid header can still fail to decode
+    later, e.g. when it is truncated.
+
+    Args:
+        image_path (str): Path to the image file.
+
+    Returns:
+        Dict[str, Any]: The 'format', 'width', 'height', 'mode', whether it
+        is 'animated' and the EXIF 'orientation' (1 if absent) of the image,
+        or an 'error' message if it cannot be opened.
+    """
+    try:
+        with Image.open(image_path) as img:
+            return {
+                "format": img.format,
+                "width": img.size[0],
+                "height": img.size[1],
+                "mode": img.mode,
+                "animated": getattr(img, "is_animated", False),
+                "orientation": img.getexif().get(_EXIF_ORIENTATION, 1),
+            }
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+
+
+def probe_images(
+    image_paths: Sequence[str], workers: int = 8
+) -> List[Dict[str, Any]]:
+    """
+    Probe the headers of many images concurrently, see ``probe_image``.
+
+    Args:
+        image_paths (Sequence[str]): Paths to the image files.
+        workers (int): Number of files probed concurrently.
+
+    Returns:
+        List[Dict[str, Any]]: The metadata of each image, in input order.
+    """
+    if len(image_paths) < 2:
+        return [probe_image(path) for path in image_paths]
+    with ThreadPoolExecutor(
+        max_workers=workers, thread_name_prefix="probe"
+    ) as executor:
+        return list(executor.map(probe_image, image_paths))
+
+
+def probe_rejection(
+    probe: Dict[str, Any],
+    min_size: Optional[int] = None,
+    formats: Optional[Sequence[str]] = None,
+    max_aspect_ratio: Optional[float] = None,
+) -> Optional[str]:
+    """
+    Check probed image metadata against the prefilter limits.
+
+    Args:
+        probe (Dict[str, Any]): Metadata from ``probe_image``.
+        min_size (Optional[int]): Minimum width and height in pixels.
+        formats (Optional[Sequence[str]]): Accepted Pillow format names,
+            case-insensitive (e.g. "JPEG", "PNG").
+        max_aspect_ratio (Optional[float]): Maximum ratio of the longer to
+            the shorter side.
+
+    Returns:
+        Optional[str]: Why the image is rejected ("unreadable", "format",
+        "too_small" or "aspect_ratio"), or None if it passes.
+    """
+    if "error" in probe:
+        return "unreadable"
+    if formats and (probe["format"] or "").upper() not in {
+        f.upper() for f in formats
+    }:
+        return "format"
+    shorter = min(probe["width"], probe["height"])
+    if shorter <= 0 or (min_size and shorter < min_size):
+        return "too_small"
+    longer = max(probe["width"], probe["height"])
+    if max_aspect_ratio and longer / shorter > max_aspect_ratio:
+        return "aspect_ratio"
+    return None
+
+
+def prefilter_images(
+    image_paths: Sequence[str],
+    min_size: Optional[int] = None,
+    formats: Optional[Sequence[str]] = None,
+    max_aspect_ratio: Optional[float] = None,
+    workers: int = 8,
+    manifest: Optional["ScanManifest"] = None,
+) -> Tuple[List[str], Dict[str, str]]:
+    """
+    Drop unreadable images and images outside the given limits.
+
+    Only the image headers are read (see ``probe_image``), so broken or
+    unwanted files are skipped before any decoding or labeling.
+
+    Args:
+        image_paths (Sequence[str]): Paths to the image files.
+        min_size (Optional[int]): Minimum width and height in pixels.
+        formats (Optional[Sequence[str]]): Accepted Pillow format names.
+        max_aspect_ratio (Optional[float]): Maximum ratio of the longer to
+            the shorter side.
+        workers (int): Number of files probed concurrently.
+        manifest (Optional[ScanManifest]): Manifest caching the probe
+            results; only images it does not know yet are probed.
+
+    Returns:
+        Tuple[List[str], Dict[str, str]]: The accepted paths, in input
+        order, and the reason each rejected path was dropped.
+    """
+    if manifest is not None:
+        probes = manifest.probes(image_paths, workers=workers)
+        results = [probes[path] for path in image_paths]
+    else:
+        results = probe_images(image_paths, workers=workers)
+
+    accepted = []
+    rejected = {}
+    for path, probe in zip(image_paths, results):
+        reason = probe_rejection(probe, min_size, formats, max_aspect_ratio)
+        if reason is None:
+            accepted.append(path)
+        else:
+            rejected[path] = reason
+    return accepted, rejected
+
+
+# Directories modified this recently are listed again on the next scan: an
+# entry added in the same mtime tick would not change their mtime.
+_RACY_MTIME_NS = 2_000_000_000
+
+
+def _list_directory(
+    directory: str,
+    rel_dir: str,
+    known_mtime: Optional[int],
+    include: Optional[Sequence[str]],
+    exclude: Sequence[str],
+    strict: bool,
+) -> Tuple[
+    Optional[int],
+    Optional[List[Tuple[str, int, int]]],
+    List[Tuple[str, str, Optional[Tuple[int, int]]]],
+]:
+    """
+    List one directory for the manifest, unless its mtime is unchanged.
+
+    Returns:
+        Tuple: The directory mtime (None if it vanished), the
+        ``(path, size, mtime)`` of its images (None when the directory is
+        unchanged) and its subdirectories as in ``_scan_directory``.
+    """
+    try:
+        mtime = os.stat(directory).st_mtime_ns
+    except OSError:
+        if strict:
+            raise
+        return None, None, []
+    if mtime == known_mtime:
+        return mtime, None, []
+
+    paths, subdirs = _scan_directory(
+        directory, rel_dir, include, exclude, False, strict
+    )
+    files = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        files.append((path, stat.st_size, stat.st_mtime_ns))
+    return mtime, files, subdirs
+
+
+class ScanManifest:
+    """
+    Persistent record of the images in a directory tree (SQLite).
+
+    Stores the path, size, mtime and content hash of every image together
+    with its labeling status and result, so a rescan only reports what
+    changed since the last one:
+
+    - Directories whose mtime is unchanged are not listed again; only their
+      known subdirectories are checked. Adding, removing or renaming a file
+      updates the mtime of its directory, so the work of a rescan is
+      proportional to the number of changed directories.
+    - New files and files whose size or mtime changed are hashed; a file
+      only counts as modified if its content hash differs.
+
+    Header metadata from ``probe_image`` is cached per file as well and
+    dropped when the file is modified.
+
+    Editing a file in place does not change the mtime of its directory;
+    such edits are found by a scan with ``full=True``. The manifest can be
+    shared between threads.
+    """
+
+    def __init__(self, db_path: str):
+        """
+        Open (or create) the manifest database.
+
+        Args:
+            db_path (str): Path to the SQLite database file.
+        """
+        self.db_path = db_path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, "
+            "parent TEXT NOT NULL, "
+            "size INTEGER NOT NULL, "
+            "mtime INTEGER NOT NULL, "
+            "hash TEXT NOT NULL, "
+            "status TEXT NOT NULL, "
+            "result TEXT, "
+            "probe TEXT)"
+        )
+        columns = [
+            row[1] for row in self._conn.execute("PRAGMA table_info(files)")
+        ]
+        if "probe" not in columns:
+            # Manifests written before probing was added
+            self._conn.execute("ALTER TABLE files ADD COLUMN probe TEXT")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS files_parent ON files (parent)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS dirs ("
+            "path TEXT PRIMARY KEY, "
+            "parent TEXT, "
+            "mtime INTEGER)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS scans ("
+            "root TEXT PRIMARY KEY, "
+            "options TEXT NOT NULL, "
+            "scanned REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _subtree(root: str) -> Tuple[str, str, str]:
+        # Paths below root sort between root + sep and the next character
+        return root, root + os.sep, root + chr(ord(os.sep) + 1)
+
+    def scan(
+        self,
+        directory: str,
+        recursive: bool = True,
+        include: Optional[Sequence[str]] = None,
+        exclude: Optional[Sequence[str]] = None,
+        full: bool = False,
+        workers: int = 8,
+    ) -> Dict[str, Any]:
+        """
+        Update the manifest from the directory and report the changes.
+
+        Args:
+            directory (str): The root directory to scan.
+            recursive (bool): Descend into subdirectories.
+            include (Optional[Sequence[str]]): Glob patterns of files to
+                keep, see ``iter_image_files``.
+            exclude (Optional[Sequence[str]]): Glob patterns of files and
+                directories to skip.
+            full (bool): List every directory, even those whose mtime is
+                unchanged, to also find files edited in place. Scans with
+                other options than the previous one are always full.
+            workers (int): Number of directories listed and files hashed
+                concurrently.
+
+        Returns:
+            Dict[str, Any]: The absolute paths of the 'new', 'modified' and
+            'deleted' images, the number of 'unchanged' images and the
+            number of directories skipped because their mtime did not
+            change ('skipped_dirs').
+
+        Raises:
+            FileNotFoundError: If ``directory`` does not exist.
+        """
+        root = os.path.abspath(directory)
+        if not os.path.isdir(root):
+            raise FileNotFoundError(f"Directory not found: {directory}")
+        exclude = list(exclude or [])
+        include = list(include) if include else None
+        options = json.dumps(
+            {"recursive": recursive, "include": include, "exclude": exclude}
+        )
+        subtree = self._subtree(root)
+        started = time.time_ns()
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT options FROM scans WHERE root = ?", (root,)
+            ).fetchone()
+            full = full or row is None or row[0] != options
+            known_dirs = {}
+            children: Dict[str, List[str]] = {}
+            for path, parent, mtime in self._conn.execute(
+                "SELECT path, parent, mtime FROM dirs "
+                "WHERE path = ? OR (path >= ? AND path < ?)",
+                subtree,
+            ):
+                known_dirs[path] = mtime
+                if path != root:
+                    children.setdefault(parent, []).append(path)
+
+        new: List[str] = []
+        deleted: List[str] = []
+        # (path, size, mtime, known hash or None)
+        to_hash: List[Tuple[str, int, int, Optional[str]]] = []
+        # Directory -> mtime to record; None lists it again next time
+        seen_dirs: Dict[str, Optional[int]] = {}
+        skipped_dirs = 0
+
+        def submit(path: str):
+            seen_dirs[path] = None
+            rel_dir = os.path.relpath(path, root).replace(os.sep, "/")
+            rel_dir = "" if rel_dir == "." else rel_dir + "/"
+            known = None if full else known_dirs.get(path)
+            pending[
+                executor.submit(
+                    _list_directory,
+                    path,
+                    rel_dir,
+                    known,
+                    include,
+                    exclude,
+                    path == root,
+                )
+            ] = path
+
+        executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="manifest"
+        )
+        pending = {}
+        try:
+            submit(root)
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path = pending.pop(future)
+                    mtime, files, subdirs = future.result()
+                    if mtime is None:
+                        # Removed while scanning
+                        del seen_dirs[path]
+                        continue
+                    if mtime < started - _RACY_MTIME_NS:
+                        seen_dirs[path] = mtime
+                    if files is None:
+                        skipped_dirs += 1
+                        if recursive:
+                            for child in children.get(path, []):
+                                submit(child)
+                        continue
+
+                    with self._lock:
+                        known_files = {
+                            file_path: (size, file_mtime, file_hash)
+                            for file_path, size, file_mtime, file_hash in (
+                                self._conn.execute(
+                                    "SELECT path, size, mtime, hash "
+                                    "FROM files WHERE parent = ?",
+                                    (path,),
+                                )
+                            )
+                        }
+                    for file_path, size, file_mtime in files:
+                        known = known_files.pop(file_path, None)
+                        if known is None:
+                            to_hash.append((file_path, size, file_mtime, None))
+                        elif known[:2] != (size, file_mtime):
+                            to_hash.append(
+                                (file_path, size, file_mtime, known[2])
+                            )
+                    deleted.extend(known_files)
+                    if recursive:
+                        for subdir, _, _ in subdirs:
+                            submit(subdir)
+
+            hashes = list(
+                executor.map(lambda item: _try_hash(item[0]), to_hash)
+            )
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        modified: List[str] = []
+        for (path, _, _, _), file_hash in zip(to_hash, hashes):
+            if file_hash is None:
+                # Unreadable for now; list its directory again next time
+                seen_dirs[os.path.dirname(path)] = None
+        with self._lock:
+            # Directories that are gone or no longer scanned
+            gone_dirs = [path for path in known_dirs if path not in seen_dirs]
+            for path in gone_dirs:
+                deleted.extend(
+                    file_path
+                    for (file_path,) in self._conn.execute(
+                        "SELECT path FROM files WHERE parent = ?", (path,)
+                    )
+                )
+            self._conn.executemany(
+                "DELETE FROM dirs WHERE path = ?", [(p,) for p in gone_dirs]
+            )
+            self._conn.executemany(
+                "DELETE FROM files WHERE path = ?", [(p,) for p in deleted]
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO dirs (path, parent, mtime) "
+                "VALUES (?, ?, ?)",
+                [
+                    (path, os.path.dirname(path), mtime)
+                    for path, mtime in seen_dirs.items()
+                ],
+            )
+
+            for (path, size, mtime, known_hash), file_hash in zip(
+                to_hash, hashes
+            ):
+                if file_hash is None:
+                    continue
+                if known_hash is None:
+                    new.append(path)
+                elif file_hash != known_hash:
+                    modified.append(path)
+                else:
+                    # Touched, same content: keep the label
+                    self._conn.execute(
+                        "UPDATE files SET size = ?, mtime = ? WHERE path = ?",
+                        (size, mtime, path),
+                    )
+                    continue
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO files "
+                    "(path, parent, size, mtime, hash, status, result) "
+                    "VALUES (?, ?, ?, ?, ?, 'pending', NULL)",
+                    (path, os.path.dirname(path), size, mtime, file_hash),
+                )
+
+            self._conn.execute(
+                "INSERT OR REPLACE INTO scans (root, options, scanned) "
+                "VALUES (?, ?, ?)",
+                (root, options, time.time()),
+            )
+            self._conn.commit()
+            total = self._conn.execute(
+                "SELECT COUNT(*) FROM files WHERE path >= ? AND path < ?",
+                subtree[1:],
+            ).fetchone()[0]
+
+        return {
+            "new": new,
+            "modified": modified,
+            "deleted": deleted,
+            "unchanged": total - len(new) - len(modified),
+            "skipped_dirs": skipped_dirs,
+        }
+
+    def paths(self, directory: str, pending_only: bool = False) -> List[str]:
+        """
+        Get the images recorded below a directory.
+
+        Args:
+            directory (str): The scanned root directory.
+            pending_only (bool): Only images without a label, i.e. new,
+                modified or failed ones and those not labeled yet.
+
+        Returns:
+            List[str]: Absolute image paths, sorted.
+        """
+        query = "SELECT path FROM files WHERE path >= ? AND path < ?"
+        if pending_only:
+            query += " AND status != 'labeled'"
+        with self._lock:
+            rows = self._conn.execute(
+                query + " ORDER BY path",
+                self._subtree(os.path.abspath(directory))[1:],
+            ).fetchall()
+        return [path for (path,) in rows]
+
+    def probes(
+        self, image_paths: Sequence[str], workers: int = 8
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Get the header metadata of images, probing only uncached ones.
+
+        Results are stored for images recorded in the manifest; other
+        images are probed but not cached.
+
+        Args:
+            image_paths (Sequence[str]): Paths to the image files.
+            workers (int): Number of files probed concurrently.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: The ``probe_image`` result per path.
+        """
+        keys = {path: os.path.abspath(path) for path in image_paths}
+        cached: Dict[str, Dict[str, Any]] = {}
+        unique = list(dict.fromkeys(keys.values()))
+        with self._lock:
+            # Stay below SQLite's limit of bound parameters
+            for start in range(0, len(unique), 500):
+                end = start + 500
+                chunk = unique[start:end]
+                cached.update(
+                    (path, json.loads(probe))
+                    for path, probe in self._conn.execute(
+                        "SELECT path, probe FROM files "
+                        "WHERE probe IS NOT NULL "
+                        f"AND path IN ({','.join('?' * len(chunk))})",
+                        chunk,
+                    )
+                )
+
+        # Probes cached before 'animated' replaced 'frames' are redone
+        missing = [
+            path
+            for path in unique
+            if path not in cached or "frames" in cached[path]
+        ]
+        if missing:
+            probed = probe_images(missing, workers=workers)
+            cached.update(zip(missing, probed))
+            with self._lock:
+                self._conn.executemany(
+                    "UPDATE files SET probe = ? WHERE path = ?",
+                    [
+                        (json.dumps(probe), path)
+                        for path, probe in zip(missing, probed)
+                    ],
+                )
+                self._conn.commit()
+        return {path: cached[key] for path, key in keys.items()}
+
+    def mark(self, results: Sequence[Dict[str, Any]]):
+        """
+        Record labeling results.
+
+        Results with the label "error" leave the image pending, so it is
+        labeled again after the next scan.
+
+        Args:
+            results (Sequence[Dict[str, Any]]): Labeling results, each with
+                the 'original_path' of its image.
+        """
+        rows = []
+        for result in results:
+            status = "error" if result.get("label") == "error" else "labeled"
+            path = os.path.abspath(result["original_path"])
+            rows.append((status, json.dumps(result), path))
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE files SET status = ?, result = ? WHERE path = ?", rows
+            )
+            self._conn.commit()
+
+    def labels(self, directory: str) -> List[Dict[str, Any]]:
+        """
+        Get the stored labeling results of the images below a directory.
+
+        Args:
+            directory (str): The scanned root directory.
+
+        Returns:
+            List[Dict[str, Any]]: The results, sorted by image path.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT result FROM files "
+                "WHERE path >= ? AND path < ? AND result IS NOT NULL "
+                "ORDER BY path",
+                self._subtree(os.path.abspath(directory))[1:],
+            ).fetchall()
+        return [json.loads(result) for (result,) in rows]
+
+    def close(self):
+        """
+        Close the underlying database connection.
+        """
+        with self._lock:
+            self._conn.close()
+
+
+def _try_hash(file_path: str) -> Optional[str]:
+    try:
+        return hash_file(file_path)
+    except OSError:
+        return None
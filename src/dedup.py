@@ -0,0 +1,203 @@
+import copy
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+
+def _load_gray(image_path: str, hash_size: int) -> Optional[np.ndarray]:
+    """
+    Load an image as a (hash_size, hash_size + 1) grayscale array.
+
+    Args:
+        image_path (str): Path to the image file.
+        hash_size (int): Number of rows of the hash grid.
+
+    Returns:
+        Optional[np.ndarray]: The pixel array, or None if the image cannot
+        be read.
+    """
+    try:
+        with Image.open(image_path) as img:
+            # Decode JPEGs at the smallest scale the decoder offers
+            img.draft("L", (hash_size * 8, hash_size * 8))
+            small = img.convert("L").resize(
+                (hash_size + 1, hash_size), Image.Resampling.BILINEAR
+            )
+            return np.asarray(small, dtype=np.int16)
+    except Exception:
+        return None
+
+
+def compute_dhashes(
+    image_paths: List[str], hash_size: int = 8, workers: int = 8
+) -> List[Optional[int]]:
+    """
+    Compute the difference hash (dHash) of many images.
+
+    Images are shrunk to a (hash_size + 1) x hash_size grayscale grid in a
+    thread pool; the gradient comparison and bit packing then run as NumPy
+    operations over all images at once.
+
+    Args:
+        image_paths (List[str]): Paths to the image files.
+        hash_size (int): Side of the hash grid; the hash has
+            ``hash_size ** 2`` bits (64 by default).
+        workers (int): Number of threads loading images.
+
+    Returns:
+        List[Optional[int]]: One hash per image, None for unreadable images.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        grids = list(
+            executor.map(lambda p: _load_gray(p, hash_size), image_paths)
+        )
+
+    valid = [i for i, grid in enumerate(grids) if grid is not None]
+    hashes: List[Optional[int]] = [None] * len(image_paths)
+    if not valid:
+        return hashes
+
+    stack = np.stack([grids[i] for i in valid])
+    # One bit per horizontal neighbour pair: is the right pixel brighter?
+    bits = (stack[:, :, 1:] > stack[:, :, :-1]).reshape(len(valid), -1)
+    packed = np.packbits(bits, axis=1)
+    for i, row in zip(valid, packed):
+        hashes[i] = int.from_bytes(row.tobytes(), "big")
+    return hashes
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """
+    Number of differing bits between two hashes.
+    """
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over hashes with the Hamming distance.
+
+    Finding all hashes within a small distance of a query only visits the
+    subtrees whose edge distance is compatible with the triangle
+    inequality, which keeps lookups sub-linear for large collections.
+    """
+
+    def __init__(self):
+        # A node is [hash, items, {distance: child node}]
+        self._root = None
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, hash_value: int, item: Any):
+        """
+        Insert an item under its hash.
+
+        Args:
+            hash_value (int): The perceptual hash.
+            item (Any): The value returned by ``search``.
+        """
+        self._size += 1
+        if self._root is None:
+            self._root = [hash_value, [item], {}]
+            return
+
+        node = self._root
+        while True:
+            distance = hamming_distance(hash_value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [hash_value, [item], {}]
+                return
+            node = child
+
+    def search(self, hash_value: int, max_distance: int) -> List[Tuple]:
+        """
+        Find all items within max_distance of a hash.
+
+        Args:
+            hash_value (int): The query hash.
+            max_distance (int): Maximum Hamming distance.
+
+        Returns:
+            List[Tuple]: ``(distance, item)`` pairs sorted by distance.
+        """
+        results = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(hash_value, node[0])
+            if distance <= max_distance:
+                results.extend((distance, item) for item in node[1])
+            low, high = distance - max_distance, distance + max_distance
+            for edge, child in node[2].items():
+                if low <= edge <= high:
+                    stack.append(child)
+        results.sort(key=lambda pair: pair[0])
+        return results
+
+
+def group_near_duplicates(
+    image_paths: List[str], max_distance: int, hash_size: int = 8
+) -> Dict[str, Tuple[str, int]]:
+    """
+    Assign near-duplicate images to a representative image.
+
+    Images are visited in order; an image within ``max_distance`` of an
+    earlier representative is assigned to the closest one, otherwise it
+    becomes a representative itself. Unreadable images are always
+    representatives so they are reported by the labeler as usual.
+
+    Args:
+        image_paths (List[str]): Paths to the image files.
+        max_distance (int): Maximum Hamming distance between duplicates.
+        hash_size (int): Side of the dHash grid.
+
+    Returns:
+        Dict[str, Tuple[str, int]]: Maps each duplicate path to its
+        representative path and their Hamming distance. Representatives
+        are not included.
+    """
+    hashes = compute_dhashes(image_paths, hash_size=hash_size)
+    tree = BKTree()
+    duplicates = {}
+    for image_path, hash_value in zip(image_paths, hashes):
+        if hash_value is None:
+            continue
+        matches = tree.search(hash_value, max_distance)
+        if matches:
+            distance, representative = matches[0]
+            duplicates[image_path] = (representative, distance)
+        else:
+            tree.add(hash_value, image_path)
+    return duplicates
+
+
+def propagate_label(
+    result: Dict[str, Any], representative: str, distance: int
+) -> Dict[str, Any]:
+    """
+    Derive the label of a near-duplicate from its representative's label.
+
+    Args:
+        result (Dict[str, Any]): The label of the representative image.
+        representative (str): Path of the representative image.
+        distance (int): Hamming distance between the two images.
+
+    Returns:
+        Dict[str, Any]: A copy of the label recording where it came from.
+    """
+    propagated = {
+        key: copy.deepcopy(value)
+        for key, value in result.items()
+        if key not in ("filename", "original_path")
+    }
+    propagated["propagated_from"] = representative
+    propagated["hash_distance"] = distance
+    return propagated
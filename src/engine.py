@@ -0,0 +1,88 @@
+import functools
+import itertools
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .labeler import backend_pool, label_image, label_image_batch
+
+
+def label_images(
+    image_paths: Iterable[str],
+    max_in_flight: Optional[int] = None,
+    progress_callback: Optional[callable] = None,
+    batch_size: int = 1,
+    **label_kwargs: Any,
+) -> Iterator[Tuple[int, str, Dict[str, Any]]]:
+    """
+    Label many images while keeping a bounded number of requests in flight.
+
+    Paths are consumed lazily from ``image_paths``; at most ``max_in_flight``
+    requests are open at any time. Results are yielded in completion
+    order, each tagged with the position of the image in the input so that
+    callers can restore the original order.
+
+    Args:
+        image_paths (Iterable[str]): Paths of the images to label.
+        max_in_flight (Optional[int]): Maximum number of concurrent
+            requests. Defaults to the maximum capacity of the backend
+            pool.
+        progress_callback (Optional[callable]): Called as
+            ``progress_callback(image_path, percent, message)`` from the
+            worker threads. Not called in batch mode.
+        batch_size (int): Number of images sent per request. Values above 1
+            use ``label_image_batch``.
+        **label_kwargs: Extra keyword arguments passed to ``label_image``
+            (e.g. ``prompt`` or ``max_size``).
+
+    Yields:
+        Tuple[int, str, Dict[str, Any]]: ``(index, image_path, result)`` for
+        each image as soon as its label is available.
+    """
+    if max_in_flight is None:
+        max_in_flight = backend_pool.max_capacity
+    if max_in_flight < 1:
+        raise ValueError("max_in_flight must be at least 1")
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+
+    def _label(chunk: List[Tuple[int, str]]) -> List[Dict[str, Any]]:
+        if batch_size > 1:
+            return label_image_batch(
+                [image_path for _, image_path in chunk], **label_kwargs
+            )
+
+        image_path = chunk[0][1]
+        callback = (
+            functools.partial(progress_callback, image_path)
+            if progress_callback
+            else None
+        )
+        return [
+            label_image(image_path, progress_callback=callback, **label_kwargs)
+        ]
+
+    indexed_paths = enumerate(image_paths)
+    chunks = iter(
+        lambda: list(itertools.islice(indexed_paths, batch_size)), []
+    )
+    executor = ThreadPoolExecutor(
+        max_workers=max_in_flight, thread_name_prefix="labeler"
+    )
+    in_flight = {}
+    try:
+        # Fill the window, then top it up each time a request completes
+        for chunk in itertools.islice(chunks, max_in_flight):
+            in_flight[executor.submit(_label, chunk)] = chunk
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                chunk = in_flight.pop(future)
+                for next_chunk in itertools.islice(chunks, 1):
+                    in_flight[executor.submit(_label, next_chunk)] = next_chunk
+                for (index, image_path), result in zip(chunk, future.result()):
+                    yield index, image_path, result
+    finally:
+        # Runs on normal exit and when the consumer stops iterating early;
+        # requests that were not started yet are dropped.
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,285 @@
+import os
+import json
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .data_loader import iter_labels
+
+
+def _fts_query(text: str) -> str:
+    """
+    Turn free text into an FTS5 query matching all of its words.
+
+    Every word is quoted, so characters with a meaning in the FTS5 query
+    syntax (``-``, ``*``, ``:``, ...) are searched for literally.
+    """
+    words = text.split()
+    return " ".join('"' + word.replace('"', '""') + '"' for word in words)
+
+
+class LabelDatabase:
+    """
+    Indexed SQLite store of labeling results.
+
+    Labels are keyed by 'original_path' (or 'filename' when there is no
+    path); adding a label for the same image replaces the previous one.
+    Queries by label, tag, filename and path use indexes, tags live in a
+    normalized join table and descriptions are searched with a full-text
+    index (SQLite FTS5), so filtering hundreds of thousands of labels does
+    not need to load them all. The database can be shared between threads.
+    """
+
+    def __init__(self, db_path: str):
+        """
+        Open (or create) the label database.
+
+        Args:
+            db_path (str): Path to the SQLite database file.
+        """
+        self.db_path = db_path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS labels (
+                id INTEGER PRIMARY KEY,
+                original_path TEXT NOT NULL UNIQUE,
+                filename TEXT,
+                label TEXT COLLATE NOCASE,
+                description TEXT,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS labels_label ON labels (label);
+            CREATE INDEX IF NOT EXISTS labels_filename ON labels (filename);
+            CREATE TABLE IF NOT EXISTS tags (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE
+            );
+            CREATE TABLE IF NOT EXISTS label_tags (
+                tag_id INTEGER NOT NULL REFERENCES tags (id),
+                label_id INTEGER NOT NULL
+                    REFERENCES labels (id) ON DELETE CASCADE,
+                PRIMARY KEY (tag_id, label_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS label_tags_label
+                ON label_tags (label_id);
+            CREATE VIRTUAL TABLE IF NOT EXISTS descriptions USING fts5 (
+                description, content='labels', content_rowid='id'
+            );
+            CREATE TRIGGER IF NOT EXISTS labels_ai AFTER INSERT ON labels
+            BEGIN
+                INSERT INTO descriptions (rowid, description)
+                VALUES (new.id, new.description);
+            END;
+            CREATE TRIGGER IF NOT EXISTS labels_ad AFTER DELETE ON labels
+            BEGIN
+                INSERT INTO descriptions (descriptions, rowid, description)
+                VALUES ('delete', old.id, old.description);
+            END;
+            """)
+        self._conn.commit()
+
+    def add(self, items: Iterable[Dict[str, Any]]) -> int:
+        """
+        Add labeling results, replacing earlier labels of the same images.
+
+        Args:
+            items (Iterable[Dict[str, Any]]): Labeled data dictionaries as
+                written to ``labels.json``; read once.
+
+        Returns:
+            int: The number of labels added.
+        """
+        count = 0
+        with self._lock:
+            tag_ids: Dict[str, int] = {}
+            for item in items:
+                key = item.get("original_path") or item.get("filename")
+                if not key:
+                    continue
+                # Replacing deletes the old row, its tags and its FTS entry
+                self._conn.execute(
+                    "DELETE FROM labels WHERE original_path = ?", (key,)
+                )
+                label_id = self._conn.execute(
+                    "INSERT INTO labels "
+                    "(original_path, filename, label, description, data) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (
+                        key,
+                        item.get("filename") or os.path.basename(key),
+                        item.get("label"),
+                        item.get("description") or "",
+                        json.dumps(item),
+                    ),
+                ).lastrowid
+                tags = {
+                    str(tag).strip().lower()
+                    for tag in item.get("tags") or []
+                    if str(tag).strip()
+                }
+                for tag in tags:
+                    if tag not in tag_ids:
+                        self._conn.execute(
+                            "INSERT OR IGNORE INTO tags (name) VALUES (?)",
+                            (tag,),
+                        )
+                        tag_ids[tag] = self._conn.execute(
+                            "SELECT id FROM tags WHERE name = ?", (tag,)
+                        ).fetchone()[0]
+                self._conn.executemany(
+                    "INSERT INTO label_tags (tag_id, label_id) VALUES (?, ?)",
+                    [(tag_ids[tag], label_id) for tag in tags],
+                )
+                count += 1
+            self._conn.commit()
+        return count
+
+    def import_file(self, labels_file: str) -> int:
+        """
+        Add the labels of a ``labels.json`` or ``labels.jsonl`` file.
+
+        Args:
+            labels_file (str): Path to the label file.
+
+        Returns:
+            int: The number of labels added.
+        """
+        return self.add(iter_labels(labels_file))
+
+    @staticmethod
+    def _where(
+        label: Optional[str],
+        tags: Optional[Sequence[str]],
+        filename: Optional[str],
+        path_prefix: Optional[str],
+        text: Optional[str],
+    ) -> Tuple[str, List[Any]]:
+        conditions = []
+        params: List[Any] = []
+        if label is not None:
+            conditions.append("labels.label = ?")
+            params.append(label)
+        for tag in tags or []:
+            conditions.append(
+                "labels.id IN (SELECT label_id FROM label_tags "
+                "JOIN tags ON tags.id = label_tags.tag_id WHERE tags.name = ?)"
+            )
+            params.append(tag.strip().lower())
+        if filename is not None:
+            conditions.append("labels.filename = ?")
+            params.append(filename)
+        if path_prefix is not None:
+            # Range on the unique index instead of LIKE
+            conditions.append(
+                "labels.original_path >= ? AND labels.original_path < ?"
+            )
+            params.extend([path_prefix, path_prefix + "\U0010ffff"])
+        if text is not None and text.strip():
+            conditions.append(
+                "labels.id IN (SELECT rowid FROM descriptions "
+                "WHERE descriptions MATCH ?)"
+            )
+            params.append(_fts_query(text))
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        return where, params
+
+    def query(
+        self,
+        label: Optional[str] = None,
+        tags: Optional[Sequence[str]] = None,
+        filename: Optional[str] = None,
+        path_prefix: Optional[str] = None,
+        text: Optional[str] = None,
+        limit: int = 100,
+        offset: int = 0,
+    ) -> List[Dict[str, Any]]:
+        """
+        Find labels matching all given filters.
+
+        Args:
+            label (Optional[str]): The label, case-insensitive.
+            tags (Optional[Sequence[str]]): Tags that must all be present,
+                case-insensitive.
+            filename (Optional[str]): The image file name.
+            path_prefix (Optional[str]): Start of the original path, e.g. a
+                directory.
+            text (Optional[str]): Words that must all occur in the
+                description.
+            limit (int): Maximum number of labels returned.
+            offset (int): Number of matching labels skipped, for paging.
+
+        Returns:
+            List[Dict[str, Any]]: The labeled data dictionaries, ordered by
+            original path.
+        """
+        where, params = self._where(label, tags, filename, path_prefix, text)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM labels"
+                + where
+                + " ORDER BY original_path LIMIT ? OFFSET ?",
+                params + [limit, offset],
+            ).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def count(
+        self,
+        label: Optional[str] = None,
+        tags: Optional[Sequence[str]] = None,
+        filename: Optional[str] = None,
+        path_prefix: Optional[str] = None,
+        text: Optional[str] = None,
+    ) -> int:
+        """
+        Count the labels matching all given filters (see ``query``).
+
+        Returns:
+            int: The number of matching labels.
+        """
+        where, params = self._where(label, tags, filename, path_prefix, text)
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM labels" + where, params
+            ).fetchone()[0]
+
+    def label_counts(self) -> Dict[str, int]:
+        """
+        Count the images per label.
+
+        Returns:
+            Dict[str, int]: Number of images per label, most frequent first.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT label, COUNT(*) AS n FROM labels "
+                "GROUP BY label ORDER BY n DESC, label"
+            ).fetchall()
+        return dict(rows)
+
+    def tag_counts(self) -> Dict[str, int]:
+        """
+        Count the images per tag.
+
+        Returns:
+            Dict[str, int]: Number of images per tag, most frequent first.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT tags.name, COUNT(*) AS n FROM label_tags "
+                "JOIN tags ON tags.id = label_tags.tag_id "
+                "GROUP BY tags.name ORDER BY n DESC, tags.name"
+            ).fetchall()
+        return dict(rows)
+
+    def close(self):
+        """
+        Close the underlying database connection.
+        """
+        with self._lock:
+            self._conn.close()
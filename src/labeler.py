@@ -1,50 +1,597 @@
 import os
+import asyncio
 import base64
 import json
-from typing import Dict, Any, Optional
-from openai import OpenAI
+import hashlib
+import math
+import re
+import time
+from collections import deque
+from typing import (
+    Dict,
+    Any,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
 from dotenv import load_dotenv
 import threading
+from concurrent.futures import ThreadPoolExecutor
+from .backends import is_backend_failure, pool_from_env
+from .cache import LabelCache, ThumbnailCache
+from .data_loader import hash_file
+from .metrics import metrics
 
 # Load environment variables
 load_dotenv()
 
 LM_STUDIO_URL = os.getenv("LM_STUDIO_URL", "http://127.0.0.1:1234/v1")
 LM_STUDIO_MODEL = os.environ["LM_STUDIO_MODEL"]
+# Number of requests each inference server can work on at once (e.g. the
+# number of parallel slots configured in LM Studio).
+LM_STUDIO_MAX_IN_FLIGHT = int(os.getenv("LM_STUDIO_MAX_IN_FLIGHT", "1"))
 
-client = OpenAI(base_url=LM_STUDIO_URL, api_key="lm-studio")
-model_lock = threading.Lock()
+# All requests are routed through this pool. It holds the server from
+# LM_STUDIO_URL, or every server listed in LM_STUDIO_URLS.
+backend_pool = pool_from_env(
+    LM_STUDIO_URL, LM_STUDIO_MODEL, LM_STUDIO_MAX_IN_FLIGHT
+)
+
+# Persistent cache of labeling results, see get_label_cache()
+LABEL_CACHE_ENABLED = os.getenv("LABEL_CACHE_ENABLED", "1") != "0"
+LABEL_CACHE_PATH = os.getenv(
+    "LABEL_CACHE_PATH",
+    os.path.join(
+        os.path.expanduser("~"), ".cache", "image_labeler", "labels.db"
+    ),
+)
+LABEL_CACHE_MAX_ENTRIES = int(os.getenv("LABEL_CACHE_MAX_ENTRIES", "100000"))
+_label_cache = None
+_label_cache_lock = threading.Lock()
+
+# Disk cache of resized JPEGs, see get_thumbnail_cache()
+THUMBNAIL_CACHE_ENABLED = os.getenv("THUMBNAIL_CACHE_ENABLED", "1") != "0"
+THUMBNAIL_CACHE_DIR = os.getenv(
+    "THUMBNAIL_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "image_labeler", "thumbs"),
+)
+THUMBNAIL_CACHE_MAX_BYTES = int(
+    os.getenv("THUMBNAIL_CACHE_MAX_BYTES", str(1024 * 1024 * 1024))
+)
+_thumbnail_cache = None
+
+SYSTEM_PROMPT = (
+    "You are a helpful assistant that labels images. "
+    "Always output in JSON format."
+)
+
+# Bump whenever the prompt format or the schema below changes so that cached
+# labels produced by an older version are not reused
+LABEL_SCHEMA_VERSION = 1
+
+# JSON Schema for structured output
+# This schema enforces the model to return a valid JSON object with specific
+# fields
+LABEL_JSON_SCHEMA = {
+    "name": "image_label_response",
+    "strict": "true",
+    "schema": {
+        "type": "object",
+        "properties": {
+            "label": {
+                "type": "string",
+                "description": "A short, concise label for the image.",
+            },
+            "description": {
+                "type": "string",
+                "description": "A detailed description of the image content.",
+            },
+            "tags": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "A list of relevant tags.",
+            },
+        },
+        "required": ["label", "description", "tags"],
+    },
+}
+
+# Schema for labeling several images with one request: one entry per image,
+# tagged with the position of the image in the request
+BATCH_LABEL_JSON_SCHEMA = {
+    "name": "image_batch_label_response",
+    "strict": "true",
+    "schema": {
+        "type": "object",
+        "properties": {
+            "results": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "index": {
+                            "type": "integer",
+                            "description": "The number of the image.",
+                        },
+                        **LABEL_JSON_SCHEMA["schema"]["properties"],
+                    },
+                    "required": ["index", "label", "description", "tags"],
+                },
+            },
+        },
+        "required": ["results"],
+    },
+}
+
+# Schema of the resolution cascade: the label fields plus the confidence of
+# the model, which decides whether the image is retried at a higher resolution
+CASCADE_LABEL_JSON_SCHEMA = {
+    "name": "image_label_confidence_response",
+    "strict": "true",
+    "schema": {
+        "type": "object",
+        "properties": {
+            **LABEL_JSON_SCHEMA["schema"]["properties"],
+            "confidence": {
+                "type": "number",
+                "minimum": 0,
+                "maximum": 1,
+                "description": "How confident you are in the label, 0 to 1.",
+            },
+        },
+        "required": ["label", "description", "tags", "confidence"],
+    },
+}
+
+# Resolutions tried by the cascade, from cheapest to most detailed
+DEFAULT_CASCADE = (256, 512, 1024)
+# Cascade answers below this confidence are retried at the next resolution
+CASCADE_MIN_CONFIDENCE = float(os.getenv("CASCADE_MIN_CONFIDENCE", "0.6"))
+# Cascade answers whose description has fewer words are too vague to keep
+CASCADE_MIN_DESCRIPTION_WORDS = 5
+# Labels that say nothing about the content of the image
+GENERIC_LABELS = {
+    "",
+    "image",
+    "photo",
+    "photograph",
+    "picture",
+    "object",
+    "thing",
+    "scene",
+    "unknown",
+    "other",
+    "none",
+    "n/a",
+    "unclear",
+    "blurry",
+}
 
 
 import io
 from PIL import Image
 
 
-def encode_image(image_path: str, max_size: int = 256) -> str:
+def get_thumbnail_cache() -> Optional[ThumbnailCache]:
     """
-    Encode an image file to a base64 string, resizing if necessary.
+    Get the shared thumbnail cache, opening it on first use.
+
+    Returns:
+        Optional[ThumbnailCache]: The cache, or None if caching is disabled
+        via ``THUMBNAIL_CACHE_ENABLED=0``.
+    """
+    global _thumbnail_cache
+    if not THUMBNAIL_CACHE_ENABLED:
+        return None
+    with _label_cache_lock:
+        if _thumbnail_cache is None:
+            _thumbnail_cache = ThumbnailCache(
+                THUMBNAIL_CACHE_DIR, max_bytes=THUMBNAIL_CACHE_MAX_BYTES
+            )
+        return _thumbnail_cache
+
+
+# EXIF orientation tag value -> transpose that restores the upright image
+_EXIF_ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+_EXIF_ORIENTATION = 0x0112
+
+
+def _resize_to_jpeg(image_path: str, max_size: int) -> memoryview:
+    """
+    Decode an image, shrink it to fit max_size and encode it as JPEG.
+
+    JPEGs are decoded at a reduced scale (1/2, 1/4 or 1/8) close to the
+    target size, and all further work (mode conversion, EXIF rotation)
+    happens on the shrunken image, so large camera photos never have
+    their full bitmap in memory.
 
     Args:
         image_path (str): Path to the image file.
         max_size (int): Maximum dimension (width or height) for the image.
-                        Images larger than this will be resized.
 
     Returns:
-        str: Base64 encoded string of the image.
+        memoryview: The JPEG encoded image, a view of the encoder's buffer
+        so it is not copied before being cached or base64 encoded.
     """
     with Image.open(image_path) as img:
-        # Convert to RGB to handle PNGs with alpha channel
-        if img.mode != "RGB":
+        orientation = img.getexif().get(_EXIF_ORIENTATION, 1)
+
+        # Let the JPEG decoder downscale while decoding. The requested size
+        # is the thumbnail size, the decoder never goes below it.
+        if max(img.size) > max_size:
+            scale = max_size / max(img.size)
+            img.draft(
+                "RGB",
+                (
+                    math.ceil(img.size[0] * scale),
+                    math.ceil(img.size[1] * scale),
+                ),
+            )
+
+        # Palette and bilevel images must be converted before resampling,
+        # everything else is converted after resizing
+        if img.mode in ("P", "1"):
             img = img.convert("RGB")
 
         # Resize if max dimension > max_size
         if max(img.size) > max_size:
             img.thumbnail((max_size, max_size))
 
+        # Convert to RGB to handle PNGs with alpha channel
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+
+        if orientation in _EXIF_ORIENTATION_TRANSPOSE:
+            img = img.transpose(_EXIF_ORIENTATION_TRANSPOSE[orientation])
+
         # Save to buffer
         buffer = io.BytesIO()
         img.save(buffer, format="JPEG", quality=85)
-        return base64.b64encode(buffer.getvalue()).decode("utf-8")
+        return buffer.getbuffer()
+
+
+def encode_image(
+    image_path: str, max_size: int = 256, use_cache: bool = True
+) -> str:
+    """
+    Encode an image file to a base64 string, resizing if necessary.
+
+    Args:
+        image_path (str): Path to the image file.
+        max_size (int): Maximum dimension (width or height) for the image.
+                        Images larger than this will be resized.
+        use_cache (bool): Reuse and populate the thumbnail cache.
+
+    Returns:
+        str: Base64 encoded string of the image.
+    """
+    with metrics.timer("encode"):
+        cache = get_thumbnail_cache() if use_cache else None
+        data = cache.get(image_path, max_size) if cache is not None else None
+        if data is None:
+            data = _resize_to_jpeg(image_path, max_size)
+            if cache is not None:
+                cache.put(image_path, max_size, data)
+        return base64.b64encode(data).decode("utf-8")
+
+
+def _warm_thumbnail(cache: ThumbnailCache, image_path: str, max_size: int):
+    # Failures are ignored; they surface again when the image is labeled
+    try:
+        if not cache.contains(image_path, max_size):
+            cache.put(
+                image_path, max_size, _resize_to_jpeg(image_path, max_size)
+            )
+    except Exception:
+        pass
+
+
+def warm_thumbnail_cache(
+    image_files: List[str], max_size: int = 1024, workers: int = 2
+) -> Optional[threading.Thread]:
+    """
+    Populate the thumbnail cache for a list of images in the background.
+
+    Images that are already cached are skipped. Failures are ignored here;
+    they surface again when the image is labeled.
+
+    Args:
+        image_files (List[str]): Paths to the image files.
+        max_size (int): Maximum dimension the images will be encoded at.
+        workers (int): Number of threads used for encoding.
+
+    Returns:
+        Optional[threading.Thread]: The daemon thread doing the work, or None
+        if the thumbnail cache is disabled.
+    """
+    cache = get_thumbnail_cache()
+    if cache is None:
+        return None
+
+    def _warm_all():
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # Consume the iterator so that all images are processed
+            for _ in executor.map(
+                lambda image_path: _warm_thumbnail(
+                    cache, image_path, max_size
+                ),
+                image_files,
+            ):
+                pass
+
+    thread = threading.Thread(
+        target=_warm_all, name="thumbnail-warmup", daemon=True
+    )
+    thread.start()
+    return thread
+
+
+def warm_ahead(
+    image_paths: Iterable[str],
+    max_size: int = 1024,
+    ahead: int = 32,
+    workers: int = 2,
+) -> Iterator[str]:
+    """
+    Pass image paths through while resizing the upcoming ones into the
+    thumbnail cache in the background.
+
+    The counterpart of ``warm_thumbnail_cache`` for paths that are not
+    known up front, such as a running directory scan: paths are read up to
+    ``ahead`` images before they are yielded.
+
+    Args:
+        image_paths (Iterable[str]): Paths to the image files.
+        max_size (int): Maximum dimension the images will be encoded at.
+        ahead (int): Number of images read and resized ahead.
+        workers (int): Number of threads used for encoding.
+
+    Yields:
+        str: The paths of ``image_paths``, in order.
+    """
+    cache = get_thumbnail_cache()
+    if cache is None:
+        yield from image_paths
+        return
+
+    executor = ThreadPoolExecutor(
+        max_workers=workers, thread_name_prefix="thumbnail-warmup"
+    )
+    pending = deque()
+    try:
+        for image_path in image_paths:
+            executor.submit(_warm_thumbnail, cache, image_path, max_size)
+            pending.append(image_path)
+            if len(pending) > ahead:
+                yield pending.popleft()
+        while pending:
+            yield pending.popleft()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def get_label_cache() -> Optional[LabelCache]:
+    """
+    Get the shared label cache, opening it on first use.
+
+    Returns:
+        Optional[LabelCache]: The cache, or None if caching is disabled via
+        ``LABEL_CACHE_ENABLED=0``.
+    """
+    global _label_cache
+    if not LABEL_CACHE_ENABLED:
+        return None
+    with _label_cache_lock:
+        if _label_cache is None:
+            _label_cache = LabelCache(
+                LABEL_CACHE_PATH, max_entries=LABEL_CACHE_MAX_ENTRIES
+            )
+        return _label_cache
+
+
+def label_cache_key(
+    image_path: str, prompt: str, max_size: int, mode: str = "single"
+) -> str:
+    """
+    Compute the cache key of a labeling request.
+
+    The key covers the image content, the prompt, the encoding resolution,
+    the model and the schema version, so changing any of them yields a
+    fresh label.
+
+    Args:
+        image_path (str): Path to the image file.
+        prompt (str): The prompt sent to the VLM.
+        max_size (int): Maximum image size for encoding.
+        mode (str): "single" for ``label_image`` requests, "batch" for
+                    labels produced by ``label_image_batch``, "cascade" for
+                    the steps of the resolution cascade.
+
+    Returns:
+        str: The hexadecimal cache key.
+    """
+    parts = [
+        hash_file(image_path),
+        prompt,
+        max_size,
+        backend_pool.model_id,
+        LABEL_SCHEMA_VERSION,
+    ]
+    if mode != "single":
+        parts.append(mode)
+    return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+
+def _lookup_cache(
+    image_path: str,
+    prompt: str,
+    max_size: int,
+    use_cache: bool,
+    mode: str = "single",
+) -> Tuple[Optional[LabelCache], Optional[str], Optional[Dict[str, Any]]]:
+    """
+    Look up a labeling request in the label cache.
+
+    Args:
+        image_path (str): Path to the image file.
+        prompt (str): The prompt sent to the VLM.
+        max_size (int): Maximum image size for encoding.
+        use_cache (bool): Whether the cache should be used at all.
+        mode (str): The request mode, see ``label_cache_key``.
+
+    Returns:
+        Tuple: ``(cache, key, cached_result)``; ``cache`` and ``key`` are None
+        when caching is bypassed, ``cached_result`` is None on a miss.
+    """
+    cache = get_label_cache() if use_cache else None
+    if cache is None:
+        return None, None, None
+    key = label_cache_key(image_path, prompt, max_size, mode=mode)
+    return cache, key, cache.get(key)
+
+
+class TokenBudgetExceeded(RuntimeError):
+    """
+    Raised when a streamed answer grows beyond its token budget.
+    """
+
+
+# Matches the completed "label" value in a partially streamed JSON answer
+_STREAMED_LABEL = re.compile(r'"label"\s*:\s*"((?:[^"\\]|\\.)*)"')
+# Top-level fields whose appearance marks the progress of a streamed answer
+_STREAMED_FIELDS = ('"label"', '"description"', '"tags"')
+
+
+def _read_stream(
+    stream: Any,
+    progress_callback: Optional[callable] = None,
+    token_budget: Optional[int] = None,
+) -> Tuple[str, bool]:
+    """
+    Collect a streamed completion while reporting its progress.
+
+    Every content delta counts as one token. The first delta records the
+    time to first token (``ttft`` stage). Progress is reported from the
+    fields of the JSON answer that have started so far, together with the
+    time to first token, the decoding rate and, once complete, the label.
+    The stream is closed early once it exceeds ``token_budget`` tokens,
+    which makes the server stop generating.
+
+    Args:
+        stream (Any): The stream returned by ``create(stream=True)``.
+        progress_callback (Optional[callable]): A callback function to
+            report progress (percent, message).
+        token_budget (Optional[int]): Maximum number of tokens to read.
+
+    Returns:
+        Tuple[str, bool]: The content received and whether the answer was
+        cut short by the token budget.
+    """
+    start = time.perf_counter()
+    first_token = None
+    tokens = 0
+    content = ""
+    label = None
+    try:
+        for chunk in stream:
+            usage = getattr(chunk, "usage", None)
+            if usage is not None:
+                metrics.record_usage(usage)
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            delta = choice.delta.content if choice.delta else None
+            if delta:
+                now = time.perf_counter()
+                if first_token is None:
+                    first_token = now - start
+                    metrics.observe("ttft", first_token)
+                tokens += 1
+                content += delta
+                if token_budget is not None and tokens > token_budget:
+                    return content, True
+
+                if progress_callback:
+                    if label is None:
+                        match = _STREAMED_LABEL.search(content)
+                        label = match.group(1) if match else None
+                    started = sum(f in content for f in _STREAMED_FIELDS)
+                    rate = (tokens - 1) / max(now - start - first_token, 1e-6)
+                    message = (
+                        f"First token after {first_token:.2f}s, "
+                        f"{tokens} tokens at {rate:.1f} tok/s"
+                    )
+                    if label is not None:
+                        message += f" - label: {label}"
+                    progress_callback(
+                        0.3 + 0.6 * started / len(_STREAMED_FIELDS), message
+                    )
+            if choice.finish_reason == "length":
+                return content, True
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+    return content, False
+
+
+def _build_messages(prompt: str, base64_image: str) -> List[Dict[str, Any]]:
+    """
+    Build the chat messages for a single-image labeling request.
+
+    Args:
+        prompt (str): The prompt to send to the VLM.
+        base64_image (str): The base64 encoded JPEG image.
+
+    Returns:
+        List[Dict[str, Any]]: The messages for the chat completion request.
+    """
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": prompt},
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": f"data:image/jpeg;base64,{base64_image}"
+                    },
+                },
+            ],
+        },
+    ]
+
+
+def _error_result(image_path: str, error: Exception) -> Dict[str, Any]:
+    """
+    Build the result returned when labeling an image fails.
+
+    Args:
+        image_path (str): Path to the image that failed.
+        error (Exception): The exception that was raised.
+
+    Returns:
+        Dict[str, Any]: An error dictionary with the usual label fields.
+    """
+    print(f"Error labeling image {image_path}: {error}")
+    metrics.record_error(error)
+    return {
+        "label": "error",
+        "description": f"Failed to process image: {str(error)}",
+        "tags": [],
+    }
 
 
 def label_image(
@@ -52,93 +599,481 @@ def label_image(
     prompt: str = "Describe this image and provide a label.",
     progress_callback: Optional[callable] = None,
     max_size: int = 1024,
+    use_cache: bool = True,
+    cascade: Optional[Sequence[int]] = None,
+    stream: bool = False,
+    token_budget: Optional[int] = None,
 ) -> Dict[str, Any]:
     """
-    Send an image to the local LM Studio model and get a structured label response.
+    Send an image to the local LM Studio model and get a structured label
+    response.
 
     Args:
         image_path (str): Path to the image file.
         prompt (str): The prompt to send to the VLM.
-        progress_callback (Optional[callable]): A callback function to report progress (percent, message).
+        progress_callback (Optional[callable]): A callback function to
+            report progress (percent, message).
         max_size (int): Maximum image size for encoding.
+        use_cache (bool): Return a cached label for identical requests and
+                          store new labels in the label cache.
+        cascade (Optional[Sequence[int]]): If given, label the image at
+                          each of these resolutions in increasing order
+                          until the answer is good enough (see
+                          ``label_image_cascade``); ``max_size`` is ignored.
+        stream (bool): Stream the answer, see ``label_encoded_image``.
+        token_budget (Optional[int]): Maximum number of tokens of the answer.
 
     Returns:
-        Dict[str, Any]: A dictionary containing 'label', 'description', and 'tags'.
-                        Returns an error dictionary if processing fails.
+        Dict[str, Any]: A dictionary containing 'label', 'description',
+                        and 'tags'. Returns an error dictionary if
+                        processing fails.
     """
+    if cascade:
+        return label_image_cascade(
+            image_path,
+            prompt=prompt,
+            progress_callback=progress_callback,
+            sizes=cascade,
+            use_cache=use_cache,
+            stream=stream,
+            token_budget=token_budget,
+        )
+
+    _, cache_key, cached = _lookup_cache(
+        image_path, prompt, max_size, use_cache
+    )
+    if cached is not None:
+        if progress_callback:
+            progress_callback(1.0, "Loaded label from cache")
+        return cached
+
     if progress_callback:
         progress_callback(0.1, "Encoding image...")
     base64_image = encode_image(image_path, max_size=max_size)
 
-    # JSON Schema for structured output
-    # This schema enforces the model to return a valid JSON object with specific fields
-    json_schema = {
-        "name": "image_label_response",
-        "strict": "true",
-        "schema": {
-            "type": "object",
-            "properties": {
-                "label": {
-                    "type": "string",
-                    "description": "A short, concise label for the image.",
-                },
-                "description": {
-                    "type": "string",
-                    "description": "A detailed description of the image content.",
-                },
-                "tags": {
-                    "type": "array",
-                    "items": {"type": "string"},
-                    "description": "A list of relevant tags.",
-                },
-            },
-            "required": ["label", "description", "tags"],
-        },
-    }
+    return label_encoded_image(
+        image_path,
+        base64_image,
+        prompt=prompt,
+        progress_callback=progress_callback,
+        cache_key=cache_key,
+        stream=stream,
+        token_budget=token_budget,
+    )
+
+
+def label_encoded_image(
+    image_path: str,
+    base64_image: str,
+    prompt: str = "Describe this image and provide a label.",
+    progress_callback: Optional[callable] = None,
+    cache_key: Optional[str] = None,
+    json_schema: Dict[str, Any] = LABEL_JSON_SCHEMA,
+    stream: bool = False,
+    token_budget: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Send an already encoded image to the local LM Studio model.
 
+    Args:
+        image_path (str): Path to the image file, used for error reporting.
+        base64_image (str): The base64 encoded JPEG image.
+        prompt (str): The prompt to send to the VLM.
+        progress_callback (Optional[callable]): A callback function to
+            report progress (percent, message).
+        cache_key (Optional[str]): If given, the result is stored in the
+                                   label cache under this key.
+        json_schema (Dict[str, Any]): The structured output schema.
+        stream (bool): Stream the answer and report the time to first token
+                       and decoding rate through ``progress_callback``.
+        token_budget (Optional[int]): Maximum number of tokens the answer
+                       may have; longer answers are aborted and returned
+                       as errors instead of running to completion.
+
+    Returns:
+        Dict[str, Any]: A dictionary containing 'label', 'description',
+                        and 'tags'. Returns an error dictionary if
+                        processing fails.
+    """
     try:
         if progress_callback:
             progress_callback(0.3, "Sending request to LM Studio...")
 
-        # Use a lock to ensure sequential access to the local model
-        # This prevents overloading the local inference server
-        with model_lock:
-            response = client.chat.completions.create(
-                model=LM_STUDIO_MODEL,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a helpful assistant that labels images. Always output in JSON format.",
-                    },
+        # The pool bounds the number of concurrent requests per server
+        # This prevents overloading the local inference servers
+        request = {
+            "messages": _build_messages(prompt, base64_image),
+            "response_format": {
+                "type": "json_schema",
+                "json_schema": json_schema,
+            },
+            "temperature": 0.7,
+        }
+        if token_budget is not None:
+            # Also enforced by the server in case it keeps generating
+            # after the client hangs up
+            request["max_tokens"] = token_budget
+        if stream:
+            request["stream"] = True
+            request["stream_options"] = {"include_usage": True}
+
+        wait_start = time.perf_counter()
+        with backend_pool.acquire() as backend:
+            metrics.observe("wait", time.perf_counter() - wait_start)
+            with metrics.timer("request"):
+                response = backend.client.chat.completions.create(
+                    model=backend.model, **request
+                )
+                if stream:
+                    content, truncated = _read_stream(
+                        response, progress_callback, token_budget
+                    )
+        if stream:
+            if truncated:
+                raise TokenBudgetExceeded(
+                    f"Answer exceeded the budget of {token_budget} tokens"
+                )
+        else:
+            metrics.record_usage(getattr(response, "usage", None))
+            content = response.choices[0].message.content
+        if progress_callback:
+            progress_callback(0.9, "Processing response...")
+        with metrics.timer("parse"):
+            result = json.loads(content)
+        if cache_key is not None:
+            get_label_cache().put(cache_key, result)
+        return result
+
+    except Exception as e:
+        return _error_result(image_path, e)
+
+
+def _escalation_reason(result: Dict[str, Any]) -> Optional[str]:
+    """
+    Decide whether a cascade answer needs a look at a higher resolution.
+
+    Args:
+        result (Dict[str, Any]): The parsed answer of the model.
+
+    Returns:
+        Optional[str]: "invalid", "generic" or "low_confidence", or None if
+        the answer can be kept.
+    """
+    if not _is_valid_label(result) or result["label"] == "error":
+        return "invalid"
+    if (
+        result["label"].strip().lower() in GENERIC_LABELS
+        or not result["tags"]
+        or len(result["description"].split()) < CASCADE_MIN_DESCRIPTION_WORDS
+    ):
+        return "generic"
+    confidence = result.get("confidence")
+    if not isinstance(confidence, (int, float)) or (
+        confidence < CASCADE_MIN_CONFIDENCE
+    ):
+        return "low_confidence"
+    return None
+
+
+def label_image_cascade(
+    image_path: str,
+    prompt: str = "Describe this image and provide a label.",
+    progress_callback: Optional[callable] = None,
+    sizes: Sequence[int] = DEFAULT_CASCADE,
+    use_cache: bool = True,
+    stream: bool = False,
+    token_budget: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Label an image at a low resolution first and escalate only when needed.
+
+    The image is labeled at the smallest size of ``sizes``. The next size is
+    tried when the answer fails schema validation, is a generic or
+    low-information label, or the model reports a confidence below
+    ``CASCADE_MIN_CONFIDENCE``. Most images thus only cost the cheap prompt
+    while difficult ones still get full detail.
+
+    Args:
+        image_path (str): Path to the image file.
+        prompt (str): The prompt to send to the VLM.
+        progress_callback (Optional[callable]): A callback function to
+            report progress (percent, message).
+        sizes (Sequence[int]): The resolutions to try.
+        use_cache (bool): Reuse and populate the label cache for each step.
+        stream (bool): Stream the answers, see ``label_encoded_image``.
+        token_budget (Optional[int]): Maximum number of tokens per answer.
+
+    Returns:
+        Dict[str, Any]: The label of the last step, with the model's
+        'confidence', the 'resolution' it was produced at and the reasons
+        of earlier 'escalations'. If the last step fails validation, the
+        last valid label of an earlier step is returned instead.
+    """
+    sizes = sorted(set(sizes))
+    accepted = None
+    escalations = []
+    for step, size in enumerate(sizes):
+        if progress_callback:
+            progress_callback(
+                0.1 + 0.8 * step / len(sizes),
+                f"Labeling at {size}px...",
+            )
+        _, cache_key, result = _lookup_cache(
+            image_path, prompt, size, use_cache, mode="cascade"
+        )
+        if result is None:
+            try:
+                base64_image = encode_image(image_path, max_size=size)
+            except Exception as e:
+                return _error_result(image_path, e)
+            result = label_encoded_image(
+                image_path,
+                base64_image,
+                prompt=prompt,
+                cache_key=cache_key,
+                json_schema=CASCADE_LABEL_JSON_SCHEMA,
+                stream=stream,
+                token_budget=token_budget,
+            )
+
+        reason = _escalation_reason(result)
+        if reason != "invalid":
+            accepted = {**result, "resolution": size}
+        if reason is None:
+            break
+        escalations.append({"resolution": size, "reason": reason})
+
+    if progress_callback:
+        progress_callback(1.0, "Done")
+    if accepted is None:
+        return result
+    accepted["escalations"] = [
+        e for e in escalations if e["resolution"] < accepted["resolution"]
+    ]
+    return accepted
+
+
+def _is_valid_label(item: Any) -> bool:
+    """
+    Check that a parsed response item has the fields of a label.
+
+    Args:
+        item (Any): The parsed item.
+
+    Returns:
+        bool: True if the item has a string label and description and a list
+        of string tags.
+    """
+    return (
+        isinstance(item, dict)
+        and isinstance(item.get("label"), str)
+        and isinstance(item.get("description"), str)
+        and isinstance(item.get("tags"), list)
+        and all(isinstance(tag, str) for tag in item["tags"])
+    )
+
+
+def label_image_batch(
+    image_paths: List[str],
+    prompt: str = "Describe this image and provide a label.",
+    max_size: int = 1024,
+    use_cache: bool = True,
+) -> List[Dict[str, Any]]:
+    """
+    Label several images with a single request to the model.
+
+    Sharing one request amortizes the system prompt and schema over all
+    images, at the cost of some accuracy on small models. The response must
+    contain one entry per image, identified by its index; images whose entry
+    is missing, duplicated or malformed are labeled again individually with
+    ``label_image``. When the server cannot be reached or fails (5xx), the
+    pending images get error results instead, as single requests would
+    fail the same way.
+
+    Args:
+        image_paths (List[str]): Paths to the image files.
+        prompt (str): The prompt to send to the VLM for each image.
+        max_size (int): Maximum image size for encoding.
+        use_cache (bool): Reuse and populate the label cache.
+
+    Returns:
+        List[Dict[str, Any]]: One result per input image, in input order.
+    """
+    results = [None] * len(image_paths)
+    cache = get_label_cache() if use_cache else None
+    cache_keys = {}
+
+    # Images with a cached label (single or batch) skip the request
+    for i, image_path in enumerate(image_paths):
+        if cache is None:
+            break
+        for mode in ("single", "batch"):
+            key = label_cache_key(image_path, prompt, max_size, mode=mode)
+            cache_keys[(i, mode)] = key
+            results[i] = cache.get(key)
+            if results[i] is not None:
+                break
+
+    pending = [i for i, result in enumerate(results) if result is None]
+    if len(pending) > 1:
+        try:
+            content = [
+                {
+                    "type": "text",
+                    "text": (
+                        f"{prompt} You are given {len(pending)} images, "
+                        f"numbered 0 to {len(pending) - 1}. Return one entry "
+                        "per image in 'results' and set 'index' to the "
+                        "number of the image it describes."
+                    ),
+                }
+            ]
+            for number, i in enumerate(pending):
+                base64_image = encode_image(image_paths[i], max_size=max_size)
+                content.append({"type": "text", "text": f"Image {number}:"})
+                content.append(
                     {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": prompt},
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}"
-                                },
-                            },
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:image/jpeg;base64,{base64_image}"
+                        },
+                    }
+                )
+
+            wait_start = time.perf_counter()
+            with backend_pool.acquire() as backend:
+                metrics.observe("wait", time.perf_counter() - wait_start)
+                with metrics.timer("request"):
+                    response = backend.client.chat.completions.create(
+                        model=backend.model,
+                        messages=[
+                            {"role": "system", "content": SYSTEM_PROMPT},
+                            {"role": "user", "content": content},
                         ],
-                    },
-                ],
-                response_format={
-                    "type": "json_schema",
-                    "json_schema": json_schema,
-                },
-                temperature=0.7,
+                        response_format={
+                            "type": "json_schema",
+                            "json_schema": BATCH_LABEL_JSON_SCHEMA,
+                        },
+                        temperature=0.7,
+                    )
+            metrics.record_usage(
+                getattr(response, "usage", None), images=len(pending)
+            )
+            with metrics.timer("parse"):
+                items = json.loads(response.choices[0].message.content)
+            items = items.get("results", []) if isinstance(items, dict) else []
+        except Exception as e:
+            if is_backend_failure(e):
+                for i in pending:
+                    results[i] = _error_result(image_paths[i], e)
+                return results
+            # An unusable answer: the images are labeled one by one
+            metrics.record_error(e)
+            items = []
+
+        # Keep only well-formed entries whose index is valid and unique
+        seen = set()
+        duplicates = set()
+        for item in items:
+            number = item.get("index") if isinstance(item, dict) else None
+            if not isinstance(number, int) or not 0 <= number < len(pending):
+                continue
+            if number in seen:
+                duplicates.add(number)
+            seen.add(number)
+        for item in items:
+            number = item.get("index") if isinstance(item, dict) else None
+            if number in seen and number not in duplicates:
+                if _is_valid_label(item):
+                    i = pending[number]
+                    results[i] = {
+                        "label": item["label"],
+                        "description": item["description"],
+                        "tags": item["tags"],
+                    }
+                    if cache is not None:
+                        cache.put(cache_keys[(i, "batch")], results[i])
+
+    # Fall back to individual requests for everything still missing
+    for i, result in enumerate(results):
+        if result is None:
+            results[i] = label_image(
+                image_paths[i],
+                prompt=prompt,
+                max_size=max_size,
+                use_cache=use_cache,
             )
+    return results
+
+
+async def label_image_async(
+    image_path: str,
+    prompt: str = "Describe this image and provide a label.",
+    progress_callback: Optional[callable] = None,
+    max_size: int = 1024,
+    use_cache: bool = True,
+) -> Dict[str, Any]:
+    """
+    Asynchronous counterpart of ``label_image``.
+
+    The image is encoded in a worker thread and the request is sent with the
+    async OpenAI client, so the event loop stays free while the model works.
+
+    Args:
+        image_path (str): Path to the image file.
+        prompt (str): The prompt to send to the VLM.
+        progress_callback (Optional[callable]): A callback function to
+            report progress (percent, message).
+        max_size (int): Maximum image size for encoding.
+        use_cache (bool): Return a cached label for identical requests and
+                          store new labels in the label cache.
+
+    Returns:
+        Dict[str, Any]: A dictionary containing 'label', 'description',
+                        and 'tags'. Returns an error dictionary if
+                        processing fails.
+    """
+    cache, cache_key, cached = await asyncio.to_thread(
+        _lookup_cache, image_path, prompt, max_size, use_cache
+    )
+    if cached is not None:
+        if progress_callback:
+            progress_callback(1.0, "Loaded label from cache")
+        return cached
+
+    if progress_callback:
+        progress_callback(0.1, "Encoding image...")
+    base64_image = await asyncio.to_thread(
+        encode_image, image_path, max_size=max_size
+    )
+
+    try:
+        if progress_callback:
+            progress_callback(0.3, "Sending request to LM Studio...")
+
+        wait_start = time.perf_counter()
+        async with backend_pool.acquire_async() as backend:
+            metrics.observe("wait", time.perf_counter() - wait_start)
+            with metrics.timer("request"):
+                response = await backend.async_client.chat.completions.create(
+                    model=backend.model,
+                    messages=_build_messages(prompt, base64_image),
+                    response_format={
+                        "type": "json_schema",
+                        "json_schema": LABEL_JSON_SCHEMA,
+                    },
+                    temperature=0.7,
+                )
+        metrics.record_usage(getattr(response, "usage", None))
 
         content = response.choices[0].message.content
         if progress_callback:
             progress_callback(0.9, "Processing response...")
-        return json.loads(content)
+        with metrics.timer("parse"):
+            result = json.loads(content)
+        if cache is not None:
+            await asyncio.to_thread(cache.put, cache_key, result)
+        return result
 
     except Exception as e:
-        print(f"Error labeling image {image_path}: {e}")
-        return {
-            "label": "error",
-            "description": f"Failed to process image: {str(e)}",
-            "tags": [],
-        }
+        return _error_result(image_path, e)
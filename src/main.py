@@ -1,11 +1,43 @@
 import argparse
 import os
 import subprocess
+import time
+from collections import Counter
 from pathlib import Path
 from tqdm import tqdm
-from src.data_loader import get_image_files, save_labels, ensure_directory
-from src.labeler import label_image
-from src.splitter import split_dataset, organize_dataset
+from src.data_loader import (
+    LabelStore,
+    ScanManifest,
+    ensure_directory,
+    get_image_files,
+    iter_image_files,
+    prefilter_images,
+    probe_image,
+    probe_rejection,
+    recover_labels,
+    save_labels,
+)
+from src.classifier import ClassifierCascade, LocalClassifier
+from src.dedup import group_near_duplicates, propagate_label
+from src.engine import label_images
+from src.label_db import LabelDatabase
+from src.metrics import metrics
+from src.pipeline import run_pipeline
+from src.labeler import (
+    DEFAULT_CASCADE,
+    backend_pool,
+    get_label_cache,
+    warm_ahead,
+    warm_thumbnail_cache,
+)
+from src.splitter import (
+    LINK_MODES,
+    kfold_split,
+    labels_for_files,
+    organize_dataset,
+    split_dataset,
+    train_val_test_split,
+)
 
 
 def main():
@@ -17,18 +49,255 @@ def main():
     parser.add_argument(
         "--path", type=str, help="Path to the directory containing images"
     )
+    parser.add_argument(
+        "--recursive",
+        action="store_true",
+        help="Also search subdirectories of --path for images",
+    )
+    parser.add_argument(
+        "--include",
+        type=str,
+        nargs="+",
+        default=None,
+        metavar="GLOB",
+        help=(
+            "Only use images whose name or path relative to --path matches "
+            "one of these patterns (e.g. '*.png' 'cats/*')"
+        ),
+    )
+    parser.add_argument(
+        "--exclude",
+        type=str,
+        nargs="+",
+        default=None,
+        metavar="GLOB",
+        help="Skip images and directories matching these patterns",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help=(
+            "Only label images that are new or changed since the last run "
+            "with the same --output, using the scan manifest kept there"
+        ),
+    )
+    parser.add_argument(
+        "--full-rescan",
+        action="store_true",
+        help=(
+            "With --incremental, list every directory to also find images "
+            "edited in place"
+        ),
+    )
+    parser.add_argument(
+        "--probe",
+        action="store_true",
+        help=(
+            "Read the image headers first and skip images that cannot be "
+            "opened instead of labeling them as errors"
+        ),
+    )
+    parser.add_argument(
+        "--min-size",
+        type=int,
+        default=None,
+        metavar="PX",
+        help="Skip images narrower or lower than this (implies --probe)",
+    )
+    parser.add_argument(
+        "--formats",
+        type=str,
+        nargs="+",
+        default=None,
+        metavar="FORMAT",
+        help=(
+            "Only label images in these formats, e.g. JPEG PNG "
+            "(implies --probe)"
+        ),
+    )
+    parser.add_argument(
+        "--max-aspect-ratio",
+        type=float,
+        default=None,
+        help=(
+            "Skip images whose longer side exceeds the shorter one by more "
+            "than this factor (implies --probe)"
+        ),
+    )
     parser.add_argument(
         "--split-ratio",
         type=float,
         default=0.8,
         help="Train/Test split ratio (default: 0.8)",
     )
+    parser.add_argument(
+        "--val-ratio",
+        type=float,
+        default=0.0,
+        help=(
+            "Also put this fraction of the images in a val/ folder; "
+            "--split-ratio is then the train fraction and the rest is the "
+            "test set (default: 0)"
+        ),
+    )
+    parser.add_argument(
+        "--folds",
+        type=int,
+        default=None,
+        metavar="K",
+        help=(
+            "Create K train/test splits for cross-validation in fold_0 ... "
+            "fold_<K-1> of the output directory instead of one split"
+        ),
+    )
+    parser.add_argument(
+        "--stratify",
+        action="store_true",
+        help="Split every label in the same ratios",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Seed for a reproducible split (default: random)",
+    )
+    parser.add_argument(
+        "--link-mode",
+        type=str,
+        choices=LINK_MODES,
+        default="copy",
+        help=(
+            "How images are placed in train/ and test/: copied, hardlinked "
+            "or reflinked (no extra disk space), symlinked, or only listed "
+            "in split_manifest.jsonl; falls back to copying when a link is "
+            "not possible (default: copy)"
+        ),
+    )
+    parser.add_argument(
+        "--split-workers",
+        type=int,
+        default=8,
+        help="Number of files copied or linked in parallel (default: 8)",
+    )
     parser.add_argument(
         "--ui", action="store_true", help="Start the Streamlit UI"
     )
     parser.add_argument(
         "--output", type=str, help="Output directory for processed data"
     )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        help=(
+            "Number of labeling requests kept in flight, spread over the "
+            "parallel slots of the backends (default: "
+            f"{backend_pool.max_capacity}, LM_STUDIO_MAX_IN_FLIGHT per "
+            "backend)"
+        ),
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1,
+        help=(
+            "Number of images labeled per request; values above 1 trade "
+            "some accuracy for throughput (default: 1)"
+        ),
+    )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help=(
+            "Encode images in a process pool, overlapped with the requests "
+            "to the model"
+        ),
+    )
+    parser.add_argument(
+        "--encode-workers",
+        type=int,
+        default=None,
+        help="Number of encoder processes in pipeline mode (default: CPUs)",
+    )
+    parser.add_argument(
+        "--cascade",
+        type=int,
+        nargs="*",
+        default=None,
+        metavar="SIZE",
+        help=(
+            "Label at the smallest resolution first and retry at the next "
+            "one only for invalid, vague or low-confidence answers "
+            "(default sizes: 256 512 1024)"
+        ),
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help=(
+            "Stream the answers and show the time to first token and "
+            "tokens/sec of the latest request"
+        ),
+    )
+    parser.add_argument(
+        "--token-budget",
+        type=int,
+        default=None,
+        help=(
+            "Abort answers longer than this many tokens and report them as "
+            "errors (default: no limit)"
+        ),
+    )
+    parser.add_argument(
+        "--classifier",
+        type=str,
+        default=None,
+        metavar="DIR",
+        help=(
+            "Directory with model.pth and class_map.json from "
+            "training_example/train.py; its confident predictions are used "
+            "as labels and only the rest is sent to the VLM"
+        ),
+    )
+    parser.add_argument(
+        "--classifier-threshold",
+        type=float,
+        default=0.9,
+        help="Minimum classifier confidence to skip the VLM (default: 0.9)",
+    )
+    parser.add_argument(
+        "--classifier-audit",
+        type=float,
+        default=0.0,
+        help=(
+            "Fraction of accepted classifier labels also checked by the "
+            "VLM to measure agreement (default: 0)"
+        ),
+    )
+    parser.add_argument(
+        "--dedup-distance",
+        type=int,
+        default=None,
+        help=(
+            "Reuse the label of an earlier image whose perceptual hash is "
+            "within this Hamming distance (e.g. 4) instead of querying the "
+            "model (default: off)"
+        ),
+    )
+    parser.add_argument(
+        "--label-db",
+        type=str,
+        default=None,
+        metavar="PATH",
+        help=(
+            "Also add the labels to this SQLite label database, which can "
+            "be queried by label, tag and description (GET /labels)"
+        ),
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always query the model, ignoring previously cached labels",
+    )
 
     args = parser.parse_args()
 
@@ -50,6 +319,68 @@ def main():
         print(f"Error: Input path '{args.path}' does not exist.")
         return
 
+    if args.full_rescan and not args.incremental:
+        print("Error: --full-rescan requires --incremental.")
+        return
+
+    if not 0 <= args.split_ratio <= 1 or args.val_ratio < 0:
+        print("Error: Split ratios must be between 0 and 1.")
+        return
+    if args.split_ratio + args.val_ratio > 1 + 1e-9:
+        print("Error: --split-ratio and --val-ratio add up to more than 1.")
+        return
+    if args.folds is not None:
+        if args.folds < 2:
+            print("Error: --folds must be at least 2.")
+            return
+        if args.val_ratio:
+            print("Error: --folds cannot be combined with --val-ratio.")
+            return
+
+    if args.concurrency is None:
+        args.concurrency = backend_pool.max_capacity
+    elif args.concurrency < 1:
+        print("Error: --concurrency must be at least 1.")
+        return
+    else:
+        # The backends' slots limit the requests actually in flight
+        backend_pool.set_max_in_flight(args.concurrency)
+
+    label_kwargs = {"use_cache": not args.no_cache}
+    if args.cascade is not None:
+        if args.pipeline or args.batch_size > 1:
+            print(
+                "Error: --cascade cannot be combined with --pipeline or "
+                "--batch-size."
+            )
+            return
+        label_kwargs["cascade"] = args.cascade or list(DEFAULT_CASCADE)
+    if args.stream or args.token_budget is not None:
+        if args.batch_size > 1:
+            print(
+                "Error: --stream and --token-budget cannot be combined with "
+                "--batch-size."
+            )
+            return
+        label_kwargs["stream"] = args.stream
+        label_kwargs["token_budget"] = args.token_budget
+
+    classifier_cascade = None
+    if args.classifier:
+        if args.pipeline:
+            print("Error: --classifier cannot be combined with --pipeline.")
+            return
+        try:
+            classifier = LocalClassifier.from_dir(args.classifier)
+        except (ImportError, OSError) as e:
+            print(f"Error: Cannot load the classifier: {e}")
+            return
+        classifier_cascade = ClassifierCascade(
+            classifier,
+            threshold=args.classifier_threshold,
+            audit_fraction=args.classifier_audit,
+        )
+
     # Determine output directory
     if args.output:
         output_dir = Path(args.output)
@@ -60,39 +391,400 @@ def main():
     print(f"Output directory: {output_dir}")
 
     # 1. Load Images
-    print("Loading images...")
-    image_files = get_image_files(str(input_path))
-    print(f"Found {len(image_files)} images.")
+    scan_kwargs = {
+        "recursive": args.recursive,
+        "include": args.include,
+        "exclude": args.exclude,
+    }
+    prefilter = None
+    if (
+        args.probe
+        or args.min_size is not None
+        or args.formats
+        or args.max_aspect_ratio is not None
+    ):
+        prefilter = {
+            "min_size": args.min_size,
+            "formats": args.formats,
+            "max_aspect_ratio": args.max_aspect_ratio,
+        }
+    # Images skipped by the prefilter, with the reason
+    rejected = {}
 
-    if not image_files:
-        print("No images found.")
-        return
+    def report_rejected():
+        if rejected:
+            reasons = Counter(rejected.values())
+            print(
+                f"Skipped {len(rejected)} images by their header: "
+                + ", ".join(f"{n} {reason}" for reason, n in reasons.items())
+            )
+
+    manifest = None
+    if args.incremental:
+        manifest = ScanManifest(str(output_dir / "manifest.db"))
+    # Dedup, the classifier and the manifest need all images up front;
+    # otherwise labeling starts with the first images found while the scan
+    # goes on
+    streaming = (
+        manifest is None
+        and args.dedup_distance is None
+        and classifier_cascade is None
+    )
+    if streaming:
+        print("Scanning for images while labeling...")
+        image_files = []
+        dataset_files = image_files
+    elif manifest is not None:
+        print("Scanning for new or changed images...")
+        changes = manifest.scan(
+            str(input_path), full=args.full_rescan, **scan_kwargs
+        )
+        print(
+            f"{len(changes['new'])} new, {len(changes['modified'])} "
+            f"modified, {len(changes['deleted'])} deleted and "
+            f"{changes['unchanged']} unchanged images "
+            f"({changes['skipped_dirs']} unchanged directories skipped)."
+        )
+        # Includes images whose labeling failed or was interrupted before
+        image_files = manifest.paths(str(input_path), pending_only=True)
+        dataset_files = manifest.paths(str(input_path))
+        if prefilter is not None:
+            # Probes are cached in the manifest, so only new images are read
+            dataset_files, rejected = prefilter_images(
+                dataset_files, manifest=manifest, **prefilter
+            )
+            image_files = [f for f in image_files if f not in rejected]
+            report_rejected()
+        print(f"{len(image_files)} images to label.")
+
+        if not dataset_files:
+            print("No images found.")
+            return
+    else:
+        print("Loading images...")
+        image_files = get_image_files(str(input_path), **scan_kwargs)
+        print(f"Found {len(image_files)} images.")
+        if prefilter is not None:
+            image_files, rejected = prefilter_images(image_files, **prefilter)
+            report_rejected()
+        dataset_files = image_files
+
+        if not image_files:
+            print("No images found.")
+            return
+
+    # Resize images in the background so encoding is off the critical path
+    # (the pipeline encodes in its own process pool instead; when streaming,
+    # the images are resized a few ahead of labeling as they are found)
+    warm_size = None
+    if "cascade" in label_kwargs:
+        # Most images are only needed at the first resolution
+        warm_size = min(label_kwargs["cascade"])
+    elif not args.pipeline and classifier_cascade is None:
+        warm_size = 1024
+    if warm_size is not None and not streaming:
+        warm_thumbnail_cache(image_files, max_size=warm_size)
+
+    # Near-duplicates (burst shots, ...) take the label of an earlier image
+    duplicates = {}
+    if args.dedup_distance is not None:
+        print("Detecting near-duplicate images...")
+        duplicates = group_near_duplicates(image_files, args.dedup_distance)
+        print(f"Found {len(duplicates)} near-duplicates.")
+    label_indices = [
+        i
+        for i, img_path in enumerate(image_files)
+        if img_path not in duplicates
+    ]
 
     # 2. Label Images
     print("Labeling images (this may take a while)...")
-    labeled_data = []
-    for img_path in tqdm(image_files):
-        label_result = label_image(img_path)
+    labeled_data = [None] * len(image_files)
+    # Every result is appended here as it arrives, so a crash keeps them;
+    # those of a run that crashed are merged into labels.json first
+    journal_path = str(output_dir / "labels.jsonl")
+    recovered = recover_labels(journal_path, str(output_dir / "labels.json"))
+    if recovered:
+        print(
+            f"Recovered {recovered} labels of an interrupted run into "
+            f"{output_dir / 'labels.json'}"
+        )
+    journal = LabelStore(journal_path, truncate=True)
+    progress = tqdm(total=None if streaming else len(image_files))
+
+    def scan_images():
+        # Record the images in scan order as labeling consumes them
+        for img_path in iter_image_files(str(input_path), **scan_kwargs):
+            if prefilter is not None:
+                reason = probe_rejection(probe_image(img_path), **prefilter)
+                if reason is not None:
+                    rejected[img_path] = reason
+                    continue
+            image_files.append(img_path)
+            labeled_data.append(None)
+            label_indices.append(len(label_indices))
+            progress.total = len(image_files)
+            yield img_path
+
+    def store_result(index, img_path, label_result):
         # Add filename for reference
         label_result["filename"] = os.path.basename(img_path)
         label_result["original_path"] = img_path
-        labeled_data.append(label_result)
+        # Results arrive in completion order; keep the input order
+        labeled_data[label_indices[index]] = label_result
+        journal.append(label_result)
+        progress.update(1)
+
+    def show_stream_progress(img_path, percent, message):
+        # Time to first token and tokens/sec of the latest streamed answer
+        progress.set_postfix_str(message, refresh=False)
+
+    stream_callback = show_stream_progress if args.stream else None
+
+    interrupted = False
+    try:
+        if streaming:
+            to_label = scan_images()
+            if warm_size is not None:
+                to_label = warm_ahead(to_label, max_size=warm_size)
+        else:
+            to_label = [image_files[i] for i in label_indices]
+        if args.pipeline:
+            run_pipeline(
+                to_label,
+                store_result,
+                encode_workers=args.encode_workers,
+                max_in_flight=args.concurrency,
+                **label_kwargs,
+            )
+        else:
+            results = (
+                classifier_cascade.label_images
+                if classifier_cascade is not None
+                else label_images
+            )(
+                to_label,
+                max_in_flight=args.concurrency,
+                progress_callback=stream_callback,
+                batch_size=args.batch_size,
+                **label_kwargs,
+            )
+            for index, img_path, label_result in results:
+                store_result(index, img_path, label_result)
+
+        # Propagate labels to the near-duplicates; those whose
+        # representative failed are labeled on their own
+        position = {img_path: i for i, img_path in enumerate(image_files)}
+        retry = []
+        for img_path, (representative, distance) in duplicates.items():
+            source = labeled_data[position[representative]]
+            if source["label"] == "error":
+                retry.append(position[img_path])
+                continue
+            label_result = propagate_label(source, representative, distance)
+            label_result["filename"] = os.path.basename(img_path)
+            label_result["original_path"] = img_path
+            labeled_data[position[img_path]] = label_result
+            journal.append(label_result)
+            progress.update(1)
+
+        if retry:
+            label_indices = retry
+            results = label_images(
+                [image_files[i] for i in retry],
+                max_in_flight=args.concurrency,
+                progress_callback=stream_callback,
+                **label_kwargs,
+            )
+            for index, img_path, label_result in results:
+                store_result(index, img_path, label_result)
+    except KeyboardInterrupt:
+        interrupted = True
+    finally:
+        progress.close()
+        journal.close()
+
+    if streaming and not interrupted:
+        print(f"Found {len(image_files) + len(rejected)} images.")
+        report_rejected()
+        if not image_files:
+            print("No images found.")
+            return
+
+    if duplicates and not interrupted:
+        propagated = sum("propagated_from" in item for item in labeled_data)
+        print(f"Propagated labels to {propagated} near-duplicate images.")
+
+    if "cascade" in label_kwargs and not interrupted:
+        resolutions = Counter(
+            item.get("resolution", "failed") for item in labeled_data
+        )
+        print(
+            "Final resolutions: "
+            + ", ".join(
+                f"{size}px: {resolutions[size]}"
+                for size in sorted(set(label_kwargs["cascade"]))
+            )
+            + f", failed: {resolutions['failed']}"
+        )
+
+    if classifier_cascade is not None and not interrupted:
+        stats = classifier_cascade.stats()
+        print(
+            f"Classifier cascade: {stats['classifier']} labeled by the "
+            f"classifier, {stats['vlm']} sent to the VLM, "
+            f"{stats['audited']} audited ({stats['vlm_errors']} VLM errors)"
+        )
+        for tier, name in (("vlm", "low confidence"), ("audit", "audited")):
+            agreement = stats["agreement"][tier]
+            if agreement["compared"]:
+                print(
+                    f"  Agreement with the VLM ({name}): "
+                    f"{agreement['rate']:.1%} of {agreement['compared']}"
+                )
+
+    if interrupted:
+        # Keep the labels that finished before Ctrl-C
+        labeled_data = [item for item in labeled_data if item is not None]
+        print(f"Interrupted after labeling {len(labeled_data)} images.")
+
+    if manifest is not None:
+        # The labels of earlier runs are kept in the manifest
+        manifest.mark([item for item in labeled_data if item is not None])
+        labeled_data = [
+            item
+            for item in manifest.labels(str(input_path))
+            if item["original_path"] not in rejected
+        ]
+        manifest.close()
 
     # Save labels
     labels_file = output_dir / "labels.json"
     save_labels(labeled_data, str(labels_file))
     print(f"Labels saved to {labels_file}")
+    if args.label_db:
+        label_db = LabelDatabase(args.label_db)
+        added = label_db.add(labeled_data)
+        label_db.close()
+        print(f"Added {added} labels to the label database {args.label_db}")
+    if interrupted:
+        return
+
+    adaptive = any(b.limiter is not None for b in backend_pool.backends)
+    if len(backend_pool.backends) > 1 or adaptive:
+        for stats in backend_pool.stats():
+            latency = stats["latency"]
+            latency = f"{latency:.2f}s" if latency is not None else "n/a"
+            print(
+                f"Backend {stats['url']}: {stats['requests']} requests, "
+                f"{stats['failures']} failures, avg latency {latency}, "
+                f"concurrency limit {stats['limit']}"
+                + ("" if stats["healthy"] else " (ejected)")
+            )
+
+    report = metrics.summary_lines()
+    if report:
+        print("Labeling metrics:")
+        for line in report:
+            print(line)
+
+    cache = get_label_cache()
+    if cache is not None and not args.no_cache:
+        stats = cache.stats()
+        print(
+            f"Label cache: {stats['hits']} hits, {stats['misses']} misses "
+            f"({stats['entries']} entries)"
+        )
 
     # 3. Split Dataset
-    print(f"Splitting dataset with ratio {args.split_ratio}...")
-    train_files, test_files = split_dataset(image_files, args.split_ratio)
+    labels = None
+    if args.stratify:
+        labels = labels_for_files(dataset_files, labeled_data)
+    # (output directory, train, test, validation files) of each split
+    layouts = []
+    if args.folds:
+        print(f"Splitting dataset into {args.folds} folds...")
+        for fold, (train_files, test_files) in enumerate(
+            kfold_split(dataset_files, args.folds, labels, args.seed)
+        ):
+            layouts.append(
+                (
+                    str(output_dir / f"fold_{fold}"),
+                    train_files,
+                    test_files,
+                    None,
+                )
+            )
+    elif args.val_ratio:
+        print(
+            f"Splitting dataset with ratios {args.split_ratio} (train), "
+            f"{args.val_ratio} (val)..."
+        )
+        train_files, val_files, test_files = train_val_test_split(
+            dataset_files, args.split_ratio, args.val_ratio, labels, args.seed
+        )
+        layouts.append((str(output_dir), train_files, test_files, val_files))
+    else:
+        print(f"Splitting dataset with ratio {args.split_ratio}...")
+        train_files, test_files = split_dataset(
+            dataset_files, args.split_ratio, labels, args.seed
+        )
+        layouts.append((str(output_dir), train_files, test_files, None))
 
-    train_dir, test_dir = organize_dataset(
-        train_files, test_files, str(output_dir), labeled_data=labeled_data
+    methods = Counter()
+    copied = [0]
+    progress = tqdm(
+        total=sum(
+            len(train) + len(test) + len(val or [])
+            for _, train, test, val in layouts
+        ),
+        unit="file",
     )
+    started = time.monotonic()
+
+    def count_file(entry):
+        methods["skipped" if entry.get("skipped") else entry["method"]] += 1
+        copied[0] += entry.get("bytes", 0)
+        elapsed = max(time.monotonic() - started, 1e-6)
+        progress.set_postfix_str(
+            f"{copied[0] / elapsed / 1e6:.1f} MB/s", refresh=False
+        )
+        progress.update(1)
+
+    organized = []
+    try:
+        for split_dir, train_files, test_files, val_files in layouts:
+            train_dir, test_dir = organize_dataset(
+                train_files,
+                test_files,
+                split_dir,
+                labeled_data=labeled_data,
+                link_mode=args.link_mode,
+                file_callback=count_file,
+                workers=args.split_workers,
+                val_files=val_files,
+            )
+            organized.append((train_dir, test_dir, split_dir))
+    except KeyboardInterrupt:
+        print("Interrupted; run again to resume the split.")
+        return
+    finally:
+        progress.close()
     print(f"Dataset organized:")
-    print(f"  Train: {len(train_files)} images in {train_dir}")
-    print(f"  Test: {len(test_files)} images in {test_dir}")
+    for (train_dir, test_dir, split_dir), (_, train, test, val) in zip(
+        organized, layouts
+    ):
+        print(f"  Train: {len(train)} images in {train_dir}")
+        if val is not None:
+            val_dir = os.path.join(split_dir, "val")
+            print(f"  Val: {len(val)} images in {val_dir}")
+        print(f"  Test: {len(test)} images in {test_dir}")
+    if methods:
+        print(
+            "  Files: "
+            + ", ".join(f"{n} {method}" for method, n in methods.items())
+            + f" ({copied[0] / 1e6:.1f} MB copied)"
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,288 @@
+import bisect
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+# Upper bounds (seconds) of the stage duration buckets
+SECONDS_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+)
+
+# Upper bounds of the per-image token count buckets
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram of observed values.
+
+    Memory does not grow with the number of observations; quantiles are
+    estimated by linear interpolation inside the bucket that holds them.
+    Not thread-safe on its own; ``Metrics`` calls it under its lock.
+    """
+
+    def __init__(self, buckets: Sequence[float]):
+        """
+        Args:
+            buckets (Sequence[float]): Sorted upper bounds of the buckets.
+                Values above the last bound go to an overflow bucket.
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        """
+        Record one value.
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Estimate a quantile of the observed values.
+
+        Args:
+            q (float): The quantile, between 0 and 1.
+
+        Returns:
+            Optional[float]: The estimate, or None without observations.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                low = self.buckets[i - 1] if i > 0 else 0.0
+                high = self.buckets[i] if i < len(self.buckets) else self.max
+                high = min(high, self.max)
+                low = min(low, high)
+                return low + (high - low) * (rank - seen) / count
+            seen += count
+        return self.max
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Summarize the histogram.
+
+        Returns:
+            Dict[str, Any]: Count, sum, mean, max, p50/p95/p99 estimates and
+            the cumulative count of each bucket.
+        """
+        cumulative = []
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            cumulative.append([bound, total])
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else None,
+            "max": self.max if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": cumulative,
+        }
+
+
+class Metrics:
+    """
+    Process-wide labeling metrics.
+
+    Collects the duration of each labeling stage, the input and output
+    tokens reported by the model per image, and errors by exception type.
+    The stages recorded by ``labeler`` are:
+
+    - ``encode``: decoding, resizing and base64 encoding of an image
+    - ``wait``: waiting for a free slot on an inference server
+    - ``request``: the request to the model, prefill and generation
+    - ``ttft``: time to the first streamed token, i.e. queueing and prefill
+    - ``parse``: decoding the JSON response
+
+    Safe to use from several threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Drop all recorded values.
+        """
+        with self._lock:
+            self._stages: Dict[str, Histogram] = {}
+            self._tokens = {
+                "input": Histogram(TOKEN_BUCKETS),
+                "output": Histogram(TOKEN_BUCKETS),
+            }
+            self._errors = Counter()
+
+    def observe(self, stage: str, seconds: float):
+        """
+        Record the duration of one run of a stage.
+
+        Args:
+            stage (str): The stage name.
+            seconds (float): The duration in seconds.
+        """
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = Histogram(SECONDS_BUCKETS)
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        """
+        Record the duration of the enclosed block, even if it raises.
+
+        Args:
+            stage (str): The stage name.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def record_usage(self, usage: Any, images: int = 1):
+        """
+        Record the token usage of a response.
+
+        Args:
+            usage (Any): The ``usage`` of an OpenAI response, may be None.
+            images (int): Number of images the request covered; the tokens
+                are split evenly between them.
+        """
+        prompt_tokens = getattr(usage, "prompt_tokens", None)
+        completion_tokens = getattr(usage, "completion_tokens", None)
+        with self._lock:
+            for _ in range(images):
+                if isinstance(prompt_tokens, int):
+                    self._tokens["input"].observe(prompt_tokens / images)
+                if isinstance(completion_tokens, int):
+                    self._tokens["output"].observe(completion_tokens / images)
+
+    def record_error(self, error: BaseException):
+        """
+        Count an error by its exception type.
+
+        Args:
+            error (BaseException): The exception.
+        """
+        with self._lock:
+            self._errors[type(error).__name__] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Get the current metrics.
+
+        Returns:
+            Dict[str, Any]: Histogram summaries per stage (seconds) and per
+            token kind, and error counts per exception type.
+        """
+        with self._lock:
+            return {
+                "stages": {
+                    stage: histogram.snapshot()
+                    for stage, histogram in self._stages.items()
+                },
+                "tokens": {
+                    kind: histogram.snapshot()
+                    for kind, histogram in self._tokens.items()
+                },
+                "errors": dict(self._errors),
+            }
+
+    def render_prometheus(self) -> str:
+        """
+        Render the metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics text.
+        """
+        snapshot = self.snapshot()
+        lines = []
+
+        def _histogram(name: str, label: str, values: Dict[str, Any]):
+            lines.append(f"# TYPE {name} histogram")
+            for key, summary in values.items():
+                tag = f'{label}="{key}"'
+                for bound, count in summary["buckets"]:
+                    lines.append(
+                        f'{name}_bucket{{{tag},le="{bound}"}} {count}'
+                    )
+                lines.append(
+                    f'{name}_bucket{{{tag},le="+Inf"}} {summary["count"]}'
+                )
+                lines.append(f"{name}_sum{{{tag}}} {summary['sum']}")
+                lines.append(f"{name}_count{{{tag}}} {summary['count']}")
+
+        _histogram("image_labeler_stage_seconds", "stage", snapshot["stages"])
+        _histogram(
+            "image_labeler_tokens_per_image", "kind", snapshot["tokens"]
+        )
+        lines.append("# TYPE image_labeler_errors_total counter")
+        for error_type, count in snapshot["errors"].items():
+            lines.append(
+                f'image_labeler_errors_total{{type="{error_type}"}} {count}'
+            )
+        return "\n".join(lines) + "\n"
+
+    def summary_lines(self) -> List[str]:
+        """
+        Format the metrics as a short human readable report.
+
+        Returns:
+            List[str]: The report lines.
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for stage, summary in snapshot["stages"].items():
+            if not summary["count"]:
+                continue
+            lines.append(
+                f"  {stage:<8} n={summary['count']:<6} "
+                f"mean {summary['mean']:.3f}s  p50 {summary['p50']:.3f}s  "
+                f"p95 {summary['p95']:.3f}s  max {summary['max']:.3f}s"
+            )
+        for kind, summary in snapshot["tokens"].items():
+            if not summary["count"]:
+                continue
+            lines.append(
+                f"  {kind} tokens/image: mean {summary['mean']:.0f}  "
+                f"p95 {summary['p95']:.0f}  total {summary['sum']:.0f}"
+            )
+        if snapshot["errors"]:
+            errors = ", ".join(
+                f"{error_type}: {count}"
+                for error_type, count in sorted(snapshot["errors"].items())
+            )
+            lines.append(f"  errors: {errors}")
+        return lines
+
+
+# Metrics of all labeling done by this process
+metrics = Metrics()
@@ -0,0 +1,239 @@
+import os
+import multiprocessing
+import queue
+import signal
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from .labeler import (
+    _error_result,
+    _lookup_cache,
+    backend_pool,
+    encode_image,
+    label_encoded_image,
+)
+from .metrics import metrics
+
+# Marks the end of the items flowing through a queue
+_DONE = object()
+
+
+def _ignore_sigint():
+    """
+    Initializer of the encoder processes: Ctrl-C is handled by the parent,
+    which shuts the pool down cleanly.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _encode_timed(image_path: str, max_size: int) -> Tuple[float, str]:
+    """
+    Run ``encode_image`` in an encoder process and measure it; metrics
+    recorded inside the worker process do not reach the parent.
+    """
+    start = time.perf_counter()
+    base64_image = encode_image(image_path, max_size=max_size)
+    return time.perf_counter() - start, base64_image
+
+
+def run_pipeline(
+    image_paths: Iterable[str],
+    on_result: Callable[[int, str, Dict[str, Any]], None],
+    encode_workers: Optional[int] = None,
+    max_in_flight: Optional[int] = None,
+    queue_size: int = 16,
+    prompt: str = "Describe this image and provide a label.",
+    max_size: int = 1024,
+    use_cache: bool = True,
+    stream: bool = False,
+    token_budget: Optional[int] = None,
+) -> int:
+    """
+    Label images with encoding, inference and result handling overlapped.
+
+    The pipeline has three stages connected by bounded queues:
+
+    1. Images are looked up in the label cache; a process pool decodes,
+       resizes and encodes the misses (``encode_image``) at most
+       ``queue_size`` images ahead of the request stage.
+    2. ``max_in_flight`` threads send the encoded images to the model.
+    3. A single writer thread calls ``on_result`` for every finished image.
+
+    A full queue blocks the stage feeding it, so memory stays bounded and
+    throughput is set by the slowest stage. On Ctrl-C, pending work is
+    cancelled, results that already finished are still handed to
+    ``on_result`` and the ``KeyboardInterrupt`` is re-raised.
+
+    Args:
+        image_paths (Iterable[str]): Paths of the images to label.
+        on_result (Callable): Called as ``on_result(index, image_path,
+            result)`` from the writer thread, in completion order.
+        encode_workers (Optional[int]): Number of encoder processes.
+            Defaults to the number of CPUs.
+        max_in_flight (Optional[int]): Number of concurrent requests.
+            Defaults to the maximum capacity of the backend
+            pool.
+        queue_size (int): Capacity of the queues between the stages.
+        prompt (str): The prompt to send to the VLM.
+        max_size (int): Maximum image size for encoding.
+        use_cache (bool): Whether to use the label cache.
+        stream (bool): Stream the answers, see ``label_encoded_image``.
+        token_budget (Optional[int]): Maximum number of tokens per answer.
+
+    Returns:
+        int: The number of images handed to ``on_result``.
+    """
+    if encode_workers is None:
+        encode_workers = os.cpu_count() or 1
+    if max_in_flight is None:
+        max_in_flight = backend_pool.max_capacity
+
+    encoded_queue = queue.Queue(maxsize=queue_size)
+    result_queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    written = [0]
+    writer_errors = []
+
+    def _put(target: queue.Queue, item) -> bool:
+        # Blocking put that gives up once the pipeline is stopping
+        while not stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(source: queue.Queue):
+        # Blocking get that gives up once the pipeline is stopping, when the
+        # feeder may no longer be able to deliver the end markers
+        while not stop.is_set():
+            try:
+                return source.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _feed(executor: ProcessPoolExecutor):
+        # Stage 1: keep up to queue_size encodes running ahead and hand
+        # them on in submission order
+        pending = deque()
+        paths = enumerate(image_paths)
+        try:
+            while not stop.is_set():
+                for index, image_path in paths:
+                    if stop.is_set():
+                        break
+                    # Cache hits skip the encoder processes and the model
+                    try:
+                        _, cache_key, cached = _lookup_cache(
+                            image_path, prompt, max_size, use_cache
+                        )
+                    except OSError as e:
+                        cached = _error_result(image_path, e)
+                    if cached is not None:
+                        _put(result_queue, (index, image_path, cached))
+                        continue
+                    try:
+                        future = executor.submit(
+                            _encode_timed, image_path, max_size
+                        )
+                    except RuntimeError:
+                        # The pool was shut down by a Ctrl-C
+                        return
+                    pending.append((index, image_path, cache_key, future))
+                    if len(pending) >= queue_size:
+                        break
+                if not pending:
+                    break
+
+                index, image_path, cache_key, future = pending.popleft()
+                try:
+                    seconds, base64_image = future.result()
+                except Exception as e:
+                    _put(
+                        result_queue,
+                        (index, image_path, _error_result(image_path, e)),
+                    )
+                    continue
+                metrics.observe("encode", seconds)
+                _put(
+                    encoded_queue, (index, image_path, cache_key, base64_image)
+                )
+        finally:
+            for _ in range(max_in_flight):
+                _put(encoded_queue, _DONE)
+
+    def _request():
+        # Stage 2: send encoded images to the model
+        while True:
+            item = _get(encoded_queue)
+            if item is _DONE:
+                return
+            index, image_path, cache_key, base64_image = item
+            result = label_encoded_image(
+                image_path,
+                base64_image,
+                prompt=prompt,
+                cache_key=cache_key,
+                stream=stream,
+                token_budget=token_budget,
+            )
+            _put(result_queue, (index, image_path, result))
+
+    def _write():
+        # Stage 3: hand results to the caller; keeps draining after a stop
+        # so that finished results are not lost
+        while True:
+            item = result_queue.get()
+            if item is _DONE:
+                return
+            if writer_errors:
+                continue
+            try:
+                on_result(*item)
+                written[0] += 1
+            except Exception as e:
+                # Stop the other stages, the error is raised by the caller
+                writer_errors.append(e)
+                stop.set()
+
+    # Spawned workers do not inherit the locks and open files of this
+    # process' threads, which forked workers would
+    executor = ProcessPoolExecutor(
+        max_workers=encode_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_ignore_sigint,
+    )
+    feeder = threading.Thread(target=_feed, args=(executor,), daemon=True)
+    requesters = [
+        threading.Thread(target=_request, daemon=True)
+        for _ in range(max_in_flight)
+    ]
+    writer = threading.Thread(target=_write, daemon=True)
+    for thread in [feeder, *requesters, writer]:
+        thread.start()
+
+    try:
+        # Join with a timeout so that Ctrl-C reaches the main thread
+        for thread in [feeder, *requesters]:
+            while thread.is_alive():
+                thread.join(timeout=0.1)
+    except KeyboardInterrupt:
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    finally:
+        # Results of requests that completed are still written out
+        for thread in requesters:
+            thread.join(timeout=0 if stop.is_set() else None)
+        result_queue.put(_DONE)
+        writer.join()
+        executor.shutdown(wait=not stop.is_set(), cancel_futures=True)
+
+    if writer_errors:
+        raise writer_errors[0]
+    return written[0]
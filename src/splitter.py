@@ -1,13 +1,314 @@
 import os
-import shutil
-import random
-from typing import List, Tuple, Dict, Any, Optional
 import json
-from .data_loader import ensure_directory
+import shutil
+import stat
+import hashlib
+import numpy as np
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import ExitStack
+from itertools import compress
+from typing import (
+    List,
+    Tuple,
+    Dict,
+    Any,
+    Callable,
+    Iterable,
+    Optional,
+    Sequence,
+    Union,
+)
+from .data_loader import (
+    LabelStore,
+    ensure_directory,
+    hash_file,
+    iter_labels,
+    iter_latest_labels,
+    label_writer,
+)
+
+# Ways organize_dataset can place the images in train/ and test/
+LINK_MODES = ("copy", "hardlink", "reflink", "symlink", "manifest")
+
+# Methods tried for each mode, in order; copying always works
+_FALLBACKS = {
+    "copy": ("copy",),
+    "hardlink": ("hardlink", "reflink", "copy"),
+    "reflink": ("reflink", "copy"),
+    "symlink": ("symlink", "copy"),
+}
+
+# Linux ioctl sharing the data blocks of two files (btrfs, XFS, ...)
+_FICLONE = 0x40049409
+
+# File listing where every image of the split was placed
+SPLIT_MANIFEST = "split_manifest.jsonl"
+
+# Files placed so far by an unfinished organize_dataset, used to resume
+SPLIT_JOURNAL = ".split_journal.jsonl"
+
+
+def _strata(
+    count: int, labels: Optional[Sequence[Optional[str]]]
+) -> np.ndarray:
+    """
+    Number the distinct labels; without labels all images share stratum 0.
+    """
+    if labels is None:
+        return np.zeros(count, dtype=np.int64)
+    if len(labels) != count:
+        raise ValueError("Need one label per image file")
+    index = {label: i for i, label in enumerate(dict.fromkeys(labels))}
+    return np.fromiter(
+        map(index.__getitem__, labels), dtype=np.int64, count=count
+    )
+
+
+def _path_order(
+    image_files: Sequence[str],
+    labels: Optional[Sequence[Optional[str]]],
+    seed: Optional[int],
+) -> Tuple[Optional[np.ndarray], Optional[Sequence[Optional[str]]]]:
+    """
+    With a seed, put the images in path order first, so that a seed gives
+    the same assignment whatever order the files were scanned in.
+
+    Returns:
+        Tuple: The image indexes in path order (None without a seed) and
+        the labels in that order.
+    """
+    if seed is None:
+        return None, labels
+    by_path = np.array(
+        sorted(range(len(image_files)), key=image_files.__getitem__),
+        dtype=np.int64,
+    )
+    if labels is not None and len(labels) == len(image_files):
+        labels = [labels[i] for i in by_path]
+    return by_path, labels
+
+
+def _shuffle_by_stratum(
+    strata: np.ndarray, rng: np.random.Generator
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Order the images by stratum and randomly within each stratum.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The image indexes in that order and
+        the rank of each of them within its stratum.
+    """
+    order = rng.permutation(len(strata))
+    # A stable sort keeps the random order within each stratum
+    order = order[np.argsort(strata[order], kind="stable")]
+    counts = np.bincount(strata)
+    starts = np.cumsum(counts) - counts
+    rank = np.arange(len(strata)) - starts[strata[order]]
+    return order, rank
+
+
+def _largest_remainder(
+    quotas: np.ndarray, total: int, rng: np.random.Generator
+) -> np.ndarray:
+    """
+    Round quotas down and give the images left over to the largest
+    remainders, ties broken at random, so the counts sum to total.
+    """
+    counts = np.floor(quotas + 1e-9)
+    remainders = quotas - counts
+    missing = int(round(total - counts.sum()))
+    ties = rng.random(len(quotas))
+    counts[np.lexsort((ties, -remainders))[:missing]] += 1
+    return counts
+
+
+def _split_sizes(
+    counts: np.ndarray, ratios: np.ndarray, rng: np.random.Generator
+) -> np.ndarray:
+    """
+    Number of images of each stratum in each split.
+
+    The overall split sizes are the largest-remainder rounding of the
+    ratios, and every stratum gets its quota in each split rounded down or
+    up. The images a stratum has left after rounding down are handed out
+    split by split to the strata with the largest remainders, strata with
+    fewer splits left to place them in going first.
+
+    Returns:
+        np.ndarray: A strata x splits array of counts.
+    """
+    quotas = counts[:, None] * ratios[None, :]
+    sizes = np.floor(quotas + 1e-9)
+    remainders = np.where(quotas - sizes > 1e-9, quotas - sizes, 0.0)
+    support = remainders > 0
+    left = counts - sizes.sum(axis=1)
+    missing = _largest_remainder(
+        counts.sum() * ratios, counts.sum(), rng
+    ) - sizes.sum(axis=0)
+    ties = rng.random(len(counts))
+    for split in range(len(ratios)):
+        eligible = (left > 0) & support[:, split]
+        later = support[:, split:].sum(axis=1) - support[:, split]
+        forced = np.flatnonzero(eligible & (left > later))
+        candidates = np.flatnonzero(eligible & (left <= later))
+        candidates = candidates[
+            np.lexsort(
+                (
+                    ties[candidates],
+                    -remainders[candidates, split],
+                    later[candidates] - left[candidates],
+                )
+            )
+        ]
+        take = max(int(missing[split]) - len(forced), 0)
+        chosen = np.concatenate([forced, candidates[:take]])
+        sizes[chosen, split] += 1
+        left[chosen] -= 1
+    # Not reached for valid ratios; keeps every image assigned regardless
+    sizes[:, np.argmax(ratios)] += left
+    return sizes
+
+
+def assign_splits(
+    image_files: Sequence[str],
+    ratios: Sequence[float],
+    labels: Optional[Sequence[Optional[str]]] = None,
+    seed: Optional[int] = None,
+) -> np.ndarray:
+    """
+    Randomly assign each image to one of several splits.
+
+    With labels, every label is split in the given ratios on its own
+    (stratified), so rare classes are represented in each split as far as
+    their size allows. The number of images per split and label is its
+    quota rounded down or up, chosen so that the overall split sizes match
+    the ratios as closely as possible, also with many small labels.
+
+    Args:
+        image_files (Sequence[str]): Paths to the image files.
+        ratios (Sequence[float]): Fraction of images per split, summing to 1.
+        labels (Optional[Sequence[Optional[str]]]): Label of each image,
+            e.g. from ``labels_for_files``; None disables stratification.
+        seed (Optional[int]): Seed for a reproducible assignment.
+
+    Returns:
+        np.ndarray: The split index of each image.
+    """
+    ratios = np.asarray(ratios, dtype=np.float64)
+    if (
+        not len(ratios)
+        or (ratios < 0).any()
+        or not np.isclose(ratios.sum(), 1.0)
+    ):
+        raise ValueError("Split ratios must be non-negative and sum to 1")
+    by_path, labels = _path_order(image_files, labels, seed)
+    strata = _strata(len(image_files), labels)
+    rng = np.random.default_rng(seed)
+    order, rank = _shuffle_by_stratum(strata, rng)
+
+    # First rank of each split in each stratum
+    counts = np.bincount(strata, minlength=1)
+    bounds = np.cumsum(_split_sizes(counts, ratios, rng), axis=1)
+    splits = np.empty(len(image_files), dtype=np.int64)
+    images = order if by_path is None else by_path[order]
+    splits[images] = (rank[:, None] >= bounds[strata[order]]).sum(axis=1)
+    return splits
+
+
+def assign_folds(
+    image_files: Sequence[str],
+    folds: int,
+    labels: Optional[Sequence[Optional[str]]] = None,
+    seed: Optional[int] = None,
+) -> np.ndarray:
+    """
+    Randomly assign each image to one of k folds for cross-validation.
+
+    Fold sizes differ by at most one image, also per label when labels are
+    given (stratified).
+
+    Args:
+        image_files (Sequence[str]): Paths to the image files.
+        folds (int): Number of folds, at least 2.
+        labels (Optional[Sequence[Optional[str]]]): Label of each image;
+            None disables stratification.
+        seed (Optional[int]): Seed for a reproducible assignment.
+
+    Returns:
+        np.ndarray: The fold index of each image.
+    """
+    if folds < 2:
+        raise ValueError("Need at least 2 folds")
+    by_path, labels = _path_order(image_files, labels, seed)
+    strata = _strata(len(image_files), labels)
+    order, _ = _shuffle_by_stratum(strata, np.random.default_rng(seed))
+    assignment = np.empty(len(image_files), dtype=np.int64)
+    images = order if by_path is None else by_path[order]
+    # Dealing the images out in stratum order balances every stratum
+    assignment[images] = np.arange(len(image_files)) % folds
+    return assignment
+
+
+def _select(
+    image_files: Sequence[str], assignment: np.ndarray, value: int
+) -> List[str]:
+    return list(compress(image_files, (assignment == value).tolist()))
+
+
+def labels_for_files(
+    image_files: Sequence[str], labeled_data: Iterable[Dict[str, Any]]
+) -> List[Optional[str]]:
+    """
+    Look up the label of each image file, e.g. to stratify a split.
+
+    Labels are matched by 'original_path', or by 'filename' for labels
+    without a path, in a single pass over the labeled data; a later label
+    of the same image supersedes earlier ones.
+
+    Args:
+        image_files (Sequence[str]): Paths to the image files.
+        labeled_data (Iterable[Dict[str, Any]]): Labeled data dictionaries,
+            read once.
+
+    Returns:
+        List[Optional[str]]: The label of each image, None if unlabeled.
+    """
+    by_path: Dict[str, Optional[str]] = {}
+    by_name: Dict[str, Optional[str]] = {}
+    for item in labeled_data:
+        path = item.get("original_path")
+        if path:
+            by_path[path] = item.get("label")
+        else:
+            name = item.get("filename")
+            if name:
+                by_name[name] = item.get("label")
+
+    missing = object()
+    labels = [by_path.get(file_path, missing) for file_path in image_files]
+    by_abs_path = None
+    for i, label in enumerate(labels):
+        if label is not missing:
+            continue
+        if by_abs_path is None:
+            # Only needed when the paths are spelled differently
+            by_abs_path = {
+                os.path.abspath(path): label for path, label in by_path.items()
+            }
+        file_path = image_files[i]
+        labels[i] = by_abs_path.get(
+            os.path.abspath(file_path),
+            by_name.get(os.path.basename(file_path)),
+        )
+    return labels
 
 
 def split_dataset(
-    image_files: List[str], split_ratio: float
+    image_files: List[str],
+    split_ratio: float,
+    labels: Optional[Sequence[Optional[str]]] = None,
+    seed: Optional[int] = None,
 ) -> Tuple[List[str], List[str]]:
     """
     Split a list of image files into train and test sets based on the ratio.
@@ -16,6 +317,9 @@ def split_dataset(
         image_files (List[str]): List of absolute paths to image files.
         split_ratio (float): The proportion of images to include in the training set.
                              Must be between 0 and 1 (e.g., 0.8 for 80% train).
+        labels (Optional[Sequence[Optional[str]]]): Label of each image to
+            stratify by, see ``assign_splits``.
+        seed (Optional[int]): Seed for a reproducible split.
 
     Returns:
         Tuple[List[str], List[str]]: A tuple containing (train_files, test_files).
@@ -23,33 +327,295 @@ def split_dataset(
     if not 0 <= split_ratio <= 1:
         raise ValueError("Split ratio must be between 0 and 1")
 
-    # Shuffle to ensure random split
-    files_copy = image_files.copy()
-    random.shuffle(files_copy)
+    splits = assign_splits(
+        image_files, [split_ratio, 1 - split_ratio], labels, seed
+    )
+    return _select(image_files, splits, 0), _select(image_files, splits, 1)
+
+
+def train_val_test_split(
+    image_files: List[str],
+    train_ratio: float,
+    val_ratio: float,
+    labels: Optional[Sequence[Optional[str]]] = None,
+    seed: Optional[int] = None,
+) -> Tuple[List[str], List[str], List[str]]:
+    """
+    Split image files into train, validation and test sets.
+
+    Args:
+        image_files (List[str]): Paths to the image files.
+        train_ratio (float): Fraction of images in the training set.
+        val_ratio (float): Fraction of images in the validation set; the
+            rest is the test set.
+        labels (Optional[Sequence[Optional[str]]]): Label of each image to
+            stratify by, see ``assign_splits``.
+        seed (Optional[int]): Seed for a reproducible split.
+
+    Returns:
+        Tuple[List[str], List[str], List[str]]: The train, validation and
+        test files.
+    """
+    test_ratio = 1 - train_ratio - val_ratio
+    if min(train_ratio, val_ratio) < 0 or test_ratio < -1e-9:
+        raise ValueError(
+            "Train and validation ratios must be non-negative and sum to at "
+            "most 1"
+        )
+    splits = assign_splits(
+        image_files,
+        [train_ratio, val_ratio, max(test_ratio, 0.0)],
+        labels,
+        seed,
+    )
+    return tuple(_select(image_files, splits, i) for i in range(3))
+
+
+def kfold_split(
+    image_files: List[str],
+    folds: int,
+    labels: Optional[Sequence[Optional[str]]] = None,
+    seed: Optional[int] = None,
+) -> List[Tuple[List[str], List[str]]]:
+    """
+    Split image files into k train/test pairs for cross-validation.
+
+    Every image is in the test set of exactly one pair, see
+    ``assign_folds``.
+
+    Args:
+        image_files (List[str]): Paths to the image files.
+        folds (int): Number of folds, at least 2.
+        labels (Optional[Sequence[Optional[str]]]): Label of each image to
+            stratify by.
+        seed (Optional[int]): Seed for reproducible folds.
+
+    Returns:
+        List[Tuple[List[str], List[str]]]: The (train_files, test_files) of
+        each fold.
+    """
+    assignment = assign_folds(image_files, folds, labels, seed)
+    return [
+        (
+            list(compress(image_files, (assignment != fold).tolist())),
+            _select(image_files, assignment, fold),
+        )
+        for fold in range(folds)
+    ]
+
+
+def _reflink(source: str, target: str):
+    """
+    Clone a file without copying its data, if the filesystem supports it.
+
+    Raises:
+        OSError: If cloning is not supported here.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError("Reflinks are not supported on this platform")
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.remove(target)
+            raise
+    shutil.copystat(source, target)
+
+
+def place_file(source: str, target: str, link_mode: str = "copy") -> str:
+    """
+    Put a file at target by copying or linking it.
+
+    Falls back to the next method when one is not possible, e.g. hardlinks
+    across filesystems or reflinks on filesystems without block sharing:
+    hardlink, then reflink, then copy. An existing target is replaced.
+
+    Args:
+        source (str): Path of the existing file.
+        target (str): Path of the new file.
+        link_mode (str): The preferred method, one of ``LINK_MODES`` except
+            "manifest".
+
+    Returns:
+        str: The method used ("copy", "hardlink", "reflink" or "symlink").
+    """
+    if link_mode not in _FALLBACKS:
+        raise ValueError(f"Invalid link mode: {link_mode!r}")
+    # Never write through an old link into the source
+    if os.path.lexists(target):
+        os.remove(target)
+    for method in _FALLBACKS[link_mode][:-1]:
+        try:
+            if method == "hardlink":
+                os.link(source, target)
+            elif method == "reflink":
+                _reflink(source, target)
+            else:
+                os.symlink(os.path.abspath(source), target)
+            return method
+        except OSError:
+            continue
+    shutil.copy2(source, target)
+    return "copy"
+
+
+def _target_names(files: Sequence[str]) -> List[str]:
+    """
+    Choose the file names of the images of one split.
+
+    Images sharing a base name get a suffix derived from their full path,
+    so they do not overwrite each other and keep their name when the split
+    is done again.
+    """
+    names = [os.path.basename(f) for f in files]
+    counts = Counter(names)
+    for i, (path, name) in enumerate(zip(files, names)):
+        if counts[name] > 1:
+            stem, ext = os.path.splitext(name)
+            digest = hashlib.sha1(os.path.abspath(path).encode("utf-8"))
+            names[i] = f"{stem}_{digest.hexdigest()[:8]}{ext}"
+    return names
 
-    # Calculate split index
-    split_index = int(len(files_copy) * split_ratio)
-    train_files = files_copy[:split_index]
-    test_files = files_copy[split_index:]
 
-    return train_files, test_files
+def _is_placed(
+    source: str, source_stat: os.stat_result, target: str, link_mode: str
+) -> Optional[bool]:
+    """
+    Check whether target already holds source as link_mode places it.
+
+    Returns:
+        Optional[bool]: True or False, or None if the target is a regular
+        file of the same size and mtime, which is identical unless its
+        content was changed without changing the mtime.
+    """
+    try:
+        target_stat = os.lstat(target)
+    except FileNotFoundError:
+        return False
+    if stat.S_ISLNK(target_stat.st_mode):
+        return link_mode == "symlink" and os.readlink(
+            target
+        ) == os.path.abspath(source)
+    if os.path.samestat(source_stat, target_stat):
+        # Writing to this copy would change the source
+        return link_mode == "hardlink"
+    if link_mode in ("hardlink", "symlink"):
+        return False
+    if (target_stat.st_size, target_stat.st_mtime_ns) != (
+        source_stat.st_size,
+        source_stat.st_mtime_ns,
+    ):
+        return False
+    return None
+
+
+def _materialize(
+    source: str,
+    target: str,
+    link_mode: str,
+    verify_hash: bool,
+    journaled: Optional[Dict[str, Any]],
+) -> Dict[str, Any]:
+    """
+    Place one file unless it is already there, see ``organize_dataset``.
+
+    Returns:
+        Dict[str, Any]: The entry recorded for the file.
+    """
+    source_stat = os.stat(source)
+    entry = {
+        "source": os.path.abspath(source),
+        "target": target,
+        "link_mode": link_mode,
+        "size": source_stat.st_size,
+        "mtime": source_stat.st_mtime_ns,
+        "bytes": 0,
+        "skipped": True,
+    }
+    if (
+        journaled is not None
+        and journaled["source"] == entry["source"]
+        and (journaled["size"], journaled["mtime"])
+        == (entry["size"], entry["mtime"])
+        and os.path.lexists(target)
+    ):
+        # Placed by the interrupted run, possibly with a fallback method
+        return dict(entry, method=journaled["method"])
+    placed = _is_placed(source, source_stat, target, link_mode)
+    if placed is None:
+        placed = not verify_hash or hash_file(source) == hash_file(target)
+    if placed:
+        method = "symlink" if os.path.islink(target) else link_mode
+        if method == "reflink":
+            # Copies and clones cannot be told apart
+            method = "copy"
+        return dict(entry, method=method)
+
+    # Written next to the target and renamed, so a target is never partial
+    partial = os.path.join(
+        os.path.dirname(target), f".{os.path.basename(target)}.partial"
+    )
+    method = place_file(source, partial, link_mode)
+    os.replace(partial, target)
+    copied = source_stat.st_size if method == "copy" else 0
+    return dict(entry, method=method, bytes=copied, skipped=False)
 
 
 def organize_dataset(
     train_files: List[str],
     test_files: List[str],
     output_dir: str,
-    labeled_data: Optional[List[Dict[str, Any]]] = None,
+    labeled_data: Optional[Union[str, Iterable[Dict[str, Any]]]] = None,
+    link_mode: str = "copy",
+    file_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+    workers: int = 8,
+    verify_hash: bool = False,
+    val_files: Optional[List[str]] = None,
 ):
     """
     Copy files into train and test subdirectories in the output directory.
     If labeled_data is provided, it also splits the labels into train/labels.json and test/labels.json.
 
+    Files are placed by a thread pool. Each file is written to a temporary
+    name and renamed, so no target is ever incomplete. Finished files are
+    recorded in a journal in the output directory; calling this again
+    after an interruption, or after an earlier split into the same
+    directory, skips the files that are already in place (recorded with
+    an unchanged source, or of the same size and mtime, or the same link)
+    and removes those that are no longer part of the split.
+
+    Images with the same file name in one split are renamed to
+    ``<name>_<hash of the path><ext>``; their labels get the new
+    'filename'. Where each file went and how is recorded in
+    ``split_manifest.jsonl`` in the output directory (entries with 'split',
+    'source', 'target', 'link_mode', 'method', the source 'size' and
+    'mtime', the 'bytes' copied and whether the file was 'skipped').
+
     Args:
         train_files (List[str]): List of paths for the training set.
         test_files (List[str]): List of paths for the test set.
         output_dir (str): The base directory where 'train' and 'test' folders will be created.
-        labeled_data (Optional[List[Dict[str, Any]]]): List of label dictionaries.
+        labeled_data (Optional[Union[str, Iterable[Dict[str, Any]]]]): Label
+            dictionaries (e.g. a list or a ``LabelStore``, read once), or the
+            path of a label file, which is streamed instead of loaded
+            (keeping the last record of each image, see
+            ``iter_latest_labels``).
+        link_mode (str): How the images are placed, one of ``LINK_MODES``:
+            "copy", "hardlink" (no extra disk space; the files share their
+            content with the originals), "reflink" (copy-on-write clone on
+            filesystems such as btrfs or XFS), "symlink" or "manifest" (no
+            files, only ``split_manifest.jsonl``). Links fall back to the
+            next method when they are not possible, see ``place_file``.
+        file_callback (Optional[Callable[[Dict[str, Any]], None]]): Called
+            with the manifest entry of each file once it is placed.
+        workers (int): Number of files placed concurrently.
+        verify_hash (bool): Compare the content hash of existing files of
+            the same size and mtime before skipping them.
+        val_files (Optional[List[str]]): List of paths for a validation
+            set, placed in a 'val' folder next to 'train' and 'test'.
 
     Returns:
         Tuple[str, str]: Paths to the created train and test directories.
@@ -57,62 +623,170 @@ def organize_dataset(
     train_dir = os.path.join(output_dir, "train")
     test_dir = os.path.join(output_dir, "test")
 
+    if link_mode not in LINK_MODES:
+        raise ValueError(f"Invalid link mode: {link_mode!r}")
+
     ensure_directory(train_dir)
     ensure_directory(test_dir)
 
-    # Copy files to destination
-    for file_path in train_files:
-        shutil.copy2(file_path, train_dir)
+    splits = [
+        ("train", train_dir, train_files),
+        ("test", test_dir, test_files),
+    ]
+    if val_files is not None:
+        splits.append(("val", os.path.join(output_dir, "val"), val_files))
+        ensure_directory(splits[-1][1])
+
+    # (split, source, target) of every file, and its name per split
+    plan = []
+    names: Dict[str, Dict[str, str]] = {}
+    for split, directory, files in splits:
+        names[split] = {}
+        for file_path, name in zip(files, _target_names(files)):
+            abs_path = os.path.abspath(file_path)
+            if abs_path in names[split]:
+                continue
+            names[split][abs_path] = name
+            target = None
+            if link_mode != "manifest":
+                target = os.path.join(directory, name)
+            plan.append((split, file_path, target))
+
+    # Files placed by an earlier or an interrupted split
+    journal_path = os.path.join(output_dir, SPLIT_JOURNAL)
+    journaled = {}
+    previous = set()
+    for name in (SPLIT_MANIFEST, SPLIT_JOURNAL):
+        path = os.path.join(output_dir, name)
+        if os.path.exists(path):
+            for entry in iter_labels(path):
+                if not entry.get("target"):
+                    continue
+                previous.add(entry["target"])
+                if entry.get("link_mode") == link_mode:
+                    journaled[entry["target"]] = entry
+    targets = {target for _, _, target in plan}
+    for target in previous - targets:
+        if os.path.lexists(target):
+            os.remove(target)
 
-    for file_path in test_files:
-        shutil.copy2(file_path, test_dir)
+    # Copy or link files to destination
+    entries: Dict[int, Dict[str, Any]] = {}
+    journal = LabelStore(journal_path)
+    # Journal records are written in batches; files placed but not yet
+    # recorded are found again by _is_placed
+    unrecorded: List[Dict[str, Any]] = []
+    executor = ThreadPoolExecutor(
+        max_workers=workers, thread_name_prefix="organize"
+    )
+    pending = {}
+
+    def finish(i: int, entry: Dict[str, Any]):
+        entries[i] = entry = {"split": plan[i][0], **entry}
+        unrecorded.append(entry)
+        if len(unrecorded) >= 256:
+            journal.extend(unrecorded)
+            unrecorded.clear()
+        if file_callback is not None:
+            file_callback(entry)
+
+    def collect(limit: int):
+        # Record finished files down to limit pending ones; a failure is
+        # raised after the other finished files are recorded
+        while len(pending) > limit:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            failed = None
+            for future in done:
+                i = pending.pop(future)
+                if future.exception() is not None:
+                    failed = failed or future
+                else:
+                    finish(i, future.result())
+            if failed is not None:
+                failed.result()
+
+    try:
+        for i, (split, file_path, target) in enumerate(plan):
+            if target is None:
+                finish(
+                    i,
+                    {
+                        "source": os.path.abspath(file_path),
+                        "target": None,
+                        "link_mode": link_mode,
+                        "method": "manifest",
+                        "bytes": 0,
+                        "skipped": False,
+                    },
+                )
+                continue
+            # Bounded window, like the labeling engine
+            collect(workers * 4 - 1)
+            future = executor.submit(
+                _materialize,
+                file_path,
+                target,
+                link_mode,
+                verify_hash,
+                journaled.get(target),
+            )
+            pending[future] = i
+        collect(0)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        journal.extend(unrecorded)
+        journal.close()
+
+    manifest_path = os.path.join(output_dir, SPLIT_MANIFEST)
+    with open(manifest_path + ".partial", "w", encoding="utf-8") as f:
+        for i in range(len(plan)):
+            f.write(json.dumps(entries[i]) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(manifest_path + ".partial", manifest_path)
+    os.remove(journal_path)
+
+    if isinstance(labeled_data, str):
+        labeled_data = iter_latest_labels(labeled_data)
 
     # Split labels if provided
     if labeled_data:
-        train_labels = []
-        test_labels = []
-
-        # Create sets for faster lookup
-        # We use os.path.normpath/abspath to ensure consistency,
-        # but simple string matching might suffice if paths are consistent.
-        # Using basename might be safer if paths change, but duplicates are possible.
-        # Let's try to match by original_path if available, or filename.
-
-        train_files_set = set(os.path.abspath(f) for f in train_files)
-        test_files_set = set(os.path.abspath(f) for f in test_files)
-
-        for item in labeled_data:
-            # Try to match by original_path
-            original_path = item.get("original_path")
-            if original_path:
-                abs_path = os.path.abspath(original_path)
-                if abs_path in train_files_set:
-                    train_labels.append(item)
-                elif abs_path in test_files_set:
-                    test_labels.append(item)
-            else:
-                # Fallback: check if filename is in the list of basenames
-                # This is less robust but might be necessary
-                filename = item.get("filename")
-                if filename:
-                    if any(
-                        os.path.basename(f) == filename for f in train_files
-                    ):
-                        train_labels.append(item)
-                    elif any(
-                        os.path.basename(f) == filename for f in test_files
-                    ):
-                        test_labels.append(item)
-
-        # Save split labels
-        with open(
-            os.path.join(train_dir, "labels.json"), "w", encoding="utf-8"
-        ) as f:
-            json.dump(train_labels, f, indent=4)
-
-        with open(
-            os.path.join(test_dir, "labels.json"), "w", encoding="utf-8"
-        ) as f:
-            json.dump(test_labels, f, indent=4)
+        # Split and file name of each image, by path as given and absolute
+        # path, and by base name for labels without a path (the first
+        # split wins, as for images in several splits)
+        placement: Dict[str, Tuple[str, str]] = {}
+        by_name: Dict[str, Tuple[str, str]] = {}
+        for split, _, files in splits:
+            for file_path in files:
+                abs_path = os.path.abspath(file_path)
+                place = (split, names[split][abs_path])
+                placement.setdefault(file_path, place)
+                placement.setdefault(abs_path, place)
+                by_name.setdefault(os.path.basename(file_path), place)
+
+        # Labels are written as they are matched, not collected first
+        with ExitStack() as stack:
+            writers = {
+                split: stack.enter_context(
+                    label_writer(os.path.join(directory, "labels.json"))
+                )
+                for split, directory, _ in splits
+            }
+            for item in labeled_data:
+                original_path = item.get("original_path")
+                if original_path:
+                    place = placement.get(original_path) or placement.get(
+                        os.path.abspath(original_path)
+                    )
+                    if place is None:
+                        continue
+                    split, name = place
+                    if name != os.path.basename(original_path):
+                        # Renamed because of a name collision
+                        item = dict(item, filename=name)
+                    writers[split](item)
+                elif item.get("filename") in by_name:
+                    # Fallback for labels without a path; less robust
+                    writers[by_name[item["filename"]][0]](item)
 
     return train_dir, test_dir
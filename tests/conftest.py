@@ -0,0 +1,19 @@
+import pytest
+from src import labeler
+from src.cache import LabelCache, ThumbnailCache
+
+
+@pytest.fixture(autouse=True)
+def label_cache(tmp_path, monkeypatch):
+    # Keep the persistent caches of the tests out of the user's home
+    cache = LabelCache(str(tmp_path / "labels.db"))
+    monkeypatch.setattr(labeler, "_label_cache", cache)
+    yield cache
+    cache.close()
+
+
+@pytest.fixture(autouse=True)
+def thumbnail_cache(tmp_path, monkeypatch):
+    cache = ThumbnailCache(str(tmp_path / "thumbs"))
+    monkeypatch.setattr(labeler, "_thumbnail_cache", cache)
+    return cache
@@ -0,0 +1,270 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import openai
+import pytest
+from src.backends import AIMDLimiter, Backend, BackendPool
+
+
+class StubServer:
+    """
+    Minimal OpenAI-compatible server answering chat completions.
+    """
+
+    def __init__(self, delay=0.0, fail=False, error_status=500):
+        self.delay = delay
+        self.fail = fail
+        self.error_status = error_status
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, body):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if stub.fail:
+                    self._reply(500, {"error": "down"})
+                else:
+                    self._reply(200, {"object": "list", "data": []})
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers["Content-Length"]))
+                stub.requests += 1
+                if stub.fail:
+                    self._reply(stub.error_status, {"error": "down"})
+                    return
+                time.sleep(stub.delay)
+                message = {"role": "assistant", "content": '{"label": "x"}'}
+                self._reply(
+                    200,
+                    {
+                        "id": "stub",
+                        "object": "chat.completion",
+                        "created": 0,
+                        "model": "stub",
+                        "choices": [
+                            {
+                                "index": 0,
+                                "message": message,
+                                "finish_reason": "stop",
+                            }
+                        ],
+                    },
+                )
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub_servers():
+    servers = []
+    yield servers
+    for server in servers:
+        server.close()
+
+
+def _request(pool):
+    with pool.acquire() as backend:
+        return backend.client.chat.completions.create(
+            model=backend.model, messages=[{"role": "user", "content": "hi"}]
+        )
+
+
+def test_pool_spreads_requests_over_backends(stub_servers):
+    stub_servers.extend([StubServer(delay=0.05), StubServer(delay=0.05)])
+    pool = BackendPool(
+        [
+            Backend(server.url, "stub", max_in_flight=2, max_retries=0)
+            for server in stub_servers
+        ]
+    )
+    assert pool.capacity == 4
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(lambda _: _request(pool), range(8)))
+
+    assert [server.requests for server in stub_servers] == [4, 4]
+    stats = pool.stats()
+    assert all(s["requests"] == 4 and s["failures"] == 0 for s in stats)
+    assert all(s["latency"] > 0 for s in stats)
+
+
+def test_pool_ejects_and_readmits_failing_backend(stub_servers):
+    good, bad = StubServer(), StubServer(fail=True)
+    stub_servers.extend([good, bad])
+    backends = [
+        Backend(server.url, "stub", max_in_flight=1, max_retries=0)
+        for server in stub_servers
+    ]
+    # Prefer the failing backend until it is ejected
+    backends[0].latency, backends[1].latency = 1.0, 0.001
+    pool = BackendPool(
+        backends, strategy="latency", max_failures=2, probe_interval=0.05
+    )
+
+    for _ in range(2):
+        with pytest.raises(Exception):
+            _request(pool)
+    assert not pool.stats()[1]["healthy"]
+
+    # While ejected, all traffic goes to the healthy backend
+    for _ in range(3):
+        _request(pool)
+    assert good.requests == 3
+    assert bad.requests == 2
+
+    bad.fail = False
+    deadline = time.monotonic() + 2
+    while not pool.stats()[1]["healthy"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert pool.stats()[1]["healthy"]
+
+
+def test_pool_ignores_rejected_requests(stub_servers):
+    server = StubServer(fail=True, error_status=400)
+    other = StubServer()
+    stub_servers.extend([server, other])
+    backends = [
+        Backend(s.url, "stub", max_in_flight=1, max_retries=0)
+        for s in stub_servers
+    ]
+    backends[0].latency, backends[1].latency = 0.001, 1.0
+    pool = BackendPool(backends, strategy="latency", max_failures=2)
+
+    for _ in range(3):
+        with pytest.raises(openai.BadRequestError):
+            _request(pool)
+    # A 4xx answer is the request's fault, not the server's
+    assert server.requests == 3
+    assert pool.stats()[0]["healthy"]
+    assert pool.stats()[0]["failures"] == 0
+
+
+def test_pool_keeps_last_healthy_backend(stub_servers):
+    server = StubServer(fail=True)
+    stub_servers.append(server)
+    pool = BackendPool(
+        [Backend(server.url, "stub", max_retries=0)], max_failures=2
+    )
+
+    # Requests keep reaching the server and fail with its own error
+    for _ in range(3):
+        with pytest.raises(openai.InternalServerError):
+            _request(pool)
+    assert server.requests == 3
+    assert pool.stats()[0]["healthy"]
+    server.fail = False
+    _request(pool)
+
+
+def test_pool_waits_for_probe_without_healthy_backend(stub_servers):
+    server = StubServer()
+    stub_servers.append(server)
+    backend = Backend(server.url, "stub", max_retries=0)
+    backend.healthy = False
+    pool = BackendPool([backend], probe_interval=0.05)
+
+    # Re-admitted by the prober instead of failing at once
+    _request(pool)
+    assert server.requests == 1
+
+    server.fail = True
+    backend.healthy = False
+    with pytest.raises(TimeoutError):
+        with pool.acquire(timeout=0.2):
+            pass
+
+
+def test_aimd_limiter_increases_additively():
+    limiter = AIMDLimiter(initial=2, max_limit=4)
+    # About one step per round of `limit` successful requests
+    for _ in range(2):
+        limiter.on_success(0.1)
+    assert limiter.limit == 2
+    limiter.on_success(0.1)
+    assert limiter.limit == 3
+    for _ in range(20):
+        limiter.on_success(0.1)
+    assert limiter.limit == 4
+    assert [reason for _, _, reason in limiter.history] == [
+        "initial",
+        "increase",
+        "increase",
+    ]
+
+
+def test_aimd_limiter_decreases_on_errors_and_queueing():
+    limiter = AIMDLimiter(initial=8, max_limit=8)
+    limiter.on_failure(timeout=True)
+    assert limiter.limit == 4
+
+    limiter = AIMDLimiter(initial=8, max_limit=8)
+    limiter.on_success(0.1)
+    limiter.on_success(0.5)
+    assert limiter.limit == 4
+    assert limiter.history[-1][2] == "latency"
+    # A second slow request within the cooldown does not halve again
+    limiter.on_success(0.5)
+    assert limiter.limit == 4
+
+
+def test_set_max_in_flight_spreads_slots():
+    backends = [
+        Backend("http://stub/v1", "stub", client=object()),
+        Backend(
+            "http://stub/v1",
+            "stub",
+            client=object(),
+            limiter=AIMDLimiter(initial=1, max_limit=2),
+        ),
+    ]
+    pool = BackendPool(backends)
+    pool.set_max_in_flight(5)
+
+    assert [b.max_in_flight for b in backends] == [3, 2]
+    # The adaptive backend starts from its share
+    assert backends[1].limit == 2
+    pool.set_max_in_flight(8)
+    assert backends[1].limit == 4 and backends[1].max_limit == 4
+    assert pool.capacity == 8
+    with pytest.raises(ValueError):
+        pool.set_max_in_flight(0)
+
+
+def test_pool_respects_adaptive_limit():
+    # Instant stub requests have jittery latencies; only count increases
+    limiter = AIMDLimiter(initial=1, max_limit=4, latency_tolerance=1e9)
+    backend = Backend(
+        "http://stub/v1", "stub", client=object(), limiter=limiter
+    )
+    pool = BackendPool([backend])
+    assert pool.capacity == 1
+    assert pool.max_capacity == 4
+
+    with pool.acquire():
+        with pytest.raises(TimeoutError):
+            with pool.acquire(timeout=0.01):
+                pass
+    for _ in range(2):
+        with pool.acquire():
+            pass
+    assert pool.capacity == 2
+    assert pool.stats()[0]["limit"] == 2
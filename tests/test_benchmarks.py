@@ -0,0 +1,81 @@
+import json
+import random
+
+import pytest
+from openai import OpenAI
+
+from benchmarks.bench_e2e import percentile
+from benchmarks.mock_server import MockServer, parse_latency
+
+
+@pytest.fixture
+def mock_server():
+    servers = []
+
+    def start(**kwargs):
+        servers.append(MockServer(**kwargs))
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+def test_mock_server_answers_requested_schema(mock_server):
+    server = mock_server(latency="fixed:0.01", slots=2)
+    client = OpenAI(base_url=server.url, api_key="x", max_retries=0)
+
+    response = client.chat.completions.create(
+        model="mock",
+        messages=[{"role": "user", "content": "hi"}],
+        response_format={
+            "type": "json_schema",
+            "json_schema": {"name": "image_label_confidence_response"},
+        },
+    )
+    answer = json.loads(response.choices[0].message.content)
+    assert set(answer) == {"label", "description", "tags", "confidence"}
+
+    chunks = client.chat.completions.create(
+        model="mock",
+        messages=[{"role": "user", "content": "hi"}],
+        stream=True,
+    )
+    content = "".join(c.choices[0].delta.content or "" for c in chunks)
+    assert "label" in json.loads(content)
+    assert server.requests == 2
+    assert len(server.latencies) == 2
+
+
+def test_mock_server_injects_errors(mock_server):
+    server = mock_server(latency="fixed:0", error_rate=1.0)
+    client = OpenAI(base_url=server.url, api_key="x", max_retries=0)
+
+    with pytest.raises(Exception):
+        client.chat.completions.create(model="mock", messages=[])
+    assert server.errors == 1
+
+
+def test_latency_distributions_and_percentile():
+    rng = random.Random(0)
+    assert parse_latency("fixed:0.2")(rng) == 0.2
+    assert 0.1 <= parse_latency("uniform:0.1:0.3")(rng) <= 0.3
+    assert parse_latency("lognormal:0.2:0.5")(rng) > 0
+    with pytest.raises(ValueError):
+        parse_latency("gamma:1")
+
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([], 50) is None
+
+
+def test_micro_benchmark_extrapolation():
+    from benchmarks.bench_micro import _extrapolate
+
+    linear = [{"size": 1000, "best_s": 0.1}, {"size": 10000, "best_s": 1.0}]
+    assert _extrapolate(linear, 100000) == pytest.approx(10.0)
+    quadratic = [{"size": 100, "best_s": 0.01}, {"size": 1000, "best_s": 1.0}]
+    assert _extrapolate(quadratic, 10000) == pytest.approx(100.0)
+    # A single measurement is extrapolated pessimistically
+    assert _extrapolate(linear[:1], 10000) == pytest.approx(10.0)
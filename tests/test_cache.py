@@ -0,0 +1,70 @@
+import os
+
+from src.cache import LabelCache, ThumbnailCache
+
+
+def test_label_cache_roundtrip_and_stats(tmp_path):
+    cache = LabelCache(str(tmp_path / "labels.db"))
+    result = {"label": "cat", "description": "A cat.", "tags": ["cat"]}
+
+    assert cache.get("key") is None
+    cache.put("key", result)
+    assert cache.get("key") == result
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["entries"] == 1
+
+
+def test_label_cache_persists(tmp_path):
+    db_path = str(tmp_path / "labels.db")
+    cache = LabelCache(db_path)
+    cache.put("key", {"label": "dog"})
+    cache.close()
+
+    reopened = LabelCache(db_path)
+    assert reopened.get("key") == {"label": "dog"}
+    assert reopened.stats()["entries"] == 1
+
+
+def test_label_cache_evicts_least_recently_used(tmp_path):
+    cache = LabelCache(str(tmp_path / "labels.db"), max_entries=2)
+    cache.put("a", {"label": "a"})
+    cache.put("b", {"label": "b"})
+    # Touch "a" so that "b" becomes the least recently used entry
+    cache.get("a")
+    cache.put("c", {"label": "c"})
+
+    assert cache.get("b") is None
+    assert cache.get("a") == {"label": "a"}
+    assert cache.get("c") == {"label": "c"}
+    assert cache.stats()["entries"] == 2
+
+
+def test_thumbnail_cache_invalidated_by_source_change(tmp_path):
+    cache = ThumbnailCache(str(tmp_path / "thumbs"))
+    source = tmp_path / "img.jpg"
+    source.write_bytes(b"original")
+
+    assert cache.get(str(source), 256) is None
+    cache.put(str(source), 256, b"thumb")
+    assert cache.get(str(source), 256) == b"thumb"
+    assert cache.get(str(source), 512) is None
+
+    os.utime(source, ns=(0, 0))
+    assert cache.get(str(source), 256) is None
+
+
+def test_thumbnail_cache_evicts_to_size_limit(tmp_path):
+    cache = ThumbnailCache(str(tmp_path / "thumbs"), max_bytes=25)
+    sources = []
+    for i in range(3):
+        source = tmp_path / f"img_{i}.jpg"
+        source.write_bytes(b"x")
+        cache.put(str(source), 256, b"0123456789")
+        sources.append(str(source))
+
+    assert cache.stats()["bytes"] <= 25
+    assert cache.get(sources[0], 256) is None
+    assert cache.get(sources[2], 256) == b"0123456789"
@@ -0,0 +1,75 @@
+from src import classifier
+from src.classifier import ClassifierCascade
+
+
+class FakeClassifier:
+    def __init__(self, predictions):
+        self.predictions = predictions
+
+    def predict(self, image_paths):
+        return [self.predictions[path] for path in image_paths]
+
+
+def test_classifier_cascade_tiers(monkeypatch):
+    sent = []
+
+    def fake_label_images(image_paths, **kwargs):
+        sent.extend(image_paths)
+        vlm_labels = {"b.jpg": "Dog", "c.jpg": "bird", "d.jpg": "error"}
+        for index, path in enumerate(image_paths):
+            yield index, path, {
+                "label": vlm_labels[path],
+                "description": "",
+                "tags": [],
+            }
+
+    monkeypatch.setattr(classifier, "label_images", fake_label_images)
+    cascade = ClassifierCascade(
+        FakeClassifier(
+            {
+                "a.jpg": ("cat", 0.99),
+                "b.jpg": ("dog", 0.5),
+                "c.jpg": ("cat", 0.2),
+                "d.jpg": None,
+            }
+        ),
+        threshold=0.9,
+    )
+    paths = ["a.jpg", "b.jpg", "c.jpg", "d.jpg"]
+    results = {
+        index: result for index, _, result in cascade.label_images(paths)
+    }
+
+    assert sent == ["b.jpg", "c.jpg", "d.jpg"]
+    assert results[0]["label"] == "cat"
+    assert results[0]["source"] == "classifier"
+    assert results[1]["source"] == "vlm"
+    assert results[1]["classifier_label"] == "dog"
+    assert "classifier_label" not in results[3]
+
+    stats = cascade.stats()
+    assert stats["classifier"] == 1
+    assert stats["vlm"] == 3
+    assert stats["vlm_errors"] == 1
+    # "Dog" agrees with "dog", "bird" does not agree with "cat"
+    assert stats["agreement"]["vlm"] == {"compared": 2, "rate": 0.5}
+    assert stats["agreement"]["audit"]["compared"] == 0
+
+
+def test_classifier_cascade_audit(monkeypatch):
+    def fake_label_images(image_paths, **kwargs):
+        for index, path in enumerate(image_paths):
+            yield index, path, {"label": "cat", "description": "", "tags": []}
+
+    monkeypatch.setattr(classifier, "label_images", fake_label_images)
+    predictions = {f"{i}.jpg": ("cat", 0.95) for i in range(10)}
+    cascade = ClassifierCascade(
+        FakeClassifier(predictions), audit_fraction=1.0
+    )
+    results = list(cascade.label_images(list(predictions)))
+
+    assert all(result["source"] == "vlm" for _, _, result in results)
+    stats = cascade.stats()
+    assert stats["classifier"] == 0
+    assert stats["audited"] == 10
+    assert stats["agreement"]["audit"] == {"compared": 10, "rate": 1.0}
@@ -1,6 +1,15 @@
+import os
+
 import pytest
 from src.splitter import split_dataset
-from src.data_loader import get_image_files
+from PIL import Image
+
+from src.data_loader import (
+    get_image_files,
+    iter_image_files,
+    prefilter_images,
+    probe_image,
+)
 
 
 @pytest.fixture
@@ -36,3 +45,118 @@ def test_split_dataset_invalid_ratio(mock_data_dir):
     files = get_image_files(str(mock_data_dir))
     with pytest.raises(ValueError):
         split_dataset(files, 1.5)
+
+
+@pytest.fixture
+def nested_data_dir(tmp_path):
+    d = tmp_path / "nested"
+    for sub in ["", "cats", "cats/kittens", "dogs", "dogs/.thumbnails"]:
+        (d / sub).mkdir(parents=True, exist_ok=True)
+        for name in ["a.jpg", "b.png", "notes.txt"]:
+            (d / sub / name).write_text("content")
+    return d
+
+
+def test_get_image_files_top_level_by_default(nested_data_dir):
+    files = get_image_files(str(nested_data_dir))
+    assert sorted(os.path.basename(f) for f in files) == ["a.jpg", "b.png"]
+
+
+def test_iter_image_files_recursive_filters(nested_data_dir):
+    files = list(iter_image_files(str(nested_data_dir)))
+    assert len(files) == 10
+    assert all(os.path.isabs(f) for f in files)
+
+    files = iter_image_files(
+        str(nested_data_dir), include=["*.png"], exclude=[".thumbnails"]
+    )
+    rel = sorted(os.path.relpath(f, nested_data_dir) for f in files)
+    assert rel == [
+        "b.png",
+        os.path.join("cats", "b.png"),
+        os.path.join("cats", "kittens", "b.png"),
+        os.path.join("dogs", "b.png"),
+    ]
+
+    files = iter_image_files(str(nested_data_dir), include=["cats/*"])
+    rel = sorted(os.path.relpath(f, nested_data_dir) for f in files)
+    # "*" also matches "/", like in fnmatch
+    assert rel == [
+        os.path.join("cats", "a.jpg"),
+        os.path.join("cats", "b.png"),
+        os.path.join("cats", "kittens", "a.jpg"),
+        os.path.join("cats", "kittens", "b.png"),
+    ]
+
+
+@pytest.mark.skipif(not hasattr(os, "symlink"), reason="needs symlinks")
+def test_iter_image_files_symlink_loop(nested_data_dir):
+    try:
+        os.symlink(nested_data_dir, nested_data_dir / "cats" / "loop")
+    except OSError:
+        pytest.skip("cannot create symlinks")
+
+    # Not followed by default
+    assert len(list(iter_image_files(str(nested_data_dir)))) == 10
+    # Followed, but every directory is only visited once
+    files = list(iter_image_files(str(nested_data_dir), follow_symlinks=True))
+    assert len(files) == 10
+
+
+def test_iter_image_files_stops_early(nested_data_dir):
+    scan = iter_image_files(str(nested_data_dir), workers=2)
+    first = next(scan)
+    assert first.endswith((".jpg", ".png"))
+    scan.close()
+
+
+def test_iter_image_files_missing_directory(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        list(iter_image_files(str(tmp_path / "missing")))
+
+
+def test_probe_image_reads_header(tmp_path):
+    path = str(tmp_path / "photo.jpg")
+    image = Image.new("RGB", (40, 30))
+    exif = image.getexif()
+    exif[0x0112] = 6
+    image.save(path, exif=exif)
+
+    assert probe_image(path) == {
+        "format": "JPEG",
+        "width": 40,
+        "height": 30,
+        "mode": "RGB",
+        "animated": False,
+        "orientation": 6,
+    }
+    frames = [Image.new("L", (8, 8), color) for color in (0, 128, 255)]
+    frames[0].save(
+        tmp_path / "anim.gif", save_all=True, append_images=frames[1:]
+    )
+    assert probe_image(str(tmp_path / "anim.gif"))["animated"] is True
+    (tmp_path / "broken.png").write_bytes(b"not an image")
+    assert "error" in probe_image(str(tmp_path / "broken.png"))
+
+
+def test_prefilter_images(tmp_path):
+    sizes = {"ok.jpg": (64, 48), "tiny.jpg": (8, 8), "banner.png": (400, 40)}
+    paths = []
+    for name, size in sizes.items():
+        Image.new("RGB", size).save(tmp_path / name)
+        paths.append(str(tmp_path / name))
+    (tmp_path / "broken.jpg").write_bytes(b"\xff\xd8")
+    paths.append(str(tmp_path / "broken.jpg"))
+
+    accepted, rejected = prefilter_images(
+        paths, min_size=16, max_aspect_ratio=4
+    )
+    assert accepted == [paths[0]]
+    assert rejected == {
+        paths[1]: "too_small",
+        paths[2]: "aspect_ratio",
+        paths[3]: "unreadable",
+    }
+    accepted, rejected = prefilter_images(paths, formats=["png"])
+    assert accepted == [paths[2]]
+    assert rejected[paths[0]] == "format"
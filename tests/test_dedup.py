@@ -0,0 +1,65 @@
+import numpy as np
+from PIL import Image
+
+from src.dedup import (
+    BKTree,
+    compute_dhashes,
+    group_near_duplicates,
+    hamming_distance,
+    propagate_label,
+)
+
+
+def _save_noise(path, seed, brightness=0):
+    rng = np.random.default_rng(seed)
+    pixels = rng.integers(0, 200, size=(32, 32, 3), dtype=np.uint8)
+    img = Image.fromarray(pixels + brightness).resize((256, 256))
+    img.save(path, quality=95)
+    return str(path)
+
+
+def test_bk_tree_search():
+    tree = BKTree()
+    for value in [0b0000, 0b0001, 0b0011, 0b1111, 0b0001]:
+        tree.add(value, value)
+
+    assert len(tree) == 5
+    matches = tree.search(0b0000, 1)
+    assert [item for _, item in matches] == [0b0000, 0b0001, 0b0001]
+    assert tree.search(0b1111, 0) == [(0, 0b1111)]
+    assert hamming_distance(0b1010, 0b0101) == 4
+
+
+def test_group_near_duplicates(tmp_path):
+    original = _save_noise(tmp_path / "a.jpg", seed=1)
+    # Same picture, slightly brighter and re-encoded: a near-duplicate
+    brighter = _save_noise(tmp_path / "b.jpg", seed=1, brightness=20)
+    other = _save_noise(tmp_path / "c.jpg", seed=2)
+    broken = tmp_path / "broken.jpg"
+    broken.write_bytes(b"not an image")
+
+    paths = [original, brighter, other, str(broken)]
+    hashes = compute_dhashes(paths)
+    assert hashes[3] is None
+
+    duplicates = group_near_duplicates(paths, max_distance=4)
+    assert list(duplicates) == [brighter]
+    assert duplicates[brighter][0] == original
+
+
+def test_propagate_label():
+    result = {
+        "label": "cat",
+        "description": "A cat",
+        "filename": "a.jpg",
+        "original_path": "/data/a.jpg",
+        "tags": ["animal"],
+    }
+    propagated = propagate_label(result, "/data/a.jpg", 2)
+
+    assert propagated["label"] == "cat"
+    assert propagated["propagated_from"] == "/data/a.jpg"
+    assert propagated["hash_distance"] == 2
+    assert "filename" not in propagated
+    propagated["tags"].append("pet")
+    assert result["tags"] == ["animal"]
@@ -0,0 +1,81 @@
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from benchmarks.mock_server import MockServer
+from src import engine, labeler
+from src.backends import Backend, BackendPool
+from src.engine import label_images
+
+
+def test_label_images_bounds_in_flight(monkeypatch):
+    lock = threading.Lock()
+    state = {"active": 0, "peak": 0}
+
+    def fake_label_image(image_path, progress_callback=None, **kwargs):
+        with lock:
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+        time.sleep(0.02)
+        with lock:
+            state["active"] -= 1
+        return {"label": image_path, "description": "", "tags": []}
+
+    monkeypatch.setattr(engine, "label_image", fake_label_image)
+
+    paths = [f"img_{i}.jpg" for i in range(12)]
+    results = list(label_images(paths, max_in_flight=3))
+
+    assert state["peak"] == 3
+    assert sorted(index for index, _, _ in results) == list(range(12))
+    for index, path, result in results:
+        assert paths[index] == path
+        assert result["label"] == path
+
+
+def test_label_images_invalid_limit():
+    with pytest.raises(ValueError):
+        list(label_images(["a.jpg"], max_in_flight=0))
+
+
+def test_label_images_batches(monkeypatch):
+    batches = []
+
+    def fake_label_image_batch(image_paths, **kwargs):
+        batches.append(list(image_paths))
+        return [{"label": path} for path in image_paths]
+
+    monkeypatch.setattr(engine, "label_image_batch", fake_label_image_batch)
+
+    paths = [f"img_{i}.jpg" for i in range(7)]
+    results = list(label_images(paths, max_in_flight=2, batch_size=3))
+
+    assert sorted(len(batch) for batch in batches) == [1, 3, 3]
+    assert sorted(index for index, _, _ in results) == list(range(7))
+    assert all(result["label"] == path for _, path, result in results)
+
+
+def test_max_in_flight_sets_backend_slots(tmp_path, monkeypatch):
+    server = MockServer(latency="fixed:0.2", slots=8)
+    pool = BackendPool([Backend(server.url, "mock", max_retries=0)])
+    monkeypatch.setattr(labeler, "backend_pool", pool)
+    paths = []
+    for i in range(8):
+        path = tmp_path / f"img_{i}.jpg"
+        Image.new("RGB", (32, 32), color=(i, 0, 0)).save(path)
+        paths.append(str(path))
+
+    try:
+        # One slot per backend by default: a wider window does not help
+        list(label_images(paths, max_in_flight=4, use_cache=False))
+        assert server.peak_in_flight == 1
+
+        server.reset()
+        pool.set_max_in_flight(4)
+        results = list(label_images(paths, max_in_flight=4, use_cache=False))
+        assert server.peak_in_flight == 4
+        assert all(result["label"] != "error" for _, _, result in results)
+    finally:
+        server.close()
@@ -1,11 +1,11 @@
+import time
 import pytest
 import os
 import json
 from PIL import Image
 import io
 import base64
-from src.labeler import encode_image
-
+from src.labeler import encode_image, warm_ahead, warm_thumbnail_cache
 
 # Actually, the robust splitting logic is inside app.py's button click handler, which is hard to test directly.
 # However, I can test the logic if I extract it or just test the concept using a mock labels.json.
@@ -127,3 +127,67 @@ def test_real_images_processing():
         width, height = decoded_img.size
         assert max(width, height) <= max_size
         assert width > 0 and height > 0
+
+
+def test_encode_image_uses_thumbnail_cache(tmp_path, thumbnail_cache):
+    img_path = tmp_path / "cached_image.jpg"
+    Image.new("RGB", (800, 600), color="green").save(img_path)
+
+    first = encode_image(str(img_path), max_size=256)
+    second = encode_image(str(img_path), max_size=256)
+
+    assert first == second
+    assert thumbnail_cache.stats()["hits"] == 1
+
+
+def test_warm_thumbnail_cache(tmp_path, thumbnail_cache):
+    paths = []
+    for i in range(3):
+        img_path = tmp_path / f"warm_{i}.jpg"
+        Image.new("RGB", (300, 300), color="red").save(img_path)
+        paths.append(str(img_path))
+
+    warm_thumbnail_cache(paths, max_size=128).join()
+
+    assert all(thumbnail_cache.contains(p, 128) for p in paths)
+
+
+def test_warm_ahead_resizes_upcoming_images(tmp_path, thumbnail_cache):
+    paths = []
+    for i in range(4):
+        img_path = tmp_path / f"ahead_{i}.jpg"
+        Image.new("RGB", (300, 300), color="red").save(img_path)
+        paths.append(str(img_path))
+    paths.append(str(tmp_path / "missing.jpg"))
+
+    streamed = warm_ahead(iter(paths), max_size=128, ahead=2, workers=1)
+    assert next(streamed) == paths[0]
+    # The next images were read ahead and handed to the warm-up
+    deadline = time.monotonic() + 5
+    while not thumbnail_cache.contains(paths[2], 128):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert list(streamed) == paths[1:]
+
+
+def test_encode_image_applies_exif_orientation(tmp_path):
+    img_path = tmp_path / "rotated.jpg"
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Rotated 90 degrees clockwise
+    Image.new("RGB", (2000, 1000), color="red").save(img_path, exif=exif)
+
+    encoded = encode_image(str(img_path), max_size=512)
+    decoded_img = Image.open(io.BytesIO(base64.b64decode(encoded)))
+
+    assert decoded_img.size == (256, 512)
+
+
+def test_encode_image_palette(tmp_path):
+    img_path = tmp_path / "palette.png"
+    Image.new("RGB", (1200, 600), color="blue").convert("P").save(img_path)
+
+    encoded = encode_image(str(img_path), max_size=300)
+    decoded_img = Image.open(io.BytesIO(base64.b64decode(encoded)))
+
+    assert decoded_img.mode == "RGB"
+    assert decoded_img.size == (300, 150)
@@ -0,0 +1,90 @@
+from fastapi.testclient import TestClient
+
+from src import api
+from src.label_db import LabelDatabase
+
+
+def _labels():
+    return [
+        {
+            "label": "Cat",
+            "description": "A grey cat sleeping on a red sofa.",
+            "tags": ["Indoor", "pet"],
+            "filename": "a.jpg",
+            "original_path": "/photos/2023/a.jpg",
+        },
+        {
+            "label": "dog",
+            "description": "A dog running on the beach.",
+            "tags": ["outdoor", "pet"],
+            "filename": "b.jpg",
+            "original_path": "/photos/2024/b.jpg",
+        },
+        {
+            "label": "cat",
+            "description": "A kitten playing with a ball of wool.",
+            "tags": ["indoor"],
+            "filename": "c.jpg",
+            "original_path": "/photos/2024/c.jpg",
+        },
+    ]
+
+
+def test_label_database_queries(tmp_path):
+    db = LabelDatabase(str(tmp_path / "label_db.sqlite"))
+    assert db.add(_labels()) == 3
+
+    def names(items):
+        return [item["filename"] for item in items]
+
+    assert names(db.query(label="cat")) == ["a.jpg", "c.jpg"]
+    assert names(db.query(tags=["pet"])) == ["a.jpg", "b.jpg"]
+    assert names(db.query(tags=["PET", "indoor"])) == ["a.jpg"]
+    assert names(db.query(filename="b.jpg")) == ["b.jpg"]
+    assert names(db.query(path_prefix="/photos/2024/")) == ["b.jpg", "c.jpg"]
+    assert names(db.query(text="sofa grey")) == ["a.jpg"]
+    # Query syntax is searched literally, not interpreted
+    assert names(db.query(text='wool -"ball')) == ["c.jpg"]
+    assert names(db.query(limit=1, offset=1)) == ["b.jpg"]
+    assert db.count(label="cat") == 2
+    assert db.label_counts() == {"Cat": 2, "dog": 1}
+    assert db.tag_counts() == {"indoor": 2, "pet": 2, "outdoor": 1}
+
+    # A new label for the same image replaces the old one
+    relabeled = dict(_labels()[0], label="dog", tags=["outdoor"])
+    relabeled["description"] = "A dog on a sofa."
+    db.add([relabeled])
+    assert db.count() == 3
+    assert names(db.query(label="dog")) == ["a.jpg", "b.jpg"]
+    assert names(db.query(tags=["indoor"])) == ["c.jpg"]
+    assert names(db.query(text="grey")) == []
+    assert names(db.query(text="sofa")) == ["a.jpg"]
+
+
+def test_labels_endpoint(tmp_path, monkeypatch):
+    client = TestClient(api.app)
+    monkeypatch.setattr(api, "LABEL_DB_PATH", None)
+    assert client.get("/labels").status_code == 503
+
+    db = LabelDatabase(str(tmp_path / "label_db.sqlite"))
+    db.add(_labels())
+    monkeypatch.setattr(api, "_label_db", db)
+    monkeypatch.setattr(
+        api, "LABEL_DB_PATH", str(tmp_path / "label_db.sqlite")
+    )
+
+    response = client.get(
+        "/labels", params={"tag": ["indoor"], "limit": 1, "offset": 1}
+    )
+    assert response.status_code == 200
+    page = response.json()
+    assert page["total"] == 2
+    assert [item["filename"] for item in page["items"]] == ["c.jpg"]
+
+    page = client.get("/labels", params={"q": "beach"}).json()
+    assert [item["label"] for item in page["items"]] == ["dog"]
+    assert client.get("/labels", params={"limit": 0}).status_code == 422
+    assert client.get("/labels/counts").json()["labels"] == {
+        "Cat": 2,
+        "dog": 1,
+    }
@@ -0,0 +1,180 @@
+import json
+import os
+
+import pytest
+
+from src.data_loader import (
+    LabelStore,
+    iter_labels,
+    load_labels,
+    recover_labels,
+    save_labels,
+)
+from src.splitter import organize_dataset
+
+
+def _item(name, label):
+    return {
+        "label": label,
+        "filename": name,
+        "original_path": f"/data/{name}",
+    }
+
+
+def test_save_labels_matches_legacy_format(tmp_path):
+    path = tmp_path / "labels.json"
+    for data in ([], [_item("a.jpg", "cat"), {"tags": ["x", "y"]}]):
+        save_labels(iter(data), str(path))
+        assert path.read_text() == json.dumps(data, indent=4)
+        assert load_labels(str(path)) == data
+    # No temporary files are left behind
+    assert not [p for p in tmp_path.iterdir() if p.name.startswith(".tmp")]
+    # Readable like a file written with open()
+    (tmp_path / "plain.json").write_text("[]")
+    assert path.stat().st_mode == (tmp_path / "plain.json").stat().st_mode
+    # An existing file keeps its permissions
+    path.chmod(0o600)
+    save_labels([], str(path))
+    assert path.stat().st_mode & 0o777 == 0o600
+
+
+def test_label_store_appends_and_compacts(tmp_path):
+    path = str(tmp_path / "labels.jsonl")
+    with LabelStore(path, sync_every=2) as store:
+        store.append(_item("a.jpg", "error"))
+        store.extend([_item("b.jpg", "dog"), _item("a.jpg", "cat")])
+        # Iterating yields the current record of each image
+        assert [item["label"] for item in store] == ["dog", "cat"]
+
+    # Reopening appends to the existing records
+    with LabelStore(path) as store:
+        store.append(_item("c.jpg", "bird"))
+        count = store.compact(str(tmp_path / "labels.json"))
+
+    assert count == 3
+    assert [item["label"] for item in load_labels(path)] == [
+        "error",
+        "dog",
+        "cat",
+        "bird",
+    ]
+    assert [
+        item["filename"] for item in load_labels(str(tmp_path / "labels.json"))
+    ] == ["b.jpg", "a.jpg", "c.jpg"]
+
+
+def test_label_store_recovers_from_torn_write(tmp_path):
+    path = tmp_path / "labels.jsonl"
+    path.write_text(json.dumps(_item("a.jpg", "cat")) + '\n{"label": "d')
+    assert [item["label"] for item in iter_labels(str(path))] == ["cat"]
+
+    with LabelStore(str(path)) as store:
+        store.append(_item("b.jpg", "dog"))
+    assert [item["label"] for item in iter_labels(str(path))] == [
+        "cat",
+        "dog",
+    ]
+
+
+def test_organize_dataset_reads_label_store(tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    files = []
+    for name in ["a.jpg", "b.jpg"]:
+        (source / name).write_text("content")
+        files.append(str(source / name))
+
+    with LabelStore(str(tmp_path / "labels.jsonl")) as store:
+        for path in files:
+            store.append({"label": "cat", "original_path": path})
+
+        train_dir, test_dir = organize_dataset(
+            files[:1], files[1:], str(tmp_path / "out"), labeled_data=store
+        )
+    train_labels = load_labels(f"{train_dir}/labels.json")
+    test_labels = load_labels(f"{test_dir}/labels.json")
+    assert [item["original_path"] for item in train_labels] == files[:1]
+    assert [item["original_path"] for item in test_labels] == files[1:]
+
+
+def test_iter_labels_streams_json_arrays(tmp_path):
+    items = [
+        _item(f"{i}.jpg", "cat") | {"description": "x" * (i * 37) + '"]},'}
+        for i in range(50)
+    ]
+    pretty = tmp_path / "labels.json"
+    save_labels(items, str(pretty))
+    compact = tmp_path / "compact.json"
+    compact.write_text(json.dumps(items))
+    lines = tmp_path / "labels.jsonl"
+    lines.write_text("".join(json.dumps(item) + "\n" for item in items))
+
+    for path in (pretty, compact, lines):
+        # Records span many chunks
+        assert list(iter_labels(str(path), chunk_size=16)) == items
+        assert list(iter_labels(str(path), fields=("filename", "x"))) == [
+            {"filename": item["filename"]} for item in items
+        ]
+
+    (tmp_path / "empty.json").write_text(" [ ]\n")
+    assert list(iter_labels(str(tmp_path / "empty.json"))) == []
+    # Leading whitespace longer than a chunk
+    (tmp_path / "padded.json").write_text("  \n []")
+    assert list(iter_labels(str(tmp_path / "padded.json"), chunk_size=2)) == []
+    (tmp_path / "padded.json").write_text(" " * 40 + json.dumps(items))
+    assert list(iter_labels(str(tmp_path / "padded.json"), chunk_size=16)) == (
+        items
+    )
+    (tmp_path / "truncated.json").write_text(json.dumps(items)[:-40])
+    with pytest.raises(ValueError):
+        list(iter_labels(str(tmp_path / "truncated.json"), chunk_size=16))
+
+
+def test_organize_dataset_streams_label_file(tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "a.jpg").write_text("content")
+    labels = tmp_path / "labels.json"
+    save_labels([{"label": "cat", "filename": "a.jpg"}], str(labels))
+
+    train_dir, _ = organize_dataset(
+        [str(source / "a.jpg")], [], str(tmp_path / "out"), str(labels)
+    )
+    assert load_labels(f"{train_dir}/labels.json") == load_labels(str(labels))
+
+
+def test_recover_labels_of_interrupted_run(tmp_path):
+    journal = str(tmp_path / "labels.jsonl")
+    labels_file = str(tmp_path / "labels.json")
+    save_labels([_item("a.jpg", "cat"), _item("c.jpg", "bird")], labels_file)
+    # A run that crashed before writing labels.json
+    with LabelStore(journal, truncate=True) as store:
+        store.extend([_item("a.jpg", "error"), _item("b.jpg", "fish")])
+        store.append(_item("a.jpg", "dog"))
+    os.utime(labels_file, ns=(0, 0))
+
+    assert recover_labels(journal, labels_file) == 2
+    assert [
+        (item["filename"], item["label"]) for item in load_labels(labels_file)
+    ] == [("c.jpg", "bird"), ("b.jpg", "fish"), ("a.jpg", "dog")]
+    # The label file is now up to date with the journal
+    assert recover_labels(journal, labels_file) == 0
+    assert recover_labels(str(tmp_path / "missing.jsonl"), labels_file) == 0
+
+
+def test_organize_dataset_reads_latest_journal_records(tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "a.jpg").write_text("content")
+    path = str(source / "a.jpg")
+    journal = str(tmp_path / "labels.jsonl")
+    with LabelStore(journal) as store:
+        store.append({"label": "error", "original_path": path})
+        store.append({"label": "cat", "original_path": path})
+
+    train_dir, _ = organize_dataset(
+        [path], [], str(tmp_path / "out"), labeled_data=journal
+    )
+    assert [
+        item["label"] for item in load_labels(f"{train_dir}/labels.json")
+    ] == ["cat"]
@@ -0,0 +1,322 @@
+import asyncio
+import json
+import re
+import time
+from types import SimpleNamespace
+
+from PIL import Image
+from src import labeler
+from src.backends import Backend, BackendPool
+from src.metrics import Metrics
+
+
+def _response(content):
+    message = SimpleNamespace(content=content)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def _fake_client(create):
+    return SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=create))
+    )
+
+
+def _use_client(monkeypatch, create, max_in_flight=1):
+    # Route all requests to a single backend backed by a fake client
+    client = _fake_client(create)
+    backend = Backend(
+        "http://stub/v1",
+        "stub-model",
+        max_in_flight=max_in_flight,
+        client=client,
+        async_client=client,
+    )
+    monkeypatch.setattr(labeler, "backend_pool", BackendPool([backend]))
+
+
+def _make_image(tmp_path, name="img.jpg"):
+    img_path = tmp_path / name
+    Image.new("RGB", (64, 64), color="green").save(img_path)
+    return str(img_path)
+
+
+def test_label_image_async_runs_concurrently(tmp_path, monkeypatch):
+    img_path = _make_image(tmp_path)
+    payload = {"label": "grass", "description": "green", "tags": ["green"]}
+
+    async def fake_create(**kwargs):
+        await asyncio.sleep(0.1)
+        return _response(json.dumps(payload))
+
+    _use_client(monkeypatch, fake_create, max_in_flight=4)
+
+    async def run():
+        return await asyncio.gather(
+            *(labeler.label_image_async(img_path) for _ in range(4))
+        )
+
+    start = time.perf_counter()
+    results = asyncio.run(run())
+    elapsed = time.perf_counter() - start
+
+    assert results == [payload] * 4
+    # Four requests with four slots overlap instead of taking 0.4s
+    assert elapsed < 0.3
+
+
+def test_label_image_async_returns_error_result(tmp_path, monkeypatch):
+    img_path = _make_image(tmp_path)
+
+    async def failing_create(**kwargs):
+        raise RuntimeError("server down")
+
+    _use_client(monkeypatch, failing_create)
+
+    result = asyncio.run(labeler.label_image_async(img_path))
+
+    assert result["label"] == "error"
+    assert "server down" in result["description"]
+
+
+def test_label_image_uses_cache(tmp_path, monkeypatch, label_cache):
+    img_path = _make_image(tmp_path)
+    payload = {"label": "grass", "description": "green", "tags": []}
+    calls = []
+
+    def fake_create(**kwargs):
+        calls.append(kwargs)
+        return _response(json.dumps(payload))
+
+    _use_client(monkeypatch, fake_create)
+
+    assert labeler.label_image(img_path) == payload
+    assert labeler.label_image(img_path) == payload
+    assert len(calls) == 1
+    assert label_cache.stats()["hits"] == 1
+
+    # A different resolution or a bypassed cache queries the model again
+    labeler.label_image(img_path, max_size=256)
+    labeler.label_image(img_path, use_cache=False)
+    assert len(calls) == 3
+
+
+def test_label_image_batch_falls_back_for_bad_items(tmp_path, monkeypatch):
+    paths = [_make_image(tmp_path, f"img_{i}.jpg") for i in range(3)]
+    single = {"label": "single", "description": "", "tags": []}
+    requests = []
+
+    def fake_create(**kwargs):
+        requests.append(kwargs)
+        schema = kwargs["response_format"]["json_schema"]["name"]
+        if schema == "image_batch_label_response":
+            return _response(
+                json.dumps(
+                    {
+                        "results": [
+                            {
+                                "index": 1,
+                                "label": "b",
+                                "description": "",
+                                "tags": ["x"],
+                            },
+                            {"index": 0, "label": "a"},
+                            {"index": 7, "label": "?", "description": ""},
+                        ]
+                    }
+                )
+            )
+        return _response(json.dumps(single))
+
+    _use_client(monkeypatch, fake_create)
+
+    results = labeler.label_image_batch(paths, use_cache=False)
+
+    assert results[1] == {"label": "b", "description": "", "tags": ["x"]}
+    # Image 0 was malformed and image 2 missing: both are relabeled alone
+    assert results[0] == single
+    assert results[2] == single
+    assert len(requests) == 3
+
+
+def test_label_image_batch_fails_fast_on_server_errors(tmp_path, monkeypatch):
+    monkeypatch.setattr(labeler, "metrics", Metrics())
+    paths = [_make_image(tmp_path, f"img_{i}.jpg") for i in range(3)]
+    requests = []
+
+    class ServerError(Exception):
+        status_code = 503
+
+    def fake_create(**kwargs):
+        requests.append(kwargs)
+        raise ServerError("unavailable")
+
+    _use_client(monkeypatch, fake_create)
+
+    results = labeler.label_image_batch(paths, use_cache=False)
+
+    # The images are not retried one by one against the failing server
+    assert len(requests) == 1
+    assert [result["label"] for result in results] == ["error"] * 3
+    assert labeler.metrics.snapshot()["errors"] == {"ServerError": 3}
+
+
+def test_label_image_records_metrics(tmp_path, monkeypatch):
+    monkeypatch.setattr(labeler, "metrics", Metrics())
+    img_path = _make_image(tmp_path)
+    payload = {"label": "grass", "description": "green", "tags": []}
+
+    def fake_create(**kwargs):
+        response = _response(json.dumps(payload))
+        response.usage = SimpleNamespace(
+            prompt_tokens=300, completion_tokens=40
+        )
+        return response
+
+    _use_client(monkeypatch, fake_create)
+    labeler.label_image(img_path, use_cache=False)
+
+    _use_client(monkeypatch, lambda **kwargs: _response("not json"))
+    labeler.label_image(img_path, use_cache=False)
+
+    snapshot = labeler.metrics.snapshot()
+    for stage in ("encode", "wait", "request", "parse"):
+        assert snapshot["stages"][stage]["count"] == 2
+    assert snapshot["tokens"]["input"]["sum"] == 300
+    assert snapshot["tokens"]["output"]["count"] == 1
+    assert snapshot["errors"] == {"JSONDecodeError": 1}
+
+
+def _cascade_answer(
+    label, confidence, description="A green lawn in bright sun"
+):
+    return json.dumps(
+        {
+            "label": label,
+            "description": description,
+            "tags": ["green"],
+            "confidence": confidence,
+        }
+    )
+
+
+def test_label_image_cascade_escalates_until_confident(tmp_path, monkeypatch):
+    img_path = _make_image(tmp_path)
+    answers = [
+        _cascade_answer("image", 0.9),
+        _cascade_answer("lawn", 0.3),
+        _cascade_answer("lawn", 0.8),
+    ]
+    calls = []
+
+    def fake_create(**kwargs):
+        calls.append(kwargs["response_format"]["json_schema"]["name"])
+        return _response(answers[len(calls) - 1])
+
+    _use_client(monkeypatch, fake_create)
+    result = labeler.label_image(img_path, cascade=[1024, 256, 512])
+
+    assert calls == ["image_label_confidence_response"] * 3
+    assert result["label"] == "lawn"
+    assert result["resolution"] == 1024
+    assert [e["reason"] for e in result["escalations"]] == [
+        "generic",
+        "low_confidence",
+    ]
+
+    # Every step is cached: a second run sends no requests
+    assert labeler.label_image(img_path, cascade=[256, 512, 1024]) == result
+    assert len(calls) == 3
+
+
+def test_label_image_cascade_stops_early(tmp_path, monkeypatch):
+    img_path = _make_image(tmp_path)
+    calls = []
+
+    def fake_create(**kwargs):
+        calls.append(kwargs)
+        if len(calls) == 1:
+            return _response(_cascade_answer("lawn", 0.95))
+        return _response("not json")
+
+    _use_client(monkeypatch, fake_create)
+    result = labeler.label_image(img_path, cascade=[256, 1024])
+    assert len(calls) == 1
+    assert result["resolution"] == 256
+    assert result["escalations"] == []
+
+    # An invalid answer at the higher resolution keeps the earlier label
+    answers = [_response(_cascade_answer("lawn", 0.2)), _response("{}")]
+    _use_client(monkeypatch, lambda **kwargs: answers.pop(0))
+    result = labeler.label_image(img_path, cascade=[128, 512], use_cache=False)
+    assert result["label"] == "lawn"
+    assert result["resolution"] == 128
+    assert result["escalations"] == []
+
+
+def _chunk(content=None, finish_reason=None, usage=None):
+    choices = []
+    if content is not None or finish_reason is not None:
+        delta = SimpleNamespace(content=content)
+        choices = [SimpleNamespace(delta=delta, finish_reason=finish_reason)]
+    return SimpleNamespace(choices=choices, usage=usage)
+
+
+def test_label_image_streaming_reports_progress(tmp_path, monkeypatch):
+    monkeypatch.setattr(labeler, "metrics", Metrics())
+    img_path = _make_image(tmp_path)
+    answer = json.dumps(
+        {"label": "grass", "description": "green", "tags": ["lawn"]}
+    )
+    requests = []
+
+    def fake_create(**kwargs):
+        requests.append(kwargs)
+        pieces = re.findall(".{1,4}", answer, re.DOTALL)
+        yield from (_chunk(piece) for piece in pieces)
+        yield _chunk(finish_reason="stop")
+        yield _chunk(
+            usage=SimpleNamespace(prompt_tokens=100, completion_tokens=9)
+        )
+
+    _use_client(monkeypatch, fake_create)
+    updates = []
+    result = labeler.label_image(
+        img_path,
+        progress_callback=lambda p, m: updates.append((p, m)),
+        use_cache=False,
+        stream=True,
+    )
+
+    assert result == json.loads(answer)
+    assert requests[0]["stream"] is True
+    messages = [m for _, m in updates if m.startswith("First token")]
+    assert messages and "tok/s" in messages[0]
+    assert messages[-1].endswith("label: grass")
+    percents = [p for p, _ in updates]
+    assert percents == sorted(percents)
+    snapshot = labeler.metrics.snapshot()
+    assert snapshot["stages"]["ttft"]["count"] == 1
+    assert snapshot["tokens"]["output"]["sum"] == 9
+
+
+def test_label_image_streaming_token_budget(tmp_path, monkeypatch):
+    img_path = _make_image(tmp_path)
+    sent = []
+
+    def fake_create(**kwargs):
+        assert kwargs["max_tokens"] == 10
+        for _ in range(1000):
+            sent.append(1)
+            yield _chunk("word ")
+
+    _use_client(monkeypatch, fake_create)
+    result = labeler.label_image(
+        img_path, use_cache=False, stream=True, token_budget=10
+    )
+
+    assert result["label"] == "error"
+    assert "budget" in result["description"]
+    # The stream was abandoned right after the budget ran out
+    assert len(sent) == 11
+    # A runaway answer is not held against the server
+    assert labeler.backend_pool.stats()[0]["failures"] == 0
@@ -0,0 +1,176 @@
+import os
+import time
+
+from PIL import Image
+
+from src import data_loader
+from src.data_loader import ScanManifest
+
+
+def _write(path, content="content"):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+
+
+def _age(root):
+    # Directories modified in the last seconds are always listed again
+    past = time.time() - 60
+    for directory, _, _ in os.walk(root):
+        os.utime(directory, (past, past))
+
+
+def _rel(paths, root):
+    return sorted(os.path.relpath(p, root) for p in paths)
+
+
+def test_manifest_reports_only_changes(tmp_path):
+    root = tmp_path / "photos"
+    _write(root / "a.jpg", "a")
+    _write(root / "2023" / "b.jpg", "b")
+    _write(root / "2024" / "c.jpg", "c")
+    _write(root / "2024" / "d.jpg", "d")
+    _age(root)
+    manifest = ScanManifest(str(tmp_path / "manifest.db"))
+
+    first = manifest.scan(str(root))
+    assert _rel(first["new"], root) == [
+        os.path.join("2023", "b.jpg"),
+        os.path.join("2024", "c.jpg"),
+        os.path.join("2024", "d.jpg"),
+        "a.jpg",
+    ]
+    assert first["unchanged"] == 0
+
+    second = manifest.scan(str(root))
+    assert second["new"] == second["modified"] == second["deleted"] == []
+    assert second["unchanged"] == 4
+    assert second["skipped_dirs"] == 3
+
+    _write(root / "2024" / "e.jpg", "e")
+    (root / "2024" / "c.jpg").unlink()
+    _write(root / "2023" / "b.jpg", "changed")
+    third = manifest.scan(str(root), full=True)
+    assert _rel(third["new"], root) == [os.path.join("2024", "e.jpg")]
+    assert _rel(third["deleted"], root) == [os.path.join("2024", "c.jpg")]
+    assert _rel(third["modified"], root) == [os.path.join("2023", "b.jpg")]
+    assert third["unchanged"] == 2
+
+
+def test_manifest_skips_unchanged_subtrees(tmp_path):
+    root = tmp_path / "photos"
+    _write(root / "old" / "a.jpg")
+    _write(root / "new" / "b.jpg")
+    _age(root)
+    manifest = ScanManifest(str(tmp_path / "manifest.db"))
+    manifest.scan(str(root))
+
+    _write(root / "new" / "deeper" / "c.jpg")
+    changes = manifest.scan(str(root))
+    assert _rel(changes["new"], root) == [
+        os.path.join("new", "deeper", "c.jpg")
+    ]
+    # The root and "old" were not listed again
+    assert changes["skipped_dirs"] == 2
+
+    for path in (root / "new" / "deeper" / "c.jpg", root / "new" / "b.jpg"):
+        path.unlink()
+    (root / "new" / "deeper").rmdir()
+    (root / "new").rmdir()
+    changes = manifest.scan(str(root))
+    assert _rel(changes["deleted"], root) == [
+        os.path.join("new", "b.jpg"),
+        os.path.join("new", "deeper", "c.jpg"),
+    ]
+    assert manifest.paths(str(root)) == [str(root / "old" / "a.jpg")]
+
+
+def test_manifest_labeling_status(tmp_path):
+    root = tmp_path / "photos"
+    for name in ["a.jpg", "b.jpg", "c.jpg"]:
+        _write(root / name, name)
+    db_path = str(tmp_path / "manifest.db")
+    manifest = ScanManifest(db_path)
+    manifest.scan(str(root))
+    assert len(manifest.paths(str(root), pending_only=True)) == 3
+
+    manifest.mark(
+        [
+            {"label": "cat", "original_path": str(root / "a.jpg")},
+            {"label": "error", "original_path": str(root / "b.jpg")},
+        ]
+    )
+    manifest.close()
+
+    manifest = ScanManifest(db_path)
+    assert manifest.paths(str(root), pending_only=True) == [
+        str(root / "b.jpg"),
+        str(root / "c.jpg"),
+    ]
+    assert [item["label"] for item in manifest.labels(str(root))] == [
+        "cat",
+        "error",
+    ]
+
+    # Touching a file keeps its label, changing the content drops it
+    os.utime(root / "a.jpg", (time.time() + 5, time.time() + 5))
+    changes = manifest.scan(str(root), full=True)
+    assert changes["modified"] == []
+    assert str(root / "a.jpg") not in manifest.paths(
+        str(root), pending_only=True
+    )
+    _write(root / "a.jpg", "other content")
+    changes = manifest.scan(str(root), full=True)
+    assert changes["modified"] == [str(root / "a.jpg")]
+    assert str(root / "a.jpg") in manifest.paths(str(root), pending_only=True)
+
+
+def test_manifest_rescans_when_options_change(tmp_path):
+    root = tmp_path / "photos"
+    _write(root / "a.jpg")
+    _write(root / "b.png")
+    _age(root)
+    manifest = ScanManifest(str(tmp_path / "manifest.db"))
+    manifest.scan(str(root), include=["*.jpg"])
+
+    changes = manifest.scan(str(root))
+    assert changes["new"] == [str(root / "b.png")]
+    assert changes["skipped_dirs"] == 0
+
+
+def test_manifest_caches_probes(tmp_path, monkeypatch):
+    root = tmp_path / "photos"
+    root.mkdir()
+    Image.new("RGB", (20, 10)).save(root / "a.png")
+    _write(root / "b.jpg", "broken")
+    manifest = ScanManifest(str(tmp_path / "manifest.db"))
+    manifest.scan(str(root))
+    paths = [str(root / "a.png"), str(root / "b.jpg")]
+
+    probes = manifest.probes(paths)
+    assert probes[paths[0]]["width"] == 20
+    assert "error" in probes[paths[1]]
+
+    probed = []
+    probe_image = data_loader.probe_image
+    monkeypatch.setattr(
+        data_loader,
+        "probe_image",
+        lambda path: probed.append(path) or probe_image(path),
+    )
+    assert manifest.probes(paths) == probes
+    assert probed == []
+
+    # A modified file is probed again
+    Image.new("RGB", (30, 10)).save(root / "b.jpg")
+    manifest.scan(str(root), full=True)
+    accepted, rejected = data_loader.prefilter_images(paths, manifest=manifest)
+    assert accepted == paths and rejected == {}
+    assert probed == [paths[1]]
+
+    # Probes cached in the old format with 'frames' are redone
+    manifest._conn.execute(
+        "UPDATE files SET probe = ? WHERE path = ?",
+        ('{"format": "PNG", "frames": 1}', os.path.abspath(paths[0])),
+    )
+    assert manifest.probes(paths)[paths[0]]["animated"] is False
+    assert probed == [paths[1], paths[0]]
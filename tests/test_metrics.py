@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+
+from src.metrics import Histogram, Metrics
+
+
+def test_histogram_quantiles():
+    histogram = Histogram([1, 2, 4, 8])
+    for value in [0.5] * 50 + [3] * 45 + [20] * 5:
+        histogram.observe(value)
+
+    assert histogram.quantile(0.5) <= 1
+    assert 2 <= histogram.quantile(0.95) <= 4
+    # Values beyond the last bucket are bounded by the maximum
+    assert 8 <= histogram.quantile(0.99) <= 20
+    assert Histogram([1]).quantile(0.5) is None
+
+
+def test_metrics_snapshot_and_prometheus():
+    metrics = Metrics()
+    with metrics.timer("encode"):
+        pass
+    metrics.observe("request", 1.5)
+    metrics.record_usage(
+        SimpleNamespace(prompt_tokens=1000, completion_tokens=100), images=4
+    )
+    metrics.record_usage(None)
+    metrics.record_error(TimeoutError())
+
+    snapshot = metrics.snapshot()
+    assert snapshot["stages"]["encode"]["count"] == 1
+    assert snapshot["stages"]["request"]["max"] == 1.5
+    assert snapshot["tokens"]["input"]["count"] == 4
+    assert snapshot["tokens"]["input"]["mean"] == 250
+    assert snapshot["errors"] == {"TimeoutError": 1}
+
+    text = metrics.render_prometheus()
+    assert 'image_labeler_stage_seconds_count{stage="request"} 1' in text
+    assert (
+        'image_labeler_stage_seconds_bucket{stage="request",le="2.5"} 1'
+        in (text)
+    )
+    assert 'image_labeler_errors_total{type="TimeoutError"} 1' in text
+    assert any(
+        line.strip().startswith("request")
+        for line in (metrics.summary_lines())
+    )
+
+    metrics.reset()
+    assert metrics.snapshot()["stages"] == {}
@@ -0,0 +1,109 @@
+import pytest
+from PIL import Image
+from src import pipeline
+from src.labeler import label_cache_key
+from src.metrics import metrics
+from src.pipeline import run_pipeline
+
+
+def test_run_pipeline_labels_all_images(tmp_path, monkeypatch):
+    # The encoder processes must not write to the user's thumbnail cache
+    monkeypatch.setenv("THUMBNAIL_CACHE_ENABLED", "0")
+    paths = []
+    for i in range(6):
+        img_path = tmp_path / f"img_{i}.jpg"
+        Image.new("RGB", (400, 300), color="red").save(img_path)
+        paths.append(str(img_path))
+    broken = tmp_path / "broken.jpg"
+    broken.write_text("not an image")
+    paths.append(str(broken))
+
+    requests = []
+
+    def fake_label_encoded_image(image_path, base64_image, **kwargs):
+        requests.append(image_path)
+        return {"label": "red", "description": "", "tags": []}
+
+    monkeypatch.setattr(
+        pipeline, "label_encoded_image", fake_label_encoded_image
+    )
+
+    results = {}
+
+    def on_result(index, image_path, result):
+        results[index] = (image_path, result)
+
+    written = run_pipeline(
+        paths, on_result, encode_workers=2, max_in_flight=2, queue_size=2
+    )
+
+    assert written == len(paths)
+    assert sorted(results) == list(range(len(paths)))
+    assert all(results[i][0] == p for i, p in enumerate(paths))
+    # The broken file fails during encoding and never reaches the model
+    assert results[6][1]["label"] == "error"
+    assert sorted(requests) == sorted(paths[:6])
+
+
+def test_run_pipeline_raises_errors_of_on_result(tmp_path, monkeypatch):
+    monkeypatch.setenv("THUMBNAIL_CACHE_ENABLED", "0")
+    paths = []
+    for i in range(20):
+        img_path = tmp_path / f"img_{i}.jpg"
+        Image.new("RGB", (64, 64), color="red").save(img_path)
+        paths.append(str(img_path))
+    monkeypatch.setattr(
+        pipeline,
+        "label_encoded_image",
+        lambda image_path, base64_image, **kwargs: {"label": "red"},
+    )
+
+    def on_result(index, image_path, result):
+        raise OSError("No space left on device")
+
+    # The other stages stop instead of waiting for the writer forever
+    with pytest.raises(OSError, match="No space left"):
+        run_pipeline(
+            paths,
+            on_result,
+            encode_workers=1,
+            max_in_flight=3,
+            queue_size=1,
+            use_cache=False,
+        )
+
+
+def test_run_pipeline_skips_encoding_of_cached_images(
+    tmp_path, monkeypatch, label_cache
+):
+    monkeypatch.setenv("THUMBNAIL_CACHE_ENABLED", "0")
+    paths = []
+    for color in ["red", "blue"]:
+        img_path = tmp_path / f"{color}.jpg"
+        Image.new("RGB", (64, 64), color=color).save(img_path)
+        paths.append(str(img_path))
+    prompt = "Describe this image and provide a label."
+    label_cache.put(
+        label_cache_key(paths[0], prompt, 1024), {"label": "cached"}
+    )
+    requests = []
+
+    def fake_label_encoded_image(image_path, base64_image, **kwargs):
+        requests.append(image_path)
+        return {"label": "red"}
+
+    monkeypatch.setattr(
+        pipeline, "label_encoded_image", fake_label_encoded_image
+    )
+    metrics.reset()
+    results = {}
+    run_pipeline(
+        paths,
+        lambda index, image_path, result: results.update({index: result}),
+        encode_workers=1,
+        max_in_flight=1,
+    )
+
+    assert results == {0: {"label": "cached"}, 1: {"label": "red"}}
+    assert requests == [paths[1]]
+    assert metrics.snapshot()["stages"]["encode"]["count"] == 1
@@ -0,0 +1,296 @@
+import os
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from src import api, splitter
+from src.data_loader import load_labels
+from src.splitter import (
+    SPLIT_MANIFEST,
+    kfold_split,
+    labels_for_files,
+    organize_dataset,
+    place_file,
+    split_dataset,
+    train_val_test_split,
+)
+
+
+@pytest.fixture
+def source_files(tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    files = []
+    for name in ["a.jpg", "b.jpg", "c.jpg"]:
+        (source / name).write_text(name)
+        files.append(str(source / name))
+    return files
+
+
+@pytest.mark.parametrize("link_mode", ["copy", "hardlink", "symlink"])
+def test_organize_dataset_link_modes(tmp_path, source_files, link_mode):
+    output = tmp_path / "out"
+    methods = []
+    train_dir, test_dir = organize_dataset(
+        source_files[:2],
+        source_files[2:],
+        str(output),
+        link_mode=link_mode,
+        file_callback=lambda entry: methods.append(entry["method"]),
+    )
+
+    assert methods == [link_mode] * 3
+    target = os.path.join(train_dir, "a.jpg")
+    assert open(target).read() == "a.jpg"
+    assert os.path.islink(target) == (link_mode == "symlink")
+    assert os.path.samefile(target, source_files[0]) == (link_mode != "copy")
+    entry = load_labels(str(output / SPLIT_MANIFEST))[2]
+    assert entry["split"] == "test"
+    assert entry["source"] == source_files[2]
+    assert entry["target"] == os.path.join(test_dir, "c.jpg")
+    assert entry["method"] == link_mode
+    assert entry["bytes"] == (5 if link_mode == "copy" else 0)
+
+    # Splitting again replaces the links instead of writing through them
+    organize_dataset(
+        source_files[:2], source_files[2:], str(output), link_mode="copy"
+    )
+    assert not os.path.samefile(target, source_files[0])
+    assert open(source_files[0]).read() == "a.jpg"
+
+
+def test_organize_dataset_manifest_only(tmp_path, source_files):
+    train_dir, test_dir = organize_dataset(
+        source_files[:1],
+        source_files[1:],
+        str(tmp_path / "out"),
+        labeled_data=[{"label": "cat", "original_path": source_files[0]}],
+        link_mode="manifest",
+    )
+
+    assert os.listdir(train_dir) == ["labels.json"]
+    entries = load_labels(str(tmp_path / "out" / SPLIT_MANIFEST))
+    assert [(e["split"], e["target"], e["method"]) for e in entries] == [
+        ("train", None, "manifest"),
+        ("test", None, "manifest"),
+        ("test", None, "manifest"),
+    ]
+
+
+def test_place_file_falls_back(tmp_path, source_files, monkeypatch):
+    def no_link(*args):
+        raise OSError("Invalid cross-device link")
+
+    def no_reflink(*args):
+        raise OSError("Operation not supported")
+
+    monkeypatch.setattr(os, "link", no_link)
+    monkeypatch.setattr(splitter, "_reflink", no_reflink)
+    target = str(tmp_path / "a.jpg")
+    assert place_file(source_files[0], target, "hardlink") == "copy"
+    assert open(target).read() == "a.jpg"
+
+    with pytest.raises(ValueError):
+        organize_dataset([], [], str(tmp_path / "out"), link_mode="move")
+
+
+def test_split_dataset_endpoint_link_mode(tmp_path, source_files):
+    client = TestClient(api.app)
+    request = {
+        "input_path": os.path.dirname(source_files[0]),
+        "output_path": str(tmp_path / "out"),
+        "link_mode": "hardlink",
+    }
+    response = client.post("/split-dataset/", json=request)
+    assert response.status_code == 200
+    assert response.json()["methods"] == {"hardlink": 3}
+
+    request["link_mode"] = "move"
+    assert client.post("/split-dataset/", json=request).status_code == 422
+
+
+def test_organize_dataset_resumes(tmp_path, source_files, monkeypatch):
+    output = tmp_path / "out"
+    placed = []
+    materialize = splitter._materialize
+
+    def interrupt_third(source, *args):
+        if len(placed) == 2:
+            raise InterruptedError
+        placed.append(source)
+        return materialize(source, *args)
+
+    monkeypatch.setattr(splitter, "_materialize", interrupt_third)
+    with pytest.raises(InterruptedError):
+        organize_dataset(source_files, [], str(output), workers=1)
+    assert os.path.exists(output / splitter.SPLIT_JOURNAL)
+    monkeypatch.setattr(splitter, "_materialize", materialize)
+
+    entries = []
+    organize_dataset(
+        source_files[1:] + source_files[:1],
+        [],
+        str(output),
+        file_callback=entries.append,
+    )
+    assert sorted(e["source"] for e in entries if not e["skipped"]) == [
+        source_files[2]
+    ]
+    assert not os.path.exists(output / splitter.SPLIT_JOURNAL)
+
+    # Files that left the split are removed; a new run skips the rest
+    entries = []
+    organize_dataset(
+        source_files[:1], [], str(output), file_callback=entries.append
+    )
+    assert sorted(os.listdir(output / "train")) == ["a.jpg"]
+    assert [e["skipped"] for e in entries] == [True]
+
+
+def test_organize_dataset_renames_colliding_names(tmp_path):
+    files = []
+    for folder in ["x", "y"]:
+        (tmp_path / folder).mkdir()
+        (tmp_path / folder / "img.jpg").write_text(folder)
+        files.append(str(tmp_path / folder / "img.jpg"))
+    labels = [{"label": "cat", "original_path": path} for path in files]
+
+    train_dir, _ = organize_dataset(
+        files, [], str(tmp_path / "out"), labeled_data=labels
+    )
+    names = sorted(os.listdir(train_dir))
+    assert len(names) == 3 and "labels.json" in names
+    contents = {
+        item["filename"]: open(
+            os.path.join(train_dir, item["filename"])
+        ).read()
+        for item in load_labels(os.path.join(train_dir, "labels.json"))
+    }
+    assert sorted(contents.values()) == ["x", "y"]
+
+
+def _dataset():
+    files = [f"/data/img_{i:03d}.jpg" for i in range(100)]
+    # 90 cats, 10 dogs
+    labels = ["dog" if i % 10 == 0 else "cat" for i in range(100)]
+    return files, labels
+
+
+def test_split_dataset_seeded_and_stratified():
+    files, labels = _dataset()
+    assert split_dataset(files, 0.8, seed=1) == split_dataset(
+        files, 0.8, seed=1
+    )
+    assert split_dataset(files, 0.8, seed=1) != split_dataset(
+        files, 0.8, seed=2
+    )
+
+    for seed in range(5):
+        train, test = split_dataset(files, 0.8, labels=labels, seed=seed)
+        label_of = dict(zip(files, labels))
+        assert [label_of[f] for f in train].count("dog") == 8
+        assert [label_of[f] for f in test].count("dog") == 2
+        assert sorted(train + test) == files
+
+
+@pytest.mark.parametrize(
+    "per_class, classes, ratios, sizes",
+    [
+        (2, 500, (0.8, 0.2), (800, 200)),
+        (1, 100, (0.5, 0.5), (50, 50)),
+        (3, 333, (0.7, 0.15, 0.15), (699, 150, 150)),
+        (10, 100, (0.7, 0.15, 0.15), (700, 150, 150)),
+    ],
+)
+def test_assign_splits_with_many_small_strata(
+    per_class, classes, ratios, sizes
+):
+    files = [f"/data/img_{i:05d}.jpg" for i in range(per_class * classes)]
+    labels = [f"class_{i // per_class}" for i in range(len(files))]
+    for seed in range(3):
+        splits = splitter.assign_splits(files, ratios, labels, seed=seed)
+        assert tuple(np.bincount(splits, minlength=len(ratios))) == sizes
+        # Every class gets its quota per split rounded down or up
+        per_split = np.zeros((classes, len(ratios)), dtype=int)
+        np.add.at(per_split, (np.arange(len(files)) // per_class, splits), 1)
+        quotas = per_class * np.array(ratios)
+        assert (per_split >= np.floor(quotas + 1e-9)).all()
+        assert (per_split <= np.ceil(quotas - 1e-9)).all()
+
+
+def test_seeded_split_ignores_file_order():
+    files, labels = _dataset()
+    # Scans may return the files in any order
+    shuffled = list(zip(files, labels))[::-1]
+    shuffled = shuffled[1::2] + shuffled[::2]
+    other_files = [f for f, _ in shuffled]
+    other_labels = [label for _, label in shuffled]
+
+    for split_labels, other in ((None, None), (labels, other_labels)):
+        train, test = split_dataset(files, 0.8, labels=split_labels, seed=3)
+        other_train, other_test = split_dataset(
+            other_files, 0.8, labels=other, seed=3
+        )
+        assert sorted(train) == sorted(other_train)
+        assert sorted(test) == sorted(other_test)
+        folds = kfold_split(files, 3, labels=split_labels, seed=3)
+        other_folds = kfold_split(other_files, 3, labels=other, seed=3)
+        assert [sorted(test) for _, test in folds] == [
+            sorted(test) for _, test in other_folds
+        ]
+
+
+def test_train_val_test_and_kfold_splits():
+    files, labels = _dataset()
+    train, val, test = train_val_test_split(
+        files, 0.7, 0.1, labels=labels, seed=0
+    )
+    assert (len(train), len(val), len(test)) == (70, 10, 20)
+    assert sorted(train + val + test) == files
+    with pytest.raises(ValueError):
+        train_val_test_split(files, 0.8, 0.3)
+
+    folds = kfold_split(files, 3, labels=labels, seed=0)
+    tests = [test for _, test in folds]
+    assert sorted(sum(tests, [])) == files
+    assert [len(test) for test in tests] == [34, 33, 33]
+    for train, test in folds:
+        assert sorted(train + test) == files
+        dogs = sum(labels[files.index(f)] == "dog" for f in test)
+        assert dogs in (3, 4)
+
+
+def test_labels_for_files(tmp_path, monkeypatch):
+    files = [str(tmp_path / "a.jpg"), str(tmp_path / "b.jpg"), "c.jpg"]
+    labeled_data = [
+        {"label": "cat", "original_path": files[0]},
+        {"label": "dog", "filename": "b.jpg"},
+        {"label": "bird", "original_path": files[0]},
+    ]
+    assert labels_for_files(files, labeled_data) == ["bird", "dog", None]
+
+    # Relative paths match their absolute spelling
+    monkeypatch.chdir(tmp_path)
+    assert labels_for_files(["a.jpg"], labeled_data) == ["bird"]
+
+
+def test_organize_dataset_with_validation_set(tmp_path, source_files):
+    labels = [{"label": "cat", "filename": "c.jpg"}] + [
+        {"label": "cat", "original_path": path} for path in source_files[:2]
+    ]
+    organize_dataset(
+        source_files[:1],
+        source_files[1:2],
+        str(tmp_path / "out"),
+        labeled_data=labels,
+        val_files=source_files[2:],
+    )
+    for split, name in [
+        ("train", "a.jpg"),
+        ("test", "b.jpg"),
+        ("val", "c.jpg"),
+    ]:
+        split_dir = tmp_path / "out" / split
+        assert sorted(os.listdir(split_dir)) == [name, "labels.json"]
+        assert len(load_labels(str(split_dir / "labels.json"))) == 1
@@ -9,26 +9,79 @@ from PIL import Image
 from tqdm import tqdm
 import argparse
 
+
+def iter_labels(path, fields, chunk_size=1024 * 1024):
+    """
+    Yield the records of labels.json or labels.jsonl one at a time,
+    keeping only the given fields, so large label files are never loaded
+    whole.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                try:
+                    item = json.loads(line)
+                except json.JSONDecodeError:
+                    # Blank line, or a torn last line of a crashed run
+                    continue
+                yield {key: item[key] for key in fields if key in item}
+            return
+
+        decoder = json.JSONDecoder()
+        buffer = ""
+        started = False
+        while True:
+            buffer = buffer.lstrip()
+            if not started and buffer:
+                if buffer[0] != "[":
+                    raise ValueError(f"{path} is not a JSON array")
+                buffer, started = buffer[1:], True
+                continue
+            if started and buffer.startswith(","):
+                buffer = buffer[1:]
+                continue
+            if started and buffer.startswith("]"):
+                return
+            try:
+                if not buffer:
+                    raise json.JSONDecodeError("Need more data", buffer, 0)
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                more = f.read(chunk_size)
+                if not more:
+                    raise ValueError(f"{path} ends before its JSON array")
+                buffer += more
+                continue
+            buffer = buffer[end:]
+            yield {key: item[key] for key in fields if key in item}
+
 # --- Dataset Definition ---
 class LabelerDataset(Dataset):
     def __init__(self, data_dir, transform=None):
         self.data_dir = data_dir
         self.transform = transform
         self.params_file = os.path.join(data_dir, "labels.json")
+        if not os.path.exists(self.params_file):
+            # Append-only label store written while labeling
+            self.params_file = os.path.join(data_dir, "labels.jsonl")
         
         if not os.path.exists(self.params_file):
-            raise FileNotFoundError(f"labels.json not found in {data_dir}")
-
-        with open(self.params_file, "r") as f:
-            self.data = json.load(f)
-
-        # Filter out invalid images
-        self.valid_data = []
-        for item in self.data:
+            raise FileNotFoundError(
+                f"Neither labels.json nor labels.jsonl found in {data_dir}"
+            )
+
+        # Stream the records and keep only the fields used for training,
+        # so the descriptions are never held in memory. A later JSONL
+        # record for the same image replaces earlier ones.
+        latest = {}
+        for item in iter_labels(
+            self.params_file, fields=("filename", "original_path", "label")
+        ):
             img_name = item.get("filename")
             # In the organized dataset, images are in the root of data_dir
             if img_name and os.path.exists(os.path.join(data_dir, img_name)):
-                self.valid_data.append(item)
+                latest[item.get("original_path") or img_name] = item
+        self.valid_data = list(latest.values())
         
         self.labels = [item["label"] for item in self.valid_data]
 